@@ -0,0 +1,188 @@
+"""
+Per-Sample Fan-Out
+==================
+Map/reduce support for plan steps that apply independently to every sample.
+
+A plan step tagged with `[per-sample]` is dispatched as one parallel branch
+per sample in `file_manifest` (worker code generation + execution for that
+sample only). Branch results are reduced back into `qc_metrics` and a single
+step status before control returns to the Supervisor.
+"""
+
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from langgraph.types import Send
+from backend.config import load_config
+from backend.agents.state import BioState
+from backend.agents.workers.obitools import obitools_worker
+from backend.agents.workers.qiime import qiime_worker
+from backend.agents.nodes import executor_node
+from backend.agents.sample_table import SampleTable, parse_output_lines
+from backend.agents.freshness import record_outputs
+from backend.utils.tracing import span
+
+PER_SAMPLE_TAG = "[per-sample]"
+
+WORKERS = {
+    "obitools": obitools_worker,
+    "qiime": qiime_worker,
+}
+
+# QC lines printed by generated scripts: "QC merge_rate=0.97"
+QC_LINE_PATTERN = re.compile(r'^QC\s+(\w+)\s*=\s*(-?[0-9.]+(?:[eE]-?\d+)?)\s*$', re.MULTILINE)
+
+# Bound on concurrently executing branches (LangGraph runs Send branches on a thread pool),
+# one semaphore per configured limit so config overrides take effect without a re-import
+_branch_slots: Dict[int, threading.BoundedSemaphore] = {}
+_branch_slots_lock = threading.Lock()
+
+
+def max_parallel_samples() -> int:
+    """`workflow.max_parallel_samples`, read on every call"""
+    return max(1, int(load_config().get('workflow', {}).get('max_parallel_samples', 4)))
+
+
+def branch_slots() -> threading.BoundedSemaphore:
+    """Semaphore bounding the branches that execute at once"""
+    limit = max_parallel_samples()
+    with _branch_slots_lock:
+        if limit not in _branch_slots:
+            _branch_slots[limit] = threading.BoundedSemaphore(limit)
+        return _branch_slots[limit]
+
+
+def is_per_sample_step(step: str) -> bool:
+    """True if a plan step is tagged to run once per sample"""
+    return PER_SAMPLE_TAG in (step or "").lower()
+
+
+def strip_tag(step: str) -> str:
+    """Plan step text without the per-sample tag"""
+    return re.sub(re.escape(PER_SAMPLE_TAG), "", step, flags=re.IGNORECASE).strip()
+
+
+def get_sample_ids(file_manifest: Dict[str, Any]) -> List[str]:
+    """Sample IDs tracked in the file manifest"""
+    return SampleTable.from_dict(file_manifest).sample_ids
+
+
+def dispatch_samples(state: BioState) -> List[Send]:
+    """
+    Map: one `sample_branch` invocation per sample.
+    On a retry only the samples that failed are dispatched again.
+    """
+    manifest = state.get('file_manifest', {})
+    failed = state.get('failed_samples') or {}
+    sample_ids = [s for s in get_sample_ids(manifest) if s in failed] if failed else get_sample_ids(manifest)
+
+    print(f"🔀 Fan-out: {len(sample_ids)} samples (max {max_parallel_samples()} in parallel)")
+    return [
+        Send("sample_branch", {
+            "sample_id": sample_id,
+            "agent": state['next_agent'],
+            "current_step": state['current_step'],
+            "workspace_dir": state.get('workspace_dir'),
+            "file_manifest": manifest,
+            "step_context": state.get('step_context'),
+            "errors": [failed[sample_id]] if sample_id in failed else [],
+        })
+        for sample_id in sample_ids
+    ]
+
+
+def sample_branch_node(branch: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Branch: generate and execute code for a single sample.
+    Only `sample_results` is written back so parallel branches never conflict.
+    """
+    sample_id = branch['sample_id']
+    step = branch['current_step']
+    files = SampleTable.from_dict(branch['file_manifest']).row(sample_id)
+    file_list = ", ".join(f"{stage}={path}" for stage, path in files.items())
+
+    sample_state = dict(branch)
+    sample_state['current_step'] = (
+        f"{strip_tag(step)}\n"
+        f"Apply this step to sample '{sample_id}' ONLY ({file_list}). Do NOT loop over other samples.\n"
+        f"Print any QC numbers as lines of the form 'QC <metric_name>=<number>'.\n"
+        f"Print each output file as a line of the form 'OUTPUT <stage>=<absolute path>' "
+        f"(stage e.g. merged, clean)."
+    )
+    # Reuse the context prefetched for the plan step by this branch's worker
+    agent = branch['agent']
+    prefetched = ((branch.get('step_context') or {}).get(agent) or {}).get(step)
+    if prefetched is not None:
+        sample_state['step_context'] = {agent: {sample_state['current_step']: prefetched}}
+
+    with branch_slots():
+        start = time.time()
+        print(f"  🧪 [{sample_id}] Starting...")
+        with span(branch['agent'], kind="node", sample=sample_id):
+            sample_state.update(WORKERS[branch['agent']](sample_state))
+        with span("executor", kind="node", sample=sample_id):
+            updates = executor_node(sample_state)
+        duration = time.time() - start
+
+    result = updates.get('last_execution_result') or {
+        "stdout": "",
+        "stderr": updates.get('error', "No result."),
+        "return_code": -1
+    }
+    return {
+        "sample_results": [{
+            "sample": sample_id,
+            "step": step,
+            "return_code": result['return_code'],
+            "stdout": result['stdout'],
+            "stderr": result['stderr'],
+            "duration": duration,
+            "outputs": parse_output_lines(result['stdout']) if result['return_code'] == 0 else [],
+        }]
+    }
+
+
+def sample_reduce_node(state: BioState) -> Dict[str, Any]:
+    """
+    Reduce: merge branch results into qc_metrics, the sample table and one step status.
+    """
+    step = state['current_step']
+    results = [r for r in state.get('sample_results') or [] if r['step'] == step]
+
+    qc_metrics = {sample: dict(metrics) for sample, metrics in (state.get('qc_metrics') or {}).items()}
+    table = SampleTable.from_state(state)
+    failed: Dict[str, str] = {}
+    for r in results:
+        table.apply_outputs(r.get('outputs', []), default_sample=r['sample'])
+        metrics = qc_metrics.setdefault(r['sample'], {})
+        metrics['return_code'] = float(r['return_code'])
+        metrics['duration_s'] = round(r['duration'], 2)
+        for name, value in QC_LINE_PATTERN.findall(r['stdout']):
+            metrics[name] = float(value)
+        if r['return_code'] != 0:
+            failed[r['sample']] = r['stderr'] or f"Exit code {r['return_code']}"
+
+    outputs = [output['path'] for r in results for output in r.get('outputs', [])]
+    succeeded = len(results) - len(failed)
+    print(f"🔁 Reduce: {succeeded}/{len(results)} samples succeeded")
+
+    summary = f"{succeeded}/{len(results)} samples succeeded for step: {strip_tag(step)}"
+    return {
+        "qc_metrics": qc_metrics,
+        "file_manifest": table.to_dict(),
+        "step_io": record_outputs(state.get('step_io'), step, outputs),
+        "failed_samples": failed,
+        "errors": [f"[{sample}] {stderr}" for sample, stderr in failed.items()],
+        "last_execution_result": {
+            "stdout": summary,
+            "stderr": "\n".join(f"[{sample}] {stderr}" for sample, stderr in failed.items()),
+            "return_code": 0 if not failed else 1
+        }
+    }
@@ -0,0 +1,99 @@
+"""
+Step Freshness
+==============
+Make-like up-to-date check for plan steps.
+
+Each step may declare the files it reads and writes (`step_io`, filled by
+the planner and extended with the OUTPUT lines a successful step prints).
+A step is skipped when all of its declared output files exist on the Muscle
+node and none is older than the newest of its inputs. Directories never
+count as outputs, so steps like "Create workspace" always run and keep
+setting up state.
+"""
+
+import shlex
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.utils.executor_client import get_executor_client
+from backend.utils.metrics import untracked
+
+
+def stat_files(paths: List[str], run_command: Optional[Callable[..., Dict[str, Any]]] = None) -> Dict[str, float]:
+    """mtime of every path that exists as a regular file (one remote call)"""
+    if not paths:
+        return {}
+    run_command = run_command or get_executor_client().run_command
+    lines: List[str] = []
+    quoted = " ".join(shlex.quote(path) for path in paths)
+    with untracked():
+        run_command(
+            f"stat -c '%F\t%Y\t%n' -- {quoted} 2>/dev/null",
+            env_name=None,
+            on_output=lambda stream, line: lines.append(line) if stream == "stdout" else None
+        )
+    mtimes = {}
+    for line in lines:
+        parts = line.split("\t", 2)
+        if len(parts) == 3 and parts[0].startswith("regular"):
+            mtimes[parts[2]] = float(parts[1])
+    return mtimes
+
+
+def is_up_to_date(io: Optional[Dict[str, List[str]]], mtimes: Dict[str, float]) -> Tuple[bool, str]:
+    """(up to date, reason) for one step given the mtimes of existing files"""
+    outputs = [path for path in (io or {}).get("outputs", []) if path]
+    inputs = [path for path in (io or {}).get("inputs", []) if path]
+    if not outputs:
+        return False, "no declared output files"
+    missing = [path for path in outputs if path not in mtimes]
+    if missing:
+        return False, f"missing {missing[0]}"
+    known_inputs = [mtimes[path] for path in inputs if path in mtimes]
+    if known_inputs and min(mtimes[path] for path in outputs) < max(known_inputs):
+        return False, "inputs are newer than outputs"
+    return True, f"{len(outputs)} outputs up to date"
+
+
+def skip_fresh_steps(plan: List[str], start: int, step_io: Dict[str, Dict[str, List[str]]],
+                     run_command: Optional[Callable[..., Dict[str, Any]]] = None) -> Tuple[int, List[str]]:
+    """
+    Index of the first step at or after `start` that needs to run
+    (len(plan) if all are up to date), and the steps skipped on the way.
+    """
+    candidates = [step_io.get(step) for step in plan[start:]]
+    paths = sorted({path for io in candidates if io
+                    for key in ("inputs", "outputs") for path in io.get(key, []) if path})
+    if not any(io and io.get("outputs") for io in candidates):
+        return start, []
+    try:
+        mtimes = stat_files(paths, run_command)
+    except Exception as e:
+        print(f"⚠️ Freshness check failed, running all steps: {e}")
+        return start, []
+
+    skipped = []
+    index = start
+    while index < len(plan):
+        fresh, reason = is_up_to_date(step_io.get(plan[index]), mtimes)
+        if not fresh:
+            break
+        print(f"⏭️ Skipping up-to-date step: {plan[index]} ({reason})")
+        skipped.append(plan[index])
+        index += 1
+    return index, skipped
+
+
+def record_outputs(step_io: Optional[Dict[str, Dict[str, List[str]]]], step: str,
+                   paths: List[str]) -> Dict[str, Dict[str, List[str]]]:
+    """Copy of `step_io` with observed output paths added to a step"""
+    updated = {key: {k: list(v) for k, v in io.items()} for key, io in (step_io or {}).items()}
+    io = updated.setdefault(step, {"inputs": [], "outputs": []})
+    io.setdefault("outputs", [])
+    for path in paths:
+        if path not in io["outputs"]:
+            io["outputs"].append(path)
+    return updated
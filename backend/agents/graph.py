@@ -16,6 +16,11 @@ from backend.agents.supervisor import supervisor_node
 from backend.agents.workers.obitools import obitools_worker
 from backend.agents.workers.qiime import qiime_worker
 from backend.agents.nodes import executor_node # Reuse existing executor node
+from backend.utils.tracing import traced_node
+from backend.agents.fanout import (
+    is_per_sample_step, get_sample_ids, dispatch_samples,
+    sample_branch_node, sample_reduce_node
+)
 
 def router(state: BioState):
     """Route to the next agent based on Supervisor's decision"""
@@ -23,6 +28,11 @@ def router(state: BioState):
         return END
     if state.get('error'):
         return END
+    # Per-sample steps fan out into one parallel branch per sample
+    if (state['next_agent'] in ("obitools", "qiime")
+            and is_per_sample_step(state.get('current_step', ''))
+            and get_sample_ids(state.get('file_manifest', {}))):
+        return dispatch_samples(state)
     return state['next_agent']
 
 def worker_router(state: BioState):
@@ -35,15 +45,20 @@ def executor_router(state: BioState):
         return END
     return "supervisor"
 
-def create_graph():
-    """Create the Multi-Agent workflow graph"""
+def create_graph(checkpointer=None):
+    """
+    Create the Multi-Agent workflow graph.
+    Pass a checkpointer (see runs.py) to persist and resume runs.
+    """
     workflow = StateGraph(BioState)
     
-    # Add Nodes
-    workflow.add_node("supervisor", supervisor_node)
-    workflow.add_node("obitools", obitools_worker)
-    workflow.add_node("qiime", qiime_worker)
-    workflow.add_node("executor", executor_node)
+    # Add Nodes (each wrapped in a trace span, see tracing.py)
+    workflow.add_node("supervisor", traced_node("supervisor", supervisor_node))
+    workflow.add_node("obitools", traced_node("obitools", obitools_worker))
+    workflow.add_node("qiime", traced_node("qiime", qiime_worker))
+    workflow.add_node("executor", traced_node("executor", executor_node))
+    workflow.add_node("sample_branch", traced_node("sample_branch", sample_branch_node))
+    workflow.add_node("sample_reduce", traced_node("sample_reduce", sample_reduce_node))
     
     # Define Edges
     workflow.set_entry_point("supervisor")
@@ -55,6 +70,7 @@ def create_graph():
         {
             "obitools": "obitools",
             "qiime": "qiime",
+            "sample_branch": "sample_branch",
             END: END
         }
     )
@@ -66,7 +82,11 @@ def create_graph():
     # Executor -> Supervisor (Loop back for next step)
     workflow.add_edge("executor", "supervisor")
     
-    return workflow.compile()
+    # Per-sample branches -> Reduce -> Supervisor
+    workflow.add_edge("sample_branch", "sample_reduce")
+    workflow.add_edge("sample_reduce", "supervisor")
+    
+    return workflow.compile(checkpointer=checkpointer)
 
 if __name__ == "__main__":
     # Test the graph
@@ -0,0 +1,146 @@
+"""
+Request Intent Parser
+=====================
+Deterministic fast path for reading a user request before planning:
+absolute POSIX paths, tool hints (OBITools / QIIME2 / DADA2 / diversity)
+and sample patterns are extracted with rules. The Supervisor only falls
+back to the LLM path extractor when the rules find the request ambiguous.
+"""
+
+import posixpath
+import re
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Quoted absolute paths may contain spaces
+QUOTED_PATH_PATTERN = re.compile(r"""["'`“‘](/[^"'`”’\n]+)["'`”’]""")
+# Unquoted absolute paths: start at a "/" that is not part of a URL or relative path
+BARE_PATH_PATTERN = re.compile(r"(?<![\w:/.~-])(/[^\s\"'`，。；、（）()<>|]+)")
+# Punctuation that ends a sentence rather than a path
+TRAILING_PUNCTUATION = ".,;:!?)]}，。；：！？）】"
+
+# File extensions that mark a path as a file (its parent directory is the target)
+FILE_SUFFIXES = (
+    ".fastq", ".fq", ".gz", ".fasta", ".fa", ".qza", ".qzv",
+    ".txt", ".tsv", ".csv", ".biom", ".obidms", ".md",
+)
+
+TOOL_KEYWORDS = {
+    "obitools": [r"obitools\d?", r"\bobi3?\b", r"alignpairedend", r"illuminapairedend", r"ngsfilter"],
+    "qiime2": [r"qiime\s?2?", r"\bq2\b", r"\.qz[av]\b"],
+    "dada2": [r"dada2", r"denois", r"去噪"],
+    "diversity": [r"diversity", r"\balpha\b", r"\bbeta\b", r"多样性"],
+}
+
+# JC1..JC40, JC1-JC40, JC1~40, JC1到JC40
+SAMPLE_RANGE_PATTERN = re.compile(
+    r"\b([A-Za-z][A-Za-z_]*?)(\d+)\s*(?:\.\.|-|~|到|至)\s*(?:\1)?(\d+)\b"
+)
+# Glob patterns like *_R1.fastq.gz or JC*
+SAMPLE_GLOB_PATTERN = re.compile(r"(?<![/\w])([\w.-]*[*?][\w.*?-]*)")
+
+
+@dataclass
+class RequestIntent:
+    """Structured view of a user request consumed by the Supervisor"""
+    paths: List[str] = field(default_factory=list)
+    target_dir: Optional[str] = None
+    tools: List[str] = field(default_factory=list)
+    sample_patterns: List[str] = field(default_factory=list)
+    ambiguous: bool = False
+    source: str = "rules"  # 'rules' or 'llm'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def extract_paths(text: str) -> List[str]:
+    """Absolute POSIX paths in order of appearance, without duplicates"""
+    found = []
+    for match in QUOTED_PATH_PATTERN.finditer(text):
+        found.append((match.start(1), match.group(1).strip()))
+    quoted_spans = [(m.start(), m.end()) for m in QUOTED_PATH_PATTERN.finditer(text)]
+    for match in BARE_PATH_PATTERN.finditer(text):
+        if any(start <= match.start() < end for start, end in quoted_spans):
+            continue
+        found.append((match.start(1), match.group(1).rstrip(TRAILING_PUNCTUATION)))
+
+    paths = []
+    for _, path in sorted(found):
+        path = path.rstrip("/") or "/"
+        if len(path) > 1 and path not in paths:
+            paths.append(path)
+    return paths
+
+
+def _as_directory(path: str) -> str:
+    """A file path's parent directory; directories are returned unchanged"""
+    if path.lower().endswith(FILE_SUFFIXES):
+        return posixpath.dirname(path) or "/"
+    return path
+
+
+def choose_target_dir(paths: List[str]) -> Tuple[Optional[str], bool]:
+    """
+    Pick the root directory among the paths.
+    Returns (target_dir, ambiguous); ambiguous when the paths do not share
+    one of them as a common root.
+    """
+    if not paths:
+        return None, False
+    dirs = list(dict.fromkeys(_as_directory(path) for path in paths))
+    if len(dirs) == 1:
+        return dirs[0], False
+    for candidate in sorted(dirs, key=len):
+        if all(d == candidate or d.startswith(candidate.rstrip("/") + "/") for d in dirs):
+            return candidate, False
+    return None, True
+
+
+def detect_tools(text: str) -> List[str]:
+    lowered = text.lower()
+    return [tool for tool, patterns in TOOL_KEYWORDS.items()
+            if any(re.search(pattern, lowered) for pattern in patterns)]
+
+
+def detect_sample_patterns(text: str, paths: List[str]) -> List[str]:
+    patterns = []
+    for prefix, start, end in SAMPLE_RANGE_PATTERN.findall(text):
+        if int(end) > int(start):
+            patterns.append(f"{prefix}{start}..{prefix}{end}")
+    # Globs outside of the extracted paths
+    remainder = text
+    for path in paths:
+        remainder = remainder.replace(path, " ")
+    for glob in SAMPLE_GLOB_PATTERN.findall(remainder):
+        if glob.strip("*?") and glob not in patterns:
+            patterns.append(glob)
+    return patterns
+
+
+def parse_request(text: str) -> RequestIntent:
+    """Rule-based parse of a user request"""
+    paths = extract_paths(text)
+    target_dir, ambiguous = choose_target_dir(paths)
+    # A slash we could not turn into an absolute path: let the LLM look at it
+    if not paths and re.search(r"(?<![\w:])/\w", text):
+        ambiguous = True
+    return RequestIntent(
+        paths=paths,
+        target_dir=target_dir,
+        tools=detect_tools(text),
+        sample_patterns=detect_sample_patterns(text, paths),
+        ambiguous=ambiguous,
+    )
+
+
+if __name__ == "__main__":
+    # Test the parser
+    examples = [
+        "请帮我处理 /media/dell/eDNA3/Lab/2024-08/raw 中的数据，使用 OBITools3 合并 JC1..JC40",
+        "Run DADA2 denoising on '/media/dell/eDNA3/Lab/run 5/' then alpha diversity.",
+        "Compare /data/a/x_R1.fastq.gz and /data/b/y_R1.fastq.gz",
+        "Check obitools version",
+    ]
+    for example in examples:
+        print(f"{example}\n  -> {parse_request(example)}")
@@ -5,17 +5,80 @@ Contains shared nodes like the Executor.
 """
 
 import sys
+import time
 from pathlib import Path
 from typing import Dict, Any
 
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from backend.utils.executor_client import ExecutorClient
+from backend.config import conda_env
+from backend.utils.executor_client import get_executor_client
+from backend.utils.exec_cache import get_execution_cache
+from backend.utils.llm_cache import invalidate_llm_cache
+from backend.utils.remote_jobs import get_job_runner, job_key
+from backend.utils.scheduler import get_scheduler
+from backend.utils.tracing import span
 from backend.agents.state import BioState
+from backend.agents.progress import OutputBatcher
+from backend.agents.sample_table import SampleTable, parse_output_lines
+from backend.agents.freshness import record_outputs
 
-# Initialize clients
-executor_client = ExecutorClient()
+def _run_code(code: str, cwd: str, env_name: str, batcher: OutputBatcher, attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Cached result, or a scheduled (detached) run of the code; fills trace span attrs"""
+    # Reuse the recorded result when the script and everything it reads are unchanged
+    exec_cache = get_execution_cache()
+    cached, cache_token, allocation = None, None, None
+    if exec_cache is not None:
+        try:
+            cached, cache_token = exec_cache.lookup(code, env_name, cwd)
+        except Exception as e:
+            print(f"  ⚠️ Execution cache lookup failed: {e}")
+    
+    if cached is not None:
+        print("  ♻️ Inputs unchanged, reusing cached result")
+        batcher.add("stdout", "♻️ Inputs unchanged since the last successful run; reusing its result.")
+        result = cached
+    else:
+        # Wait for free cores/memory on the node and pin the script's thread count
+        scheduler = get_scheduler()
+        allocation = scheduler.acquire(code) if scheduler is not None else None
+        script = allocation.apply(code) if allocation is not None else code
+        # Run time for the cache's min_runtime_s counts from admission, not from the queue
+        started = time.time()
+        try:
+            # Long tools run as detached jobs that survive SSH drops (a rerun reattaches);
+            # short scripts stay a single exec
+            job_runner = get_job_runner()
+            if job_runner is not None and job_runner.should_detach(code):
+                result = job_runner.run(script, cwd=cwd, env_name=env_name, on_output=batcher.add,
+                                        key=job_key(code, cwd, env_name))
+                print(f"  🛰️ Job: {result.get('job_id', 'not launched')}")
+            else:
+                result = get_executor_client().run_command(script=script, cwd=cwd, env_name=env_name,
+                                                           on_output=batcher.add)
+        finally:
+            if allocation is not None:
+                allocation.release()
+        runtime_s = time.time() - started
+        if cache_token is not None:
+            try:
+                exec_cache.store(cache_token, result,
+                                 output_paths=[output['path'] for output in parse_output_lines(result['stdout'])],
+                                 runtime_s=runtime_s)
+            except Exception as e:
+                print(f"  ⚠️ Execution cache store failed: {e}")
+    attrs.update(cached=cached is not None, return_code=result['return_code'], job_id=result.get('job_id'),
+                 queue_wait_s=round(allocation.waited_s, 2) if allocation is not None else None)
+    return result
+
+def pick_env(code: str) -> str:
+    """Conda env for a script (simple content heuristic), named as in `executor.envs`"""
+    if "obi" in code or "OBITools" in code:
+        return conda_env("obitools")
+    if "qiime" in code:
+        return conda_env("qiime2")
+    return "base"
 
 def executor_node(state: BioState) -> Dict[str, Any]:
     """
@@ -40,13 +103,9 @@ def executor_node(state: BioState) -> Dict[str, Any]:
 
     print("🚀 Executor: Running code...")
     
-    # Determine environment based on code content (simple heuristic)
-    env_name = "base"
-    if "obi" in code or "OBITools" in code:
-        env_name = "obi3"
-    elif "qiime" in code:
-        env_name = "qiime2-amplicon-2024.2"
-        
+    # Envs come from config.yaml, so the warm shell sessions (see shell_sessions.py) serve them
+    env_name = pick_env(code)
+    
     # Execute
     # Heuristic: If code contains "mkdir", we try to extract the path to update state
     new_workspace = None
@@ -63,7 +122,13 @@ def executor_node(state: BioState) -> Dict[str, Any]:
     if new_workspace:
         cwd = None # Run in default/parent for creation
         
-    result = executor_client.run_command(script=code, cwd=cwd, env_name=env_name)
+    # Stream remote output to the UI while the command runs
+    sample_id = state.get('sample_id')  # Set inside per-sample fan-out branches
+    batcher = OutputBatcher(node=f"executor:{sample_id}" if sample_id else "executor")
+    
+    with span("remote_exec", kind="exec", env=env_name) as attrs:
+        result = _run_code(code, cwd, env_name, batcher, attrs)
+    batcher.flush()
     
     print(f"  ⚙️ Return Code: {result['return_code']}")
     
@@ -71,11 +136,22 @@ def executor_node(state: BioState) -> Dict[str, Any]:
     if result['return_code'] != 0:
         print(f"  ❌ Error: {result['stderr'][:200]}...")
         updates["errors"] = state.get("errors", []) + [result['stderr']]
+        # Don't replay the cached completion that wrote this code on the next run
+        invalidate_llm_cache(state.get('llm_cache_keys'))
     else:
-        print(f"  ✅ Success")
+        print("  ✅ Success")
         updates["errors"] = [] # Explicitly clear errors on success
         if new_workspace:
             updates["workspace_dir"] = new_workspace
+        # Record output files in the sample table (per-sample branches are merged in sample_reduce)
+        outputs = parse_output_lines(result['stdout'])
+        if outputs and not sample_id:
+            table = SampleTable.from_state(state)
+            table.apply_outputs(outputs)
+            updates["file_manifest"] = table.to_dict()
+            updates["step_io"] = record_outputs(state.get('step_io'), state['current_step'],
+                                                [output['path'] for output in outputs])
+            print(f"  🗂️ Recorded {len(outputs)} output files")
             
     # Clear generated code after execution
     updates["generated_code"] = None
@@ -0,0 +1,105 @@
+"""
+Progress Channel
+================
+Lets graph nodes push live progress (remote output lines, LLM tokens, ...)
+to whoever is streaming the graph with `stream_mode=["updates", "custom"]`.
+Outside of a graph run, events are silently dropped.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+def _get_writer() -> Optional[Callable[[Dict[str, Any]], None]]:
+    try:
+        from langgraph.config import get_stream_writer
+        return get_stream_writer()
+    except Exception:
+        # Not running inside a graph (e.g. a node called directly in a test)
+        return None
+
+
+def emit_progress(event: Dict[str, Any]):
+    """Send a custom event to the graph's stream consumer, if any"""
+    writer = _get_writer()
+    if writer is not None:
+        writer(event)
+
+
+class OutputBatcher:
+    """
+    Groups remote output lines into batched 'executor_output' events so a
+    chatty command does not flood the stream with one event per line.
+    """
+
+    def __init__(self, node: str, flush_interval: float = 0.3, max_lines: int = 200):
+        self.node = node
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self._lines: List[Dict[str, str]] = []
+        self._last_flush = time.monotonic()
+
+    def add(self, stream: str, line: str):
+        """Callback compatible with ExecutorClient.run_command(on_output=...)"""
+        self._lines.append({"stream": stream, "line": line})
+        if (len(self._lines) >= self.max_lines
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            emit_progress({"type": "executor_output", "node": self.node, "lines": self._lines})
+            self._lines = []
+        self._last_flush = time.monotonic()
+
+
+class TokenStreamer(BaseCallbackHandler):
+    """
+    LangChain callback that forwards LLM tokens as batched 'llm_token'
+    events while the completion is generated, then an 'llm_done' event.
+    Pass it in `config={"callbacks": [...]}`; the response cache is still
+    consulted first, and a cached answer is sent as a single chunk.
+    """
+
+    run_inline = True
+
+    def __init__(self, node: str, flush_interval: float = 0.1, max_chars: int = 400):
+        self.node = node
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        # Captured now: callbacks may fire outside the node's context
+        self._writer = _get_writer()
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._streamed = False
+        self._last_flush = time.monotonic()
+
+    def _emit(self, event: Dict[str, Any]):
+        if self._writer is not None:
+            self._writer(event)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if not token:
+            return
+        self._buffer.append(token)
+        self._buffered_chars += len(token)
+        self._streamed = True
+        if (self._buffered_chars >= self.max_chars
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._emit({"type": "llm_token", "node": self.node, "text": "".join(self._buffer)})
+            self._buffer = []
+            self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+    def finish(self, content: str = ""):
+        """Flush pending tokens and mark the completion as done"""
+        self.flush()
+        if not self._streamed and content:
+            self._emit({"type": "llm_token", "node": self.node, "text": content})
+        self._emit({"type": "llm_done", "node": self.node})
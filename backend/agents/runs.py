@@ -0,0 +1,211 @@
+"""
+Run Persistence
+===============
+Checkpointed graph runs keyed by a run ID.
+
+Every graph step is saved to a LangGraph SQLite checkpointer with the run ID
+as `thread_id`, and a small `runs` table records the request and status of
+each run. A run interrupted by a dead session, or one that gave up after
+its retries, can be resumed from its last checkpoint instead of replanning
+and re-executing the steps it already completed.
+
+Usage:
+    python -m backend.agents.runs --list
+    python -m backend.agents.runs --resume run-20240801-101500-1a2b3c
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+
+# Defaults used when config.yaml has no `workflow.checkpoint` section
+DEFAULT_CHECKPOINT_SETTINGS = {
+    "enabled": True,
+    "path": "./backend/cache/checkpoints.sqlite3",
+}
+
+RECURSION_LIMIT = 50
+
+
+def new_run_id() -> str:
+    return f"run-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    """Graph config that binds a stream/invoke call to a run's checkpoints"""
+    return {"configurable": {"thread_id": run_id}, "recursion_limit": RECURSION_LIMIT}
+
+
+class RunStore:
+    """SQLite checkpointer plus a registry of runs, sharing one database file"""
+
+    def __init__(self, path: str):
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.checkpointer = SqliteSaver(self._conn)
+        self.checkpointer.setup()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY, request TEXT, status TEXT, created_at REAL, updated_at REAL)"
+            )
+            self._conn.commit()
+
+    def register(self, run_id: str, request: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, request, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (run_id, request, "running", now, now)
+            )
+            self._conn.commit()
+
+    def set_status(self, run_id: str, status: str):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET status=?, updated_at=? WHERE run_id=?",
+                               (status, time.time(), run_id))
+            self._conn.commit()
+
+    def list_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent runs first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, request, status, created_at, updated_at FROM runs ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        keys = ("run_id", "request", "status", "created_at", "updated_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+# 全局单例
+_run_store = None
+_run_store_lock = threading.Lock()
+
+
+def get_run_store() -> Optional[RunStore]:
+    """Shared run store, or None when `workflow.checkpoint.enabled` is false"""
+    global _run_store
+    config = load_config()
+    settings = {**DEFAULT_CHECKPOINT_SETTINGS, **config.get('workflow', {}).get('checkpoint', {})}
+    if not settings['enabled']:
+        return None
+    if _run_store is None:
+        with _run_store_lock:
+            if _run_store is None:
+                _run_store = RunStore(settings['path'])
+    return _run_store
+
+
+def run_status(values: Dict[str, Any]) -> str:
+    """Status label for a finished stream, from the final state"""
+    if values.get('error'):
+        return "failed"
+    answer = values.get('final_answer') or ""
+    if answer.startswith("Task Failed"):
+        return "failed"
+    return "completed" if answer else "interrupted"
+
+
+def prepare_resume(app, run_id: str):
+    """
+    Make a run ready to continue from its last checkpoint.
+
+    An interrupted run continues where it stopped. A run that gave up on a
+    step gets its failure cleared and is routed back to that step, keeping
+    failed_samples so only the failed samples of a per-sample step rerun.
+    Afterwards stream the run with `None` as input.
+
+    Raises:
+        ValueError: The run has no checkpoints, never planned, or completed
+    """
+    from backend.agents.supervisor import choose_agent
+
+    config = run_config(run_id)
+    snapshot = app.get_state(config)
+    values = snapshot.values or {}
+    if not values:
+        raise ValueError(f"No checkpoints found for run {run_id}")
+    if snapshot.next:
+        print(f"▶️ Resuming {run_id} at: {', '.join(snapshot.next)}")
+        return
+    if not values.get('plan') or not values.get('current_step'):
+        raise ValueError(f"Run {run_id} stopped before planning; start a new run instead")
+    if run_status(values) == "completed":
+        raise ValueError(f"Run {run_id} already completed")
+
+    step = values['current_step']
+    print(f"🔁 Retrying {run_id} from step: {step}")
+    app.update_state(config, {
+        "final_answer": None,
+        "error": None,
+        "errors": [],
+        "retry_count": 0,
+        # Old branch results would be merged with the rerun's (sample_reduce_node)
+        "sample_results": None,
+        "next_agent": choose_agent(step),
+    }, as_node="supervisor")
+
+
+def stream_run(app, run_id: str, graph_input: Optional[Dict[str, Any]],
+               stream_mode: Any = ("updates", "custom")) -> Iterator[Any]:
+    """
+    app.stream bound to a run's checkpoints; records the final run status
+    and releases the run's in-memory trace. Pass the initial state to start
+    a run, or None to continue one.
+    """
+    store = get_run_store()
+    if store is not None and graph_input is not None:
+        messages = graph_input.get('messages') or []
+        store.register(run_id, messages[-1].content if messages else "")
+    elif store is not None:
+        store.set_status(run_id, "running")
+
+    try:
+        yield from app.stream(graph_input, run_config(run_id), stream_mode=list(stream_mode))
+    except Exception:
+        if store is not None:
+            store.set_status(run_id, "interrupted")
+        raise
+    finally:
+        # The spans are in the trace file; free the in-memory copy
+        from backend.utils.tracing import end_trace
+        end_trace(run_id)
+    if store is not None:
+        store.set_status(run_id, run_status(app.get_state(run_config(run_id)).values or {}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or resume checkpointed runs")
+    parser.add_argument("--list", action="store_true", help="Show recent runs")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue a run from its last checkpoint")
+    args = parser.parse_args()
+
+    store = get_run_store()
+    if store is None:
+        print("❌ Checkpointing is disabled (workflow.checkpoint.enabled)")
+        sys.exit(1)
+
+    if args.resume:
+        from backend.agents.graph import create_graph
+        app = create_graph(checkpointer=store.checkpointer)
+        prepare_resume(app, args.resume)
+        for mode, output in stream_run(app, args.resume, None):
+            if mode == "updates":
+                print(f"Finished Node: {', '.join(output)}")
+    else:
+        for run in store.list_runs():
+            started = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created_at']))
+            print(f"{run['run_id']}  {run['status']:<11}  {started}  {run['request'][:60]}")
@@ -0,0 +1,227 @@
+"""
+Sample Table
+============
+Column-oriented record of every sample's files through the workflow.
+
+One list per stage (raw_r1, raw_r2, merged, clean, ...) holds the path of
+each sample's file at that stage, aligned with a list of sample IDs and an
+index for O(1) lookups. Paths under the data root are stored relative to
+it, so the serialized form stored in `BioState.file_manifest` stays small
+even with hundreds of samples. `render()` produces a token-bounded view
+for prompts.
+"""
+
+import posixpath
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from backend.utils.prompt_packer import estimate_tokens
+
+# Column order used when rendering (unknown stages follow in insertion order)
+STANDARD_STAGES = ("raw_r1", "raw_r2", "merged", "clean")
+
+# Output paths printed by generated scripts:
+#   "OUTPUT merged=/ws/JC1.fasta" (inside a per-sample branch)
+#   "OUTPUT JC1 merged=/ws/JC1.fasta" (sequential steps)
+OUTPUT_LINE_PATTERN = re.compile(
+    r'^OUTPUT\s+(?:(?P<sample>[^\s=]+)\s+)?(?P<stage>\w+)\s*=\s*(?P<path>\S+)\s*$', re.MULTILINE
+)
+
+# Prompt rule asking generated scripts to report their outputs
+OUTPUT_INSTRUCTION = (
+    "For every file the script produces, print a line 'OUTPUT <sample> <stage>=<absolute path>' "
+    "(stage e.g. merged, clean; omit <sample> for files that cover all samples)."
+)
+
+
+def parse_output_lines(stdout: str) -> List[Dict[str, Optional[str]]]:
+    """OUTPUT lines from a script's stdout as [{"sample", "stage", "path"}]"""
+    return [match.groupdict() for match in OUTPUT_LINE_PATTERN.finditer(stdout or "")]
+
+
+class SampleTable:
+    """Per-sample stage paths with indexed lookups and compact serialization"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root.rstrip("/") if root else None
+        self.sample_ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.columns: Dict[str, List[Optional[str]]] = {}
+        # Outputs of steps that are not tied to one sample ({"feature_table": path})
+        self.artifacts: Dict[str, str] = {}
+        # Non-read files found under the root (map files, metadata)
+        self.extra_files: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.sample_ids)
+
+    def __contains__(self, sample_id: str) -> bool:
+        return sample_id in self._index
+
+    # --- Path compaction -------------------------------------------------
+
+    def _compact(self, path: str) -> str:
+        if self.root and path.startswith(self.root + "/"):
+            return path[len(self.root) + 1:]
+        return path
+
+    def _expand(self, path: Optional[str]) -> Optional[str]:
+        if path is None or path.startswith("/") or not self.root:
+            return path
+        return posixpath.join(self.root, path)
+
+    # --- Mutation ----------------------------------------------------------
+
+    def add_sample(self, sample_id: str) -> int:
+        """Row index of a sample, appending an empty row if it is new"""
+        row = self._index.get(sample_id)
+        if row is None:
+            row = len(self.sample_ids)
+            self.sample_ids.append(sample_id)
+            self._index[sample_id] = row
+            for column in self.columns.values():
+                column.append(None)
+        return row
+
+    def set(self, sample_id: str, stage: str, path: str):
+        """Record the file of `sample_id` at `stage`"""
+        row = self.add_sample(sample_id)
+        column = self.columns.get(stage)
+        if column is None:
+            column = self.columns[stage] = [None] * len(self.sample_ids)
+        column[row] = self._compact(path)
+
+    def apply_outputs(self, outputs: Iterable[Dict[str, Optional[str]]],
+                      default_sample: Optional[str] = None) -> int:
+        """
+        Record OUTPUT lines parsed from a script. Lines without a sample go
+        to `default_sample`, or to the table-level artifacts.
+        Returns the number of paths recorded.
+        """
+        count = 0
+        for output in outputs:
+            sample_id = output.get('sample') or default_sample
+            if sample_id:
+                self.set(sample_id, output['stage'], output['path'])
+            else:
+                self.artifacts[output['stage']] = self._compact(output['path'])
+            count += 1
+        return count
+
+    # --- Lookups -------------------------------------------------------------
+
+    def get(self, sample_id: str, stage: str) -> Optional[str]:
+        """Absolute path of a sample's file at a stage (None if unknown)"""
+        row = self._index.get(sample_id)
+        column = self.columns.get(stage)
+        if row is None or column is None:
+            return None
+        return self._expand(column[row])
+
+    def row(self, sample_id: str) -> Dict[str, str]:
+        """All known stage paths of one sample"""
+        row = self._index.get(sample_id)
+        if row is None:
+            return {}
+        return {stage: self._expand(column[row]) for stage, column in self.columns.items()
+                if column[row] is not None}
+
+    def column(self, stage: str) -> Dict[str, str]:
+        """{sample: path} for every sample that has a file at `stage`"""
+        column = self.columns.get(stage, [])
+        return {sample_id: self._expand(path) for sample_id, path in zip(self.sample_ids, column)
+                if path is not None}
+
+    def missing(self, stage: str) -> List[str]:
+        """Samples without a file at `stage`"""
+        column = self.columns.get(stage)
+        if column is None:
+            return list(self.sample_ids)
+        return [sample_id for sample_id, path in zip(self.sample_ids, column) if path is None]
+
+    def stages(self) -> List[str]:
+        ordered = [stage for stage in STANDARD_STAGES if stage in self.columns]
+        return ordered + [stage for stage in self.columns if stage not in STANDARD_STAGES]
+
+    # --- Serialization -------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain-JSON form stored in BioState.file_manifest"""
+        return {
+            "root": self.root,
+            "samples": list(self.sample_ids),
+            "columns": {stage: list(column) for stage, column in self.columns.items()},
+            "artifacts": dict(self.artifacts),
+            "extra_files": list(self.extra_files),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "SampleTable":
+        table = cls(root=(data or {}).get("root"))
+        if not data:
+            return table
+        table.sample_ids = list(data.get("samples", []))
+        table._index = {sample_id: row for row, sample_id in enumerate(table.sample_ids)}
+        table.columns = {stage: list(column) for stage, column in data.get("columns", {}).items()}
+        table.artifacts = dict(data.get("artifacts", {}))
+        table.extra_files = list(data.get("extra_files", []))
+        return table
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "SampleTable":
+        return cls.from_dict(state.get('file_manifest'))
+
+    # --- Prompt rendering ------------------------------------------------------
+
+    def render(self, max_tokens: int = 600,
+               count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+        """
+        Text view for prompts that stays within `max_tokens`.
+        Header and artifacts come first, then sample rows, then other files,
+        each cut off with a count of what was left out.
+        """
+        if not self.sample_ids and not self.artifacts and not self.extra_files:
+            return "No file info."
+
+        stages = self.stages()
+        coverage = ", ".join(f"{stage} {len(self.sample_ids) - len(self.missing(stage))}/{len(self.sample_ids)}"
+                             for stage in stages)
+        lines = [f"Root: {self.root or '-'} ({len(self.sample_ids)} samples; {coverage or 'no files'})"]
+        if self.artifacts:
+            lines.append("Artifacts: " + ", ".join(f"{k}={v}" for k, v in self.artifacts.items()))
+        if self.sample_ids:
+            lines.append("sample | " + " | ".join(stages))
+        used = count_tokens("\n".join(lines))
+
+        def add_lines(items: List[str], label: str):
+            nonlocal used
+            for position, line in enumerate(items):
+                cost = count_tokens(line) + 1
+                if used + cost > max_tokens:
+                    lines.append(f"...({len(items) - position} more {label})")
+                    used += count_tokens(lines[-1]) + 1
+                    return
+                lines.append(line)
+                used += cost
+
+        rows = []
+        for row, sample_id in enumerate(self.sample_ids):
+            cells = [self.columns[stage][row] or "-" for stage in stages]
+            rows.append(f"{sample_id} | " + " | ".join(cells))
+        add_lines(rows, "samples")
+        if self.extra_files:
+            lines.append("Other files:")
+            add_lines([f"  {path}" for path in self.extra_files], "files")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Test the table
+    table = SampleTable(root="/media/dell/eDNA3/Lab/run1")
+    for i in range(1, 301):
+        table.set(f"JC{i}", "raw_r1", f"/media/dell/eDNA3/Lab/run1/raw/JC{i}_R1.fastq.gz")
+        table.set(f"JC{i}", "raw_r2", f"/media/dell/eDNA3/Lab/run1/raw/JC{i}_R2.fastq.gz")
+    table.apply_outputs(parse_output_lines("OUTPUT merged=/media/dell/eDNA3/Lab/run1/ws/JC1.fasta"),
+                        default_sample="JC1")
+    print(table.get("JC1", "merged"), table.missing("merged")[:3])
+    print(table.render(max_tokens=200))
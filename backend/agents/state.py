@@ -12,6 +12,12 @@ def add_messages(left: list, right: list):
     """Append messages to the history"""
     return left + right
 
+def merge_sample_results(left: list, right: Optional[list]):
+    """Collect results from parallel per-sample branches; None resets the list"""
+    if right is None:
+        return []
+    return (left or []) + right
+
 class BioState(TypedDict):
     """
     Global state for the Bio-Agent system.
@@ -25,9 +31,10 @@ class BioState(TypedDict):
     # Current execution step description
     current_step: str
     
-    # File Manifest: Tracks files across the workflow
-    # Structure: {"SampleID": {"raw_r1": "path", "merged": "path", "clean": "path"}}
-    file_manifest: Dict[str, Dict[str, str]]
+    # File Manifest: Tracks files across the workflow (serialized SampleTable, see sample_table.py)
+    # Structure: {"root": "/data", "samples": ["JC1", ...], "columns": {"raw_r1": [...], "merged": [...]},
+    #             "artifacts": {"feature_table": "path"}, "extra_files": ["map.tsv"]}
+    file_manifest: Dict[str, Any]
     
     # Quality Control Metrics
     # Structure: {"SampleID": {"merge_rate": 0.99, "denoised_count": 1200}}
@@ -42,11 +49,25 @@ class BioState(TypedDict):
     # Context retrieved from RAG
     rag_context: Optional[str]
     
+    # RAG chunks prefetched for every plan step right after planning, per worker
+    # (each worker retrieves from its own tool's protocols)
+    # Structure: {"obitools": {"plan step text": ["chunk", ...]}, "qiime": {...}}
+    step_context: Optional[Dict[str, Dict[str, List[str]]]]
+    
+    # Parsed user request (paths, tool hints, sample patterns), see agents/intent.py
+    request_intent: Optional[Dict[str, Any]]
+    
+    # Declared and observed files of each plan step (make-like skipping, see freshness.py)
+    # Structure: {"plan step text": {"inputs": ["path"], "outputs": ["path"]}}
+    step_io: Optional[Dict[str, Dict[str, List[str]]]]
+    
     # Active workspace directory on Ubuntu
     workspace_dir: Optional[str]
     
     # Code generated by workers (temporary)
     generated_code: Optional[str]
+    # LLM cache keys of the completion that produced generated_code (dropped if it fails)
+    llm_cache_keys: Optional[List[str]]
     
     # Last execution result (for UI display)
     last_execution_result: Optional[Dict[str, Any]]
@@ -54,5 +75,16 @@ class BioState(TypedDict):
     # Retry counter for error loop
     retry_count: Optional[int]
     
+    # Fatal node error (no code generated, unusable plan); ends the run
+    error: Optional[str]
+    
+    # Per-sample fan-out: results appended by parallel branches of the current step
+    # Structure: [{"sample": "JC1", "step": "...", "return_code": 0, "stdout": "...", "stderr": "..."}]
+    sample_results: Annotated[List[Dict[str, Any]], merge_sample_results]
+    
+    # Samples that failed the current per-sample step (retried on their own)
+    # Structure: {"SampleID": "last stderr"}
+    failed_samples: Optional[Dict[str, str]]
+    
     # Final answer to present to the user
     final_answer: Optional[str]
@@ -7,21 +7,57 @@ Parses intent, scans directory, plans tasks, and routes to workers.
 
 import sys
 import json
-import re
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from backend.utils.llm_client import get_llm
 from backend.agents.state import BioState
-from backend.utils.executor_client import ExecutorClient
+from backend.utils.inventory import get_inventory
+from backend.agents.fanout import PER_SAMPLE_TAG
+from backend.agents.intent import parse_request
+from backend.agents.sample_table import SampleTable
+from backend.agents.freshness import skip_fresh_steps
+from backend.utils.prompt_packer import PromptPacker, Section, budget_for
+from backend.agents.workers import obitools as obitools_module, qiime as qiime_module
+from backend.rag.retriever import get_retriever
+from backend.utils.tracing import llm_callbacks
 
-llm = get_llm()
-executor_client = ExecutorClient()
+# Retrieval scope per worker, used to prefetch context for the whole plan
+WORKER_RAG = {
+    "obitools": (obitools_module.RAG_TOOL, obitools_module.RAG_K),
+    "qiime": (qiime_module.RAG_TOOL, qiime_module.RAG_K),
+}
+
+def choose_agent(step: str) -> str:
+    """Decide which worker handles a plan step"""
+    lowered = step.lower()
+    if "qiime" in lowered or "dada2" in lowered or "diversity" in lowered:
+        return "qiime"
+    return "obitools"
+
+def prefetch_step_context(plan: list, assigned: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, list]]:
+    """
+    Retrieve RAG context for every plan step at once (one batched
+    embedding + search per worker), so workers skip retrieval later.
+    Steps go to choose_agent's worker, or the one in `assigned` (e.g. the
+    planner's pick for the first step). Returns {agent: {step: chunks}}.
+    """
+    assigned = assigned or {}
+    by_agent: Dict[str, list] = {}
+    for step in plan:
+        agent = assigned.get(step) or choose_agent(step)
+        if agent in WORKER_RAG:
+            by_agent.setdefault(agent, []).append(step)
+    
+    step_context: Dict[str, Dict[str, list]] = {}
+    for agent, steps in by_agent.items():
+        tool, k = WORKER_RAG[agent]
+        step_context[agent] = dict(zip(steps, get_retriever().retrieve_many(steps, k=k, tool=tool)))
+    return step_context
 
 def extract_path_with_llm(user_request: str) -> str:
     """
@@ -44,8 +80,8 @@ def extract_path_with_llm(user_request: str) -> str:
         ("human", "{request}")
     ])
     
-    chain = prompt | llm
-    response = chain.invoke({"request": user_request})
+    chain = prompt | get_llm()
+    response = chain.invoke({"request": user_request}, config={"callbacks": llm_callbacks("path_extract")})
     return response.content.strip()
 
 def supervisor_node(state: BioState) -> Dict[str, Any]:
@@ -76,34 +112,36 @@ def supervisor_node(state: BioState) -> Dict[str, Any]:
             
             # If error, route back to the SAME agent to retry
             # We need to know who executed the last step.
-            # For now, let's infer from the plan step text
-            last_agent = "obitools"
-            if "qiime" in current_step_str.lower():
-                last_agent = "qiime"
+            # For now, infer it from the plan step text the same way steps are assigned
+            last_agent = choose_agent(current_step_str)
             
             print(f"🔄 Routing back to {last_agent} for correction (Attempt {retry_count + 1})...")
             return {
                 "next_agent": last_agent,
-                "retry_count": retry_count + 1
+                "retry_count": retry_count + 1,
+                # Per-sample steps re-dispatch only the samples in failed_samples
+                "sample_results": None
                 # We don't advance the step, we retry
             }
 
         try:
             current_idx = plan.index(current_step_str)
-            if current_idx + 1 < len(plan):
-                next_step = plan[current_idx + 1]
+            # Make-like check: skip steps whose declared outputs are already up to date
+            next_idx, _ = skip_fresh_steps(plan, current_idx + 1, state.get('step_io') or {})
+            if next_idx < len(plan):
+                next_step = plan[next_idx]
                 
                 # Decide agent for next step
-                next_agent = "obitools"
-                if "qiime" in next_step.lower() or "dada2" in next_step.lower() or "diversity" in next_step.lower():
-                    next_agent = "qiime"
+                next_agent = choose_agent(next_step)
                     
                 print(f"👉 Next Step: {next_step} -> {next_agent}")
                 return {
                     "current_step": next_step,
                     "next_agent": next_agent,
                     "errors": [], # Clear errors on success
-                    "retry_count": 0 # Reset retry count
+                    "retry_count": 0, # Reset retry count
+                    "sample_results": None,
+                    "failed_samples": {}
                 }
             else:
                 return {"final_answer": "All steps completed successfully."}
@@ -115,24 +153,30 @@ def supervisor_node(state: BioState) -> Dict[str, Any]:
         # --- Initial Planning Phase ---
         
         # 1. Directory Analysis (Pre-planning)
-        # Use LLM to extract path
-        target_dir = extract_path_with_llm(user_request)
-        print(f"🔍 Extracted Target Directory: {target_dir}")
+        # Rule-based parse first; the LLM extractor only handles ambiguous requests
+        intent = parse_request(user_request)
+        if intent.ambiguous:
+            print("🤔 Request is ambiguous, asking LLM for the path...")
+            extracted = extract_path_with_llm(user_request)
+            intent.target_dir = extracted if extracted != "None" else None
+            intent.source = "llm"
+        target_dir = intent.target_dir
+        print(f"🔍 Extracted Target Directory: {target_dir} (via {intent.source})")
         
         file_structure = "No directory specified or found."
+        table = SampleTable(root=target_dir)
         
-        if target_dir and target_dir != "None":
-            # Run ls -R via Executor
-            # We use a simple ls -R to get file list
-            # Quote the path to handle spaces
-            cmd_result = executor_client.run_command(f"ls -R '{target_dir}'")
-            if cmd_result['return_code'] == 0:
-                file_structure = cmd_result['stdout']
-                # Limit output size to avoid context overflow
-                if len(file_structure) > 2000:
-                    file_structure = file_structure[:2000] + "\n...(truncated)..."
-            else:
-                file_structure = f"Error scanning directory: {cmd_result['stderr']}"
+        if target_dir:
+            # One cached `find` scan: sizes, mtimes and R1/R2 pairs grouped into samples
+            try:
+                inventory = get_inventory().scan(target_dir)
+                for sample_id, files in inventory.samples().items():
+                    for stage, path in files.items():
+                        table.set(sample_id, stage, path)
+                table.extra_files = [inventory.relative(path) for path in inventory.other_files()]
+                file_structure = inventory.summary()
+            except Exception as e:
+                file_structure = f"Error scanning directory: {e}"
         
         print(f"📂 File Structure:\n{file_structure[:200]}...")
 
@@ -151,6 +195,15 @@ def supervisor_node(state: BioState) -> Dict[str, Any]:
         1. Use ONLY filenames that actually exist in the File Structure.
         2. Do NOT hallucinate files like 'sample1.fastq' if they are not there.
         3. Always start with a 'Create Workspace' step.
+        4. Prefix a step with '{per_sample_tag}' when it processes each sample independently
+           (e.g. merging or filtering one sample's R1/R2 reads). Such steps run once per sample
+           in parallel, so do NOT describe loops over samples in them.
+        5. In "io", list for every step (same order as "plan") the absolute paths of the files
+           it reads and writes. Use [] when a step has no file inputs or outputs.
+        
+        Detected Samples: {sample_count}
+        Tools mentioned in the request: {tool_hints}
+        Sample patterns in the request: {sample_patterns}
         
         Workers:
         - 'obitools': For sequence merging, filtering, OBITools3 commands.
@@ -159,21 +212,32 @@ def supervisor_node(state: BioState) -> Dict[str, Any]:
         Output Format (JSON):
         {{
             "plan": ["1. Create workspace...", "2. Import data...", ...],
+            "io": [{{"inputs": [], "outputs": []}}, {{"inputs": ["/abs/in.fastq"], "outputs": ["/abs/out.qza"]}}, ...],
             "current_step": "1. Create workspace...",
             "next_agent": "obitools"
         }}
         """
         
+        # Fit the inventory summary into the planning budget (whole lines, head first)
+        packer = PromptPacker(max_tokens=budget_for("supervisor"))
+        packed = packer.pack([
+            Section("file_structure", [file_structure], trim="head"),
+        ], fixed=system_prompt + user_request)
+        
         prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             ("human", "{request}")
         ])
         
-        chain = prompt | llm
+        chain = prompt | get_llm()
         response = chain.invoke({
             "request": user_request,
-            "file_structure": file_structure
-        })
+            "file_structure": packed["file_structure"],
+            "per_sample_tag": PER_SAMPLE_TAG,
+            "sample_count": len(table),
+            "tool_hints": ", ".join(intent.tools) or "none",
+            "sample_patterns": ", ".join(intent.sample_patterns) or "none"
+        }, config={"callbacks": llm_callbacks("planner")})
         
         try:
             # Parse JSON output
@@ -185,15 +249,41 @@ def supervisor_node(state: BioState) -> Dict[str, Any]:
                 
             result = json.loads(content)
             
-            print(f"📋 Plan: {len(result['plan'])} steps")
-            print(f"👉 Routing to: {result['next_agent']}")
+            plan = result['plan']
+            print(f"📋 Plan: {len(plan)} steps")
+            
+            # Declared files per step; steps whose outputs are already up to date are skipped
+            step_io = {}
+            for step, io in zip(plan, result.get('io') or []):
+                if isinstance(io, dict):
+                    step_io[step] = {"inputs": list(io.get('inputs') or []), "outputs": list(io.get('outputs') or [])}
+            start = plan.index(result['current_step']) if result['current_step'] in plan else 0
+            first_idx, skipped = skip_fresh_steps(plan, start, step_io)
+            if first_idx >= len(plan):
+                return {"plan": plan, "step_io": step_io,
+                        "final_answer": "All steps are already up to date; nothing to run."}
+            current_step = plan[first_idx]
+            next_agent = result['next_agent'] if not skipped else choose_agent(current_step)
+            print(f"👉 Routing to: {next_agent}")
+            
+            # Prefetch RAG context for all steps now, off the per-step critical path
+            try:
+                step_context = prefetch_step_context(plan, assigned={current_step: next_agent})
+            except Exception as e:
+                print(f"⚠️ Context prefetch failed, workers will retrieve per step: {e}")
+                step_context = {}
             
             return {
-                "plan": result['plan'],
-                "current_step": result['current_step'],
-                "next_agent": result['next_agent'],
+                "plan": plan,
+                "current_step": current_step,
+                "next_agent": next_agent,
+                "step_io": step_io,
                 # Store file manifest for workers to use
-                "file_manifest": {"raw_structure": file_structure} 
+                "file_manifest": table.to_dict(),
+                "step_context": step_context,
+                "request_intent": intent.to_dict(),
+                "sample_results": None,
+                "failed_samples": {}
             }
             
         except Exception as e:
@@ -13,12 +13,19 @@ sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from backend.config import conda_env
 from backend.utils.llm_client import get_llm
+from backend.utils.llm_cache import bypass_llm_cache, record_llm_cache_keys
 from backend.rag.retriever import get_retriever
 from backend.agents.state import BioState
+from backend.agents.progress import TokenStreamer
+from backend.agents.sample_table import SampleTable, OUTPUT_INSTRUCTION
+from backend.utils.prompt_packer import PromptPacker, Section, budget_for
+from backend.utils.tracing import llm_callbacks
 
-llm = get_llm()
-retriever = get_retriever()
+# Knowledge base scope and depth for this worker (also used for plan prefetch)
+RAG_TOOL = "obitools"
+RAG_K = 3
 
 def obitools_worker(state: BioState) -> Dict[str, Any]:
     """
@@ -27,12 +34,14 @@ def obitools_worker(state: BioState) -> Dict[str, Any]:
     print("🦠 Obitools Worker: Processing...")
     
     current_step = state['current_step']
-    file_structure = state.get('file_manifest', {}).get('raw_structure', "No file info.")
+    table = SampleTable.from_state(state)
     errors = state.get('errors', [])
     
-    # 1. Retrieve Context
-    rag_docs = retriever.retrieve(f"OBITools {current_step}", k=3)
-    rag_context = "\n\n".join(rag_docs)
+    # 1. Retrieve Context (prefetched by the Supervisor after planning; scoped to this tool's protocols).
+    #    Only this worker's own prefetch is used; a step prefetched for the other worker is retrieved live.
+    rag_docs = ((state.get('step_context') or {}).get("obitools") or {}).get(current_step)
+    if rag_docs is None:
+        rag_docs = get_retriever().retrieve(current_step, k=RAG_K, tool=RAG_TOOL)
     
     # 2. Generate Code
     system_prompt = """You are an Expert OBITools3 Bioinformatician.
@@ -40,7 +49,7 @@ def obitools_worker(state: BioState) -> Dict[str, Any]:
     
     EXECUTION CONTEXT:
     - Running on Ubuntu Linux.
-    - Environment: 'obi3' (Conda).
+    - Environment: '{environment}' (Conda).
     - Workspace: {workspace}
     
     FILE STRUCTURE (Real files):
@@ -58,6 +67,7 @@ def obitools_worker(state: BioState) -> Dict[str, Any]:
     1. Use ONLY filenames that appear in FILE STRUCTURE.
     2. Do NOT hallucinate files.
     3. If a file is missing, print an error message in the script.
+    4. {output_rule}
     
     RAG CONTEXT:
     {context}
@@ -66,19 +76,39 @@ def obitools_worker(state: BioState) -> Dict[str, Any]:
     Return ONLY the executable code block.
     """
     
+    # 3. Pack RAG chunks, file table and errors into the token budget
+    #    (whole chunks, most relevant first; newest error first)
+    packer = PromptPacker(max_tokens=budget_for("obitools"))
+    packed = packer.pack([
+        Section("context", rag_docs, share=2),
+        Section("file_structure", share=2,
+                render=lambda n: table.render(max_tokens=n, count_tokens=packer.count_tokens)),
+        Section("errors", list(reversed(errors)), trim="tail"),
+    ], fixed=system_prompt + current_step)
+    print(f"  📦 Prompt: {packer.summary()}")
+    
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         ("human", "Current Task: {task}")
     ])
     
-    chain = prompt | llm
-    response = chain.invoke({
-        "workspace": state.get('workspace_dir', '.'),
-        "context": rag_context,
-        "task": current_step,
-        "file_structure": file_structure,
-        "errors": "\n".join(errors) if errors else "None"
-    })
+    chain = prompt | get_llm()
+    # Stream tokens to the UI as they are generated; the cleaned code below is what runs
+    sample_id = state.get('sample_id')  # Set inside per-sample fan-out branches
+    streamer = TokenStreamer(node=f"obitools:{sample_id}" if sample_id else "obitools")
+    # On a retry, ask for a fresh completion instead of replaying a cached one; the
+    # recorded keys let the executor drop a cached completion whose code fails
+    with bypass_llm_cache(active=bool(errors)), record_llm_cache_keys() as cache_keys:
+        response = chain.invoke({
+            "workspace": state.get('workspace_dir', '.'),
+            "context": packed["context"],
+            "task": current_step,
+            "file_structure": packed["file_structure"],
+            "output_rule": OUTPUT_INSTRUCTION,
+            "environment": conda_env("obitools"),
+            "errors": packed["errors"]
+        }, config={"callbacks": [streamer, *llm_callbacks('obitools')]})
+    streamer.finish(response.content)
     
     code = response.content.strip()
     # Clean markdown
@@ -89,5 +119,6 @@ def obitools_worker(state: BioState) -> Dict[str, Any]:
         
     return {
         "next_agent": "executor",
-        "generated_code": code
+        "generated_code": code,
+        "llm_cache_keys": cache_keys
     }
@@ -12,12 +12,19 @@ from typing import Dict, Any
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from langchain_core.prompts import ChatPromptTemplate
+from backend.config import conda_env
 from backend.utils.llm_client import get_llm
+from backend.utils.llm_cache import bypass_llm_cache, record_llm_cache_keys
 from backend.rag.retriever import get_retriever
 from backend.agents.state import BioState
+from backend.agents.progress import TokenStreamer
+from backend.agents.sample_table import SampleTable, OUTPUT_INSTRUCTION
+from backend.utils.prompt_packer import PromptPacker, Section, budget_for
+from backend.utils.tracing import llm_callbacks
 
-llm = get_llm()
-retriever = get_retriever()
+# Knowledge base scope and depth for this worker (also used for plan prefetch)
+RAG_TOOL = "qiime2"
+RAG_K = 2
 
 def qiime_worker(state: BioState) -> Dict[str, Any]:
     """
@@ -26,12 +33,14 @@ def qiime_worker(state: BioState) -> Dict[str, Any]:
     print("📊 Qiime Worker: Processing...")
     
     current_step = state['current_step']
-    file_structure = state.get('file_manifest', {}).get('raw_structure', "No file info.")
+    table = SampleTable.from_state(state)
     errors = state.get('errors', [])
     
-    # 1. Retrieve Context
-    rag_docs = retriever.retrieve(f"QIIME2 {current_step}", k=2)
-    rag_context = "\n\n".join(rag_docs)
+    # 1. Retrieve Context (prefetched by the Supervisor after planning; scoped to this tool's protocols).
+    #    Only this worker's own prefetch is used; a step prefetched for the other worker is retrieved live.
+    rag_docs = ((state.get('step_context') or {}).get("qiime") or {}).get(current_step)
+    if rag_docs is None:
+        rag_docs = get_retriever().retrieve(current_step, k=RAG_K, tool=RAG_TOOL)
     
     # 2. Generate Code with ULTRA-STRICT Prompt
     system_prompt = """You are a QIIME2 Command Generator. Output ONLY executable bash code.
@@ -42,9 +51,10 @@ CRITICAL RULES:
 3. Use ONLY files from FILE STRUCTURE
 4. Manifest format: sample-id\tabsolute-filepath\tdirection (TAB separated)
 5. Sample IDs MUST be unique - use full filenames if needed
+6. {output_rule}
 
 CONTEXT:
-Environment: qiime2-amplicon-2024.2 (Conda)
+Environment: {environment} (Conda)
 Workspace: {workspace}
 
 FILES ON SERVER:
@@ -64,19 +74,39 @@ OUTPUT FORMAT (STRICT):
 ```
 """
     
+    # 3. Pack RAG chunks, file table and errors into the token budget
+    #    (whole chunks, most relevant first; newest error first)
+    packer = PromptPacker(max_tokens=budget_for("qiime"))
+    packed = packer.pack([
+        Section("context", rag_docs, share=2),
+        Section("file_structure", share=2,
+                render=lambda n: table.render(max_tokens=n, count_tokens=packer.count_tokens)),
+        Section("errors", list(reversed(errors)), trim="tail"),
+    ], fixed=system_prompt + current_step)
+    print(f"  📦 Prompt: {packer.summary()}")
+    
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         ("human", "Generate bash code for: {task}")
     ])
     
-    chain = prompt | llm
-    response = chain.invoke({
-        "workspace": state.get('workspace_dir', '.'),
-        "context": rag_context[:500],  # Limit context to avoid pollution
-        "task": current_step,
-        "file_structure": file_structure[:1000],  # Limit to avoid overflow
-        "errors": errors[-1] if errors else "None"  # Only last error
-    })
+    chain = prompt | get_llm()
+    # Stream tokens to the UI as they are generated; the cleaned code below is what runs
+    sample_id = state.get('sample_id')  # Set inside per-sample fan-out branches
+    streamer = TokenStreamer(node=f"qiime:{sample_id}" if sample_id else "qiime")
+    # On a retry, ask for a fresh completion instead of replaying a cached one; the
+    # recorded keys let the executor drop a cached completion whose code fails
+    with bypass_llm_cache(active=bool(errors)), record_llm_cache_keys() as cache_keys:
+        response = chain.invoke({
+            "workspace": state.get('workspace_dir', '.'),
+            "context": packed["context"],
+            "task": current_step,
+            "file_structure": packed["file_structure"],
+            "output_rule": OUTPUT_INSTRUCTION,
+            "environment": conda_env("qiime2"),
+            "errors": packed["errors"]
+        }, config={"callbacks": [streamer, *llm_callbacks('qiime')]})
+    streamer.finish(response.content)
     
     code = response.content.strip()
     
@@ -99,5 +129,6 @@ OUTPUT FORMAT (STRICT):
         
     return {
         "next_agent": "executor",
-        "generated_code": code
+        "generated_code": code,
+        "llm_cache_keys": cache_keys
     }
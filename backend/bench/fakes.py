@@ -0,0 +1,310 @@
+"""
+Offline Stand-ins
+=================
+Deterministic fakes for the graph's external services, plus a cassette
+that records a real run's LLM completions, retrievals and remote command
+results and replays them without network access.
+
+- FakeChatModel: LangChain chat model answering through a responder function
+- ScriptedResponder: plans and code for a synthetic scenario
+- FakeExecutor: run_command stand-in (synthetic `find` listings, outputs, failures)
+- FakeRetriever: fixed protocol chunks
+- Cassette / RecordingChatModel / CassetteExecutor / CassetteRetriever: record & replay
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.agents.fanout import PER_SAMPLE_TAG
+
+# Marker the scripted workers put in generated code, read back by FakeExecutor
+BENCH_MARKER = re.compile(r'^# bench step=(\d+) sample=(\S+)$', re.MULTILINE)
+SAMPLE_TASK_PATTERN = re.compile(r"Apply this step to sample '([^']+)' ONLY")
+ECHO_PATTERN = re.compile(r'^echo "(.*)"$', re.MULTILINE)
+
+
+@dataclass
+class Scenario:
+    """A synthetic workload for the offline benchmark"""
+    name: str
+    samples: int = 1
+    fail_steps: Set[int] = field(default_factory=set)  # Steps whose first attempt fails
+    fail_every: int = 1                                 # ...only for every n-th sample of per-sample steps
+    output_lines: int = 20                              # Lines printed by every remote command
+    llm_latency_s: float = 0.0
+    exec_latency_s: float = 0.0
+
+    @property
+    def root(self) -> str:
+        return f"/bench/{self.name}"
+
+    def plan(self) -> List[str]:
+        return [
+            f"1. Create workspace {self.root}/work",
+            f"2. {PER_SAMPLE_TAG} Merge paired-end reads with obi alignpairedend",
+            f"3. {PER_SAMPLE_TAG} Filter merged reads with obi grep",
+            "4. Dereplicate all samples with obi uniq",
+            "5. Denoise with qiime dada2 denoise-single",
+        ]
+
+
+def messages_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model whose completion is responder(messages); no network, no cache"""
+
+    responder: Callable[[List[BaseMessage]], str]
+    latency_s: float = 0.0
+    model_name: str = "labbio-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "labbio-fake"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.responder(messages)))])
+
+
+class ScriptedResponder:
+    """Plans and worker code for a Scenario, keyed on the prompt's role"""
+
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+
+    def __call__(self, messages: List[BaseMessage]) -> str:
+        system = str(messages[0].content)
+        task = str(messages[-1].content)
+        if "Path Extractor" in system:
+            return self.scenario.root
+        if "Supervisor of a Bioinformatics" in system:
+            plan = self.scenario.plan()
+            return json.dumps({
+                "plan": plan,
+                "io": [{"inputs": [], "outputs": []} for _ in plan],
+                "current_step": plan[0],
+                "next_agent": "obitools",
+            })
+        return self._code(task)
+
+    def _code(self, task: str) -> str:
+        step = re.search(r'(\d+)\.', task)
+        step_no = int(step.group(1)) if step else 0
+        match = SAMPLE_TASK_PATTERN.search(task)
+        sample = match.group(1) if match else "-"
+        lines = [f"# bench step={step_no} sample={sample}"]
+        if step_no == 1:
+            lines.append(f"mkdir -p {self.scenario.root}/work")
+        elif sample != "-":
+            lines.append(f'echo "OUTPUT {sample} step{step_no}={self.scenario.root}/work/{sample}.step{step_no}.fasta"')
+        else:
+            lines.append(f'echo "OUTPUT step{step_no}={self.scenario.root}/work/all.step{step_no}.fasta"')
+        return "```bash\n" + "\n".join(lines) + "\n```"
+
+
+class FakeExecutor:
+    """run_command stand-in with synthetic listings, output volume and first-attempt failures"""
+
+    def __init__(self, scenario: Scenario, tail_lines: int = 2000):
+        self.scenario = scenario
+        self.tail_lines = tail_lines
+        self.calls = 0
+        self._attempts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _listing(self, script: str, on_output: Optional[Callable[[str, str], None]]) -> List[str]:
+        root = self.scenario.root
+        if "-type d" in script:
+            lines = [f"1700000000.0\t{root}"]
+        else:
+            lines = [f"d\t4096\t1700000000.0\t{root}"]
+            for i in range(1, self.scenario.samples + 1):
+                for read in ("R1", "R2"):
+                    lines.append(f"f\t{1000000 + i}\t1700000000.0\t{root}/JC{i}_{read}.fastq.gz")
+        for line in lines:
+            on_output and on_output("stdout", line)
+        return lines
+
+    def _should_fail(self, step: int, sample: str) -> bool:
+        if step not in self.scenario.fail_steps:
+            return False
+        if sample != "-":
+            number = re.sub(r'\D', '', sample)
+            if number and int(number) % self.scenario.fail_every:
+                return False
+        with self._lock:
+            key = (step, sample)
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            return self._attempts[key] == 1
+
+    def run_command(self, script: str, cwd: str = None, env_name: Optional[str] = "base",
+                    on_output: Optional[Callable[[str, str], None]] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+        if script.lstrip().startswith("find "):
+            return {"stdout": "\n".join(self._listing(script, on_output)), "stderr": "", "return_code": 0}
+        if script.lstrip().startswith("stat "):
+            return {"stdout": "", "stderr": "", "return_code": 1}
+
+        if self.scenario.exec_latency_s:
+            time.sleep(self.scenario.exec_latency_s)
+        marker = BENCH_MARKER.search(script)
+        step, sample = (int(marker.group(1)), marker.group(2)) if marker else (0, "-")
+        tail = deque(maxlen=self.tail_lines)
+        for i in range(self.scenario.output_lines):
+            line = f"[{sample}] step {step}: processed record batch {i}"
+            tail.append(line)
+            on_output and on_output("stdout", line)
+        if self._should_fail(step, sample):
+            error = f"Error: simulated failure in step {step} ({sample})"
+            on_output and on_output("stderr", error)
+            return {"stdout": "\n".join(tail), "stderr": error, "return_code": 1}
+        for line in ECHO_PATTERN.findall(script):
+            tail.append(line)
+            on_output and on_output("stdout", line)
+        return {"stdout": "\n".join(tail), "stderr": "", "return_code": 0}
+
+
+class FakeRetriever:
+    """Retriever stand-in returning k fixed chunks per query"""
+
+    def retrieve(self, query: str, k: int = 3, tool: Optional[str] = None, **kwargs: Any) -> List[str]:
+        return [f"{tool or 'general'} protocol chunk {i}: run the documented command for '{query[:40]}'"
+                for i in range(k)]
+
+    def retrieve_many(self, queries: List[str], k: int = 3, tool: Optional[str] = None,
+                      **kwargs: Any) -> List[List[str]]:
+        return [self.retrieve(query, k=k, tool=tool) for query in queries]
+
+
+# --- Record / replay -----------------------------------------------------------
+
+class CassetteMiss(KeyError):
+    """Replay found no recorded entry for a request"""
+
+
+class Cassette:
+    """LLM completions, retrievals and command results keyed by a hash of their inputs"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {"llm": {}, "retrieval": {}, "exec": {}}
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries.update(json.load(f))
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        raw = "\x00".join(json.dumps(part, sort_keys=True, default=str) for part in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, kind: str, key: str) -> Any:
+        try:
+            return self.entries[kind][key]
+        except KeyError:
+            self.misses += 1
+            raise CassetteMiss(f"No recorded {kind} entry {key[:12]}")
+
+    def put(self, kind: str, key: str, value: Any):
+        with self._lock:
+            self.entries[kind][key] = value
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+
+    def responder(self) -> Callable[[List[BaseMessage]], str]:
+        """FakeChatModel responder replaying recorded completions"""
+        return lambda messages: self.get("llm", self.key(messages_text(messages)))
+
+
+class RecordingChatModel(BaseChatModel):
+    """Wraps a real chat model and stores every completion in a cassette"""
+
+    inner: Any
+    cassette: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "labbio-recording"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        content = str(self.inner.invoke(messages).content)
+        self.cassette.put("llm", self.cassette.key(messages_text(messages)), content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+class CassetteExecutor:
+    """Records (inner given) or replays (inner None) remote command results"""
+
+    def __init__(self, cassette: Cassette, inner: Any = None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def run_command(self, script: str, cwd: str = None, env_name: Optional[str] = "base",
+                    on_output: Optional[Callable[[str, str], None]] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        key = self.cassette.key(script, cwd, env_name)
+        if self.inner is None:
+            entry = self.cassette.get("exec", key)
+            for stream, line in entry["lines"]:
+                on_output and on_output(stream, line)
+            return dict(entry["result"])
+        lines: List[List[str]] = []
+
+        def collect(stream: str, line: str):
+            lines.append([stream, line])
+            on_output and on_output(stream, line)
+
+        result = self.inner.run_command(script, cwd=cwd, env_name=env_name, on_output=collect, timeout=timeout)
+        self.cassette.put("exec", key, {"lines": lines, "result": result})
+        return result
+
+
+class CassetteRetriever:
+    """Records (inner given) or replays (inner None) retrieval results"""
+
+    def __init__(self, cassette: Cassette, inner: Any = None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def retrieve(self, query: str, k: int = 3, tool: Optional[str] = None, **kwargs: Any) -> List[str]:
+        key = self.cassette.key("one", query, k, tool, kwargs)
+        if self.inner is None:
+            return self.cassette.get("retrieval", key)
+        docs = self.inner.retrieve(query, k=k, tool=tool, **kwargs)
+        self.cassette.put("retrieval", key, docs)
+        return docs
+
+    def retrieve_many(self, queries: List[str], k: int = 3, tool: Optional[str] = None,
+                      **kwargs: Any) -> List[List[str]]:
+        key = self.cassette.key("many", list(queries), k, tool, kwargs)
+        if self.inner is None:
+            return self.cassette.get("retrieval", key)
+        docs = self.inner.retrieve_many(queries, k=k, tool=tool, **kwargs)
+        self.cassette.put("retrieval", key, docs)
+        return docs
@@ -0,0 +1,255 @@
+"""
+Graph Benchmark
+===============
+Measures the orchestration overhead of create_graph offline.
+
+The LLM, executor and retriever are replaced by deterministic fakes (see
+fakes.py), so what is timed is the graph, state handling, prompt packing,
+fan-out and the executor node's own logic. Per-node timings come from the
+run traces (tracing.py): every node, per-sample worker/executor call, LLM
+completion and retrieval is a span.
+
+Remote-only features (detached jobs, resource scheduler, execution and LLM
+caches, warm sessions, metrics, checkpointing) are switched off through
+config overrides so runs are deterministic.
+
+Usage:
+    python -m backend.bench.graph_bench                        # all scenarios
+    python -m backend.bench.graph_bench --scenario samples-100 --repeats 3
+    python -m backend.bench.graph_bench --save bench.json      # keep results
+    python -m backend.bench.graph_bench --baseline bench.json  # fail on p95 regressions
+
+    # Record a real run (live LLM + Muscle node) and replay it offline
+    python -m backend.bench.graph_bench --record run.cassette.json --request "..."
+    python -m backend.bench.graph_bench --replay run.cassette.json --request "..." --repeats 5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import set_config_overrides
+from backend.bench.fakes import (
+    Cassette, CassetteExecutor, CassetteRetriever, FakeChatModel, FakeExecutor, FakeRetriever,
+    RecordingChatModel, Scenario, ScriptedResponder
+)
+
+# Features that need the live node or persist state between runs
+BENCH_OVERRIDES = {
+    "executor": {
+        "jobs": {"enabled": False},
+        "scheduler": {"enabled": False},
+        "exec_cache": {"enabled": False},
+        "sessions": {"enabled": False},
+        "metrics": {"enabled": False},
+    },
+    "workflow": {"checkpoint": {"enabled": False}, "tracing": {"enabled": True}},
+    "llm": {"cache": {"enabled": False}},
+}
+
+SCENARIOS = {
+    "samples-1": Scenario("samples-1", samples=1),
+    "samples-10": Scenario("samples-10", samples=10),
+    "samples-100": Scenario("samples-100", samples=100),
+    # Step 2 fails for every 3rd sample and step 4 once, each retried
+    "retries": Scenario("retries", samples=10, fail_steps={2, 4}, fail_every=3),
+    "long-output": Scenario("long-output", samples=10, output_lines=50000),
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def span_label(span: Dict[str, Any]) -> str:
+    """Node spans by name (per-sample calls marked), other spans by kind"""
+    if span["kind"] == "node":
+        return f"{span['name']}[sample]" if span["parent_id"] and span["attrs"].get("sample") else span["name"]
+    return span["name"]
+
+
+def install(llm: Any, executor: Any, retriever: Any, trace_dir: str):
+    """Swap the shared services for the benchmark's stand-ins"""
+    from backend.utils.llm_client import set_llm
+    from backend.utils.executor_client import set_executor_client
+    from backend.rag.retriever import set_retriever
+
+    overrides = json.loads(json.dumps(BENCH_OVERRIDES))
+    overrides["workflow"]["tracing"]["dir"] = trace_dir
+    set_config_overrides(overrides)
+    set_llm(llm)
+    set_executor_client(executor)
+    set_retriever(retriever)
+
+
+def run_once(app: Any, request: str, verbose: bool = False) -> Dict[str, Any]:
+    """One graph run; returns wall time, final state and its spans"""
+    from langchain_core.messages import HumanMessage
+    from backend.agents.runs import new_run_id, run_config
+    from backend.utils.tracing import end_trace
+
+    run_id = new_run_id()
+    initial_state = {
+        "messages": [HumanMessage(content=request)],
+        "plan": [],
+        "current_step": "",
+        "file_manifest": {},
+        "qc_metrics": {},
+        "errors": []
+    }
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with sink:
+        final = app.invoke(initial_state, run_config(run_id))
+    wall = time.perf_counter() - start
+    trace = end_trace(run_id)
+    return {"wall_s": wall, "final": final, "spans": list(trace.spans) if trace else []}
+
+
+def summarize_runs(name: str, runs: List[Dict[str, Any]], samples: int) -> Dict[str, Any]:
+    walls = [run["wall_s"] for run in runs]
+    by_label: Dict[str, List[float]] = {}
+    for run in runs:
+        for span in run["spans"]:
+            by_label.setdefault(span_label(span), []).append(span["duration_s"])
+    total_wall = sum(walls)
+    return {
+        "scenario": name,
+        "runs": len(runs),
+        "samples": samples,
+        "completed": sum(1 for run in runs if "completed" in (run["final"].get("final_answer") or "")),
+        "wall_p50_s": percentile(walls, 50),
+        "wall_p95_s": percentile(walls, 95),
+        "runs_per_s": len(runs) / total_wall if total_wall else 0.0,
+        "samples_per_s": len(runs) * samples / total_wall if total_wall else 0.0,
+        "spans": {
+            label: {"count": len(values), "p50_s": percentile(values, 50), "p95_s": percentile(values, 95),
+                    "total_s": sum(values)}
+            for label, values in sorted(by_label.items())
+        },
+    }
+
+
+def run_scenario(scenario: Scenario, repeats: int, trace_dir: str, verbose: bool = False) -> Dict[str, Any]:
+    from backend.agents.graph import create_graph
+
+    runs = []
+    for _ in range(repeats):
+        # Fresh fakes per run so failure injection restarts
+        install(FakeChatModel(responder=ScriptedResponder(scenario), latency_s=scenario.llm_latency_s, cache=False),
+                FakeExecutor(scenario), FakeRetriever(), trace_dir)
+        runs.append(run_once(create_graph(), f"Process the eDNA reads in {scenario.root} with OBITools",
+                             verbose))
+    return summarize_runs(scenario.name, runs, scenario.samples)
+
+
+def run_cassette(path: str, request: str, repeats: int, record: bool, trace_dir: str,
+                 verbose: bool = False) -> Dict[str, Any]:
+    """Record a live run into a cassette, or replay one `repeats` times"""
+    from backend.agents.fanout import get_sample_ids
+    from backend.agents.graph import create_graph
+    from backend.rag.retriever import LabKnowledgeRetriever
+    from backend.utils.executor_client import ExecutorClient
+    from backend.utils.llm_client import create_llm
+
+    cassette = Cassette(path)
+    runs = []
+    if record:
+        install(RecordingChatModel(inner=create_llm(), cassette=cassette, cache=False),
+                CassetteExecutor(cassette, inner=ExecutorClient()),
+                CassetteRetriever(cassette, inner=LabKnowledgeRetriever()), trace_dir)
+        runs.append(run_once(create_graph(), request, verbose))
+        cassette.save()
+        print(f"📼 Recorded {sum(len(v) for v in cassette.entries.values())} entries to {path}")
+    else:
+        for _ in range(repeats):
+            install(FakeChatModel(responder=cassette.responder(), cache=False),
+                    CassetteExecutor(cassette), CassetteRetriever(cassette), trace_dir)
+            runs.append(run_once(create_graph(), request, verbose))
+        if cassette.misses:
+            print(f"⚠️ {cassette.misses} requests were not in the cassette (prompt or code changed?)")
+    samples = len(get_sample_ids(runs[-1]["final"].get("file_manifest") or {})) if runs else 0
+    return summarize_runs(f"cassette:{Path(path).stem}", runs, samples)
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n📊 {result['scenario']}: {result['runs']} runs, {result['completed']} completed, "
+          f"wall p50 {result['wall_p50_s'] * 1000:.0f}ms / p95 {result['wall_p95_s'] * 1000:.0f}ms, "
+          f"{result['samples_per_s']:.1f} samples/s")
+    print(f"   {'span':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>11}")
+    for label, stats in sorted(result["spans"].items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"   {label:<22}{stats['count']:>7}{stats['p50_s'] * 1000:>10.1f}"
+              f"{stats['p95_s'] * 1000:>10.1f}{stats['total_s'] * 1000:>11.1f}")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Spans whose p95 grew by more than `tolerance` (fraction) against a saved run"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)}
+    regressions = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if not base:
+            continue
+        checks = {"wall": (base["wall_p95_s"], result["wall_p95_s"])}
+        checks.update({label: (base["spans"][label]["p95_s"], stats["p95_s"])
+                       for label, stats in result["spans"].items() if label in base["spans"]})
+        for label, (old, new) in checks.items():
+            # Ignore sub-millisecond noise
+            if old > 0 and new - old > 0.001 and new > old * (1 + tolerance):
+                regressions.append(f"{result['scenario']}/{label}: p95 {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline graph benchmark")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default: all)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--record", metavar="CASSETTE", help="Record a live run into a cassette")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Replay a recorded run offline")
+    parser.add_argument("--request", help="User request for --record/--replay")
+    parser.add_argument("--save", metavar="JSON", help="Write results for later comparison")
+    parser.add_argument("--baseline", metavar="JSON", help="Compare p95 against saved results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 growth (fraction)")
+    parser.add_argument("--verbose", action="store_true", help="Show node output")
+    args = parser.parse_args()
+
+    trace_dir = tempfile.mkdtemp(prefix="labbio_bench_")
+    if args.record or args.replay:
+        if not args.request:
+            parser.error("--request is required with --record/--replay")
+        results = [run_cassette(args.record or args.replay, args.request, args.repeats,
+                                record=bool(args.record), trace_dir=trace_dir, verbose=args.verbose)]
+    else:
+        results = [run_scenario(SCENARIOS[name], args.repeats, trace_dir, args.verbose)
+                   for name in (args.scenario or list(SCENARIOS))]
+    set_config_overrides(None)
+
+    for result in results:
+        print_report(result)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No p95 regressions")
@@ -0,0 +1,582 @@
+"""
+RAG Benchmark
+=============
+Retrieval cost and quality as the knowledge base grows.
+
+A synthetic protocol corpus (frontmatter + `#` sections, the format
+`parse_markdown_protocol` reads) is generated around the real sources in
+Documents/Lab, so the labeled queries below still have their answers in the
+real protocols while the number of look-alike distractor chunks grows from 1k
+to 100k. For every corpus size and index configuration it reports:
+
+- ingest throughput: parsing, embedding and index build (chunks/s)
+- index size on disk and process RSS growth while building and querying
+- query latency p50/p99 (query encoding excluded, reported once per size)
+- recall@k and MRR of the labeled queries
+
+Chunks and queries are embedded once per size and shared by all
+configurations, so index builds compare the stores themselves. The `chroma-*`
+configurations query through LabKnowledgeRetriever (hybrid fusion included);
+`faiss-flat` needs faiss installed and is skipped otherwise.
+
+Usage:
+    python -m backend.bench.rag_bench                               # 1k and 10k chunks
+    python -m backend.bench.rag_bench --sizes 1000 10000 100000 --workdir ./bench_rag
+    python -m backend.bench.rag_bench --config chroma-hybrid --config bm25
+    python -m backend.bench.rag_bench --embedder hash               # no model: index cost only
+"""
+
+import argparse
+import contextlib
+import gc
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config, set_config_overrides
+from backend.rag.bm25 import BM25Index, tokenize
+from backend.rag.embeddings import CachedEmbeddings, set_embeddings
+from backend.rag.ingest import iter_source_files, load_documents
+from backend.utils.metrics import percentile
+
+LAB_DIR = Path(__file__).parent.parent.parent / "Documents" / "Lab"
+BENCH_COLLECTION = "bench_protocols"
+# Chroma rejects larger add() batches
+ADD_BATCH = 5000
+# Chunks per synthetic protocol: the summary plus one per section
+SECTIONS = ["Inputs", "Outputs", "Workflow Steps", "Parameters",
+            "Quality Control", "Common Errors", "Notes", "Troubleshooting"]
+
+# Labeled queries over Documents/Lab/protocols. A query is answered when a
+# chunk of one of its (protocol, section) pairs is retrieved; section ""
+# is the protocol's summary chunk.
+LABELED_QUERIES = [
+    {"query": "How do I merge paired-end reads with OBITools?",
+     "relevant": [["OBITools Sequence Merging", ""], ["OBITools Sequence Merging", "Workflow Steps"],
+                  ["OBITools Sequence Merging", "Loop through samples"]]},
+    {"query": "obi align paired-end --merge",
+     "relevant": [["OBITools Sequence Merging", "Loop through samples"],
+                  ["OBITools Sequence Merging", "Workflow Steps"]]},
+    {"query": "obi: error: unrecognized arguments illuminapairedend",
+     "relevant": [["OBITools Sequence Merging", "Common Errors"]]},
+    {"query": "Which forward and reverse read files does the OBITools merge take?",
+     "relevant": [["OBITools Sequence Merging", "Inputs"]]},
+    {"query": "Warning: R2 not found for sample",
+     "relevant": [["OBITools Sequence Merging", "Loop through samples"]]},
+    {"query": "Denoise paired-end sequences with DADA2",
+     "relevant": [["QIIME2 Denoising (DADA2)", ""], ["QIIME2 Denoising (DADA2)", "Workflow Steps"]]},
+    {"query": "qiime dada2 denoise-paired --p-trunc-len-f --p-trim-left-f",
+     "relevant": [["QIIME2 Denoising (DADA2)", "Workflow Steps"]]},
+    {"query": "trunc_len_f default 0 means no truncation",
+     "relevant": [["QIIME2 Denoising (DADA2)", "Inputs"]]},
+    {"query": "The resulting library contains no sequences",
+     "relevant": [["QIIME2 Denoising (DADA2)", "Common Errors"]]},
+    {"query": "What does DADA2 output? table.qza rep-seqs.qza denoising-stats.qza",
+     "relevant": [["QIIME2 Denoising (DADA2)", "Outputs"]]},
+    {"query": "qiime metadata tabulate denoising stats visualization",
+     "relevant": [["QIIME2 Denoising (DADA2)", "Workflow Steps"]]},
+    {"query": "Import FASTQ files into a QIIME2 artifact with a manifest",
+     "relevant": [["QIIME2 Data Import", ""], ["QIIME2 Data Import", "Workflow Steps"]]},
+    {"query": "manifest header sample-id absolute-filepath direction",
+     "relevant": [["QIIME2 Data Import", "Create header (TSV)"], ["QIIME2 Data Import", "Inputs"],
+                  ["QIIME2 Data Import", "Common Errors"]]},
+    {"query": "manifest.tsv is not a PairedEndFastqManifestPhred33V2 file",
+     "relevant": [["QIIME2 Data Import", "Common Errors"]]},
+    {"query": "qiime tools import --input-format PairedEndFastqManifestPhred33V2",
+     "relevant": [["QIIME2 Data Import", "Workflow Steps"]]},
+    {"query": "如何用 DADA2 对双端序列去噪",
+     "relevant": [["QIIME2 Denoising (DADA2)", ""], ["QIIME2 Denoising (DADA2)", "Workflow Steps"]]},
+    {"query": "如何把测序数据导入 QIIME2",
+     "relevant": [["QIIME2 Data Import", ""], ["QIIME2 Data Import", "Workflow Steps"]]},
+]
+
+# Index configurations; hnsw keys are Chroma collection metadata
+CONFIGS = {
+    "chroma-hybrid": {"backend": "chroma", "hybrid": True},     # What the app runs
+    "chroma-vector": {"backend": "chroma", "hybrid": False},
+    "chroma-cosine": {"backend": "chroma", "hybrid": True, "hnsw": {"hnsw:space": "cosine"}},
+    "chroma-hnsw-m32": {"backend": "chroma", "hybrid": True,
+                        "hnsw": {"hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 100}},
+    "chroma-hnsw-fast": {"backend": "chroma", "hybrid": True,
+                         "hnsw": {"hnsw:M": 8, "hnsw:construction_ef": 50, "hnsw:search_ef": 10}},
+    "bm25": {"backend": "bm25"},
+    "faiss-flat": {"backend": "faiss"},
+}
+
+# Vocabulary of the synthetic protocols: the same tools and flags as the real
+# ones, so distractors compete on the terms the labeled queries use
+VOCABULARY = {
+    "obitools": {
+        "commands": ["obi import", "obi alignpairedend", "obi align paired-end", "obi grep", "obi uniq",
+                     "obi clean", "obi ecotag", "obi annotate", "obi ngsfilter", "obi export", "obi stats"],
+        "flags": ["-p", "--min-length", "--max-length", "--merge", "-R", "--ngsfilter", "--taxonomy",
+                  "-c count", "--fasta-output", "--only-keys"],
+        "files": ["{s}_R1.fastq.gz", "{s}_R2.fastq.gz", "{s}/reads", "{s}/merged", "ngsfilter.txt",
+                  "embl_refs", "{s}/uniq", "{s}/clean"],
+    },
+    "qiime2": {
+        "commands": ["qiime tools import", "qiime demux summarize", "qiime dada2 denoise-single",
+                     "qiime dada2 denoise-paired", "qiime feature-table summarize",
+                     "qiime feature-classifier classify-sklearn", "qiime vsearch cluster-features-de-novo",
+                     "qiime phylogeny align-to-tree-mafft-fasttree", "qiime diversity core-metrics-phylogenetic",
+                     "qiime taxa barplot", "qiime metadata tabulate"],
+        "flags": ["--i-table", "--i-reads", "--p-trunc-len", "--p-trim-left", "--p-n-threads",
+                  "--p-sampling-depth", "--m-metadata-file", "--o-classification", "--p-perc-identity",
+                  "--i-classifier", "--o-visualization"],
+        "files": ["table.qza", "rep-seqs.qza", "taxonomy.qza", "{s}-metadata.tsv", "classifier.qza",
+                  "rooted-tree.qza", "demux.qza", "{s}-manifest.tsv"],
+    },
+    "general": {
+        "commands": ["fastqc", "cutadapt", "seqkit stats", "vsearch --derep_fulllength", "blastn",
+                     "multiqc", "trimmomatic PE", "bowtie2"],
+        "flags": ["-o", "-t", "--threads", "-q 20", "--minlen", "-e 0.1", "--discard-untrimmed"],
+        "files": ["{s}.fastq", "{s}.fasta", "reports/", "{s}.trimmed.fq.gz", "refs.fasta"],
+    },
+}
+VERBS = ["Merge", "Filter", "Dereplicate", "Denoise", "Classify", "Summarize", "Cluster",
+         "Import", "Export", "Trim", "Annotate", "Rarefy", "Demultiplex", "Align"]
+OBJECTS = ["paired-end reads", "amplicon sequences", "feature tables", "taxonomy assignments", "ASVs",
+           "OTUs", "quality reports", "demultiplexed samples", "reference databases", "alpha diversity",
+           "chimeras", "primer sequences"]
+ERRORS = ["Plugin error from {cmd}", "No such file or directory: {file}", "MemoryError while running {cmd}",
+          "{flag} must be a positive integer", "Segmentation fault in {cmd}", "Permission denied: {file}",
+          "{file} is not a valid artifact", "Unknown option {flag}"]
+
+
+# --- Synthetic corpus ------------------------------------------------------------
+
+def _synthetic_protocol(rng: random.Random, number: int) -> str:
+    """One protocol in the structured Markdown format (no `#` lines inside code blocks)"""
+    tool = rng.choice(list(VOCABULARY))
+    vocab = VOCABULARY[tool]
+    verb, obj = rng.choice(VERBS), rng.choice(OBJECTS)
+    sample = f"S{rng.randint(1, 999)}"
+
+    def file_name() -> str:
+        return rng.choice(vocab["files"]).format(s=sample)
+
+    def command() -> str:
+        flags = " ".join(flag if " " in flag else f"{flag} {rng.randint(1, 500)}"
+                         for flag in rng.sample(vocab["flags"], k=min(3, len(vocab["flags"]))))
+        return f"{rng.choice(vocab['commands'])} {flags} {file_name()} {file_name()}"
+
+    tags = sorted({tool, verb.lower(), rng.choice(["paired-end", "single-end", "16s", "12s", "coi", "its"])})
+    lines = [
+        "---",
+        f'protocol_name: "{tool} {verb} {obj} #{number}"',
+        f'description: "{verb}s {obj} with {tool} for run {sample}."',
+        f"tags: {json.dumps(tags)}",
+        "---",
+    ]
+    for section in SECTIONS:
+        lines += ["", f"# {section}"]
+        if section in ("Inputs", "Outputs"):
+            lines += [f"- **{rng.choice(OBJECTS).capitalize()}**: `{file_name()}`" for _ in range(rng.randint(1, 3))]
+        elif section == "Workflow Steps":
+            for step in range(1, rng.randint(2, 3) + 1):
+                lines += [f"## Step {step}: {rng.choice(VERBS)} {rng.choice(OBJECTS)}",
+                          "**Command Template**:", "```bash", command(), "```"]
+        elif section in ("Common Errors", "Troubleshooting"):
+            error = rng.choice(ERRORS).format(cmd=rng.choice(vocab["commands"]), file=file_name(),
+                                              flag=rng.choice(vocab["flags"]))
+            lines += [f"- **Error**: `{error}`",
+                      f"  - **Fix**: Re-run `{command()}` after checking {rng.choice(OBJECTS)}."]
+        else:
+            lines += [f"- `{rng.choice(vocab['flags'])}`: controls how {rng.choice(OBJECTS)} are "
+                      f"{rng.choice(VERBS).lower()}ed (default: {rng.randint(0, 100)})"
+                      for _ in range(rng.randint(1, 4))]
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(dest: Path, chunks: int, seed: int = 0) -> Path:
+    """
+    Docs directory with the real Documents/Lab sources plus enough synthetic
+    protocols for about `chunks` chunks. Reused when it already exists.
+    """
+    marker = dest / ".complete"
+    if marker.exists():
+        return dest
+    if dest.exists():
+        shutil.rmtree(dest)
+    for path in iter_source_files(LAB_DIR):
+        target = dest / path.relative_to(LAB_DIR)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        real_chunks = len(load_documents(dest))
+    files = max(0, math.ceil((chunks - real_chunks) / (len(SECTIONS) + 1)))
+    rng = random.Random(seed)
+    protocol_dir = dest / "protocols"
+    protocol_dir.mkdir(parents=True, exist_ok=True)
+    for number in range(files):
+        (protocol_dir / f"synthetic_{number:06d}.md").write_text(_synthetic_protocol(rng, number), encoding="utf-8")
+    marker.touch()
+    return dest
+
+
+# --- Embeddings ----------------------------------------------------------------
+
+class HashingEmbeddings(Embeddings):
+    """Signed feature hashing of BM25 tokens; no model, so index costs can be measured on any machine"""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in tokenize(text):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves vectors embedded up front (as float32 arrays); anything else goes to the inner model"""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.documents: Dict[str, array] = {}
+        self.queries: Dict[str, array] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [text for text in texts if text not in self.documents]
+        if missing:
+            for text, vector in zip(missing, self.inner.embed_documents(missing)):
+                self.documents[text] = array('f', vector)
+        return [self.documents[text].tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if text not in self.queries:
+            self.queries[text] = array('f', self.inner.embed_query(text))
+        return self.queries[text].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def make_embedder(kind: str, workdir: Path) -> Embeddings:
+    """The configured model (vectors cached in the work dir, not the app's cache) or feature hashing"""
+    if kind == "hash":
+        return HashingEmbeddings()
+    config = load_config()
+    return CachedEmbeddings(model_name=config['rag']['embedding_model'],
+                            cache_path=str(workdir / "embedding_cache.sqlite3"), memory_items=1024,
+                            max_disk_mb=4096)
+
+
+def embed_corpus(embeddings: PrecomputedEmbeddings, docs: List[Any], batch: int = 256) -> Dict[str, float]:
+    """Embed chunks in batches and each labeled query on its own; returns timings"""
+    start = time.perf_counter()
+    texts = list(dict.fromkeys(doc.page_content for doc in docs))
+    for offset in range(0, len(texts), batch):
+        embeddings.embed_documents(texts[offset:offset + batch])
+    embed_s = time.perf_counter() - start
+
+    encode = []
+    for item in LABELED_QUERIES:
+        start = time.perf_counter()
+        embeddings.embed_query(item["query"])
+        encode.append(time.perf_counter() - start)
+    return {"embed_s": embed_s, "embed_chunks_per_s": len(texts) / embed_s if embed_s else 0.0,
+            "encode_p50_ms": percentile(encode, 50) * 1000}
+
+
+# --- Index backends --------------------------------------------------------------
+
+class ChromaBackend:
+    """Chroma collection (+ BM25 when hybrid) queried through LabKnowledgeRetriever"""
+
+    def __init__(self, path: str, embeddings: Embeddings, hybrid: bool = True,
+                 hnsw: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.embeddings = embeddings
+        self.hybrid = hybrid
+        self.hnsw = hnsw
+        self.retriever = None
+
+    def build(self, docs: List[Any]):
+        from langchain_chroma import Chroma
+
+        store = Chroma(embedding_function=self.embeddings, persist_directory=self.path,
+                       collection_name=BENCH_COLLECTION, collection_metadata=self.hnsw)
+        for offset in range(0, len(docs), ADD_BATCH):
+            batch = docs[offset:offset + ADD_BATCH]
+            store.add_documents(batch, ids=[doc.metadata["chunk_id"] for doc in batch])
+        if self.hybrid:
+            bm25 = BM25Index()
+            for doc in docs:
+                bm25.add(doc.metadata["chunk_id"], doc.page_content, doc.metadata)
+            bm25.save(os.path.join(self.path, "bm25_index.json"))
+
+    def open(self):
+        from backend.rag.retriever import LabKnowledgeRetriever
+
+        set_config_overrides({"rag": {
+            "persist_directory": self.path,
+            "collection_name": BENCH_COLLECTION,
+            "query_cache": {"enabled": False},
+            "hybrid": {"enabled": self.hybrid},
+        }})
+        set_embeddings(self.embeddings)
+        self.retriever = LabKnowledgeRetriever()
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        return self.retriever.retrieve_with_sources(query, k=k)
+
+    def close(self):
+        self.retriever = None
+        set_config_overrides(None)
+        set_embeddings(None)
+
+
+class BM25Backend:
+    """The lexical index on its own"""
+
+    def __init__(self, path: str, embeddings: Embeddings = None):
+        self.path = os.path.join(path, "bm25_index.json")
+        self.index = None
+
+    def build(self, docs: List[Any]):
+        index = BM25Index()
+        for doc in docs:
+            index.add(doc.metadata["chunk_id"], doc.page_content, doc.metadata)
+        index.save(self.path)
+
+    def open(self):
+        self.index = BM25Index.load(self.path)
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        return [self.index.docs[chunk_id]["metadata"] for chunk_id, _ in self.index.search(query, k=k)]
+
+    def close(self):
+        self.index = None
+
+
+class FaissBackend:
+    """Exact (flat) FAISS index, as a brute-force reference for the HNSW configurations"""
+
+    def __init__(self, path: str, embeddings: Embeddings):
+        self.path = path
+        self.embeddings = embeddings
+        self.store = None
+
+    def build(self, docs: List[Any]):
+        from langchain_community.vectorstores import FAISS
+
+        store = FAISS.from_documents(docs, self.embeddings, ids=[doc.metadata["chunk_id"] for doc in docs])
+        store.save_local(self.path)
+
+    def open(self):
+        from langchain_community.vectorstores import FAISS
+
+        self.store = FAISS.load_local(self.path, self.embeddings, allow_dangerous_deserialization=True)
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        return [doc.metadata for doc in self.store.similarity_search(query, k=k)]
+
+    def close(self):
+        self.store = None
+
+
+BACKENDS = {"chroma": ChromaBackend, "bm25": BM25Backend, "faiss": FaissBackend}
+
+
+def make_backend(spec: Dict[str, Any], path: str, embeddings: Embeddings):
+    options = {key: value for key, value in spec.items() if key != "backend"}
+    return BACKENDS[spec["backend"]](path, embeddings, **options)
+
+
+# --- Measurements ----------------------------------------------------------------
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / 1024 ** 2
+
+
+def first_relevant_rank(results: List[Dict[str, Any]], relevant: List[List[str]]) -> Optional[int]:
+    """Rank (0-based) of the first result from a relevant protocol section"""
+    wanted = {tuple(pair) for pair in relevant}
+    for rank, metadata in enumerate(results):
+        if (metadata.get("protocol"), metadata.get("section") or "") in wanted:
+            return rank
+    return None
+
+
+def check_labels(docs: List[Any]):
+    """Warn about labels that no longer match a chunk (a protocol was edited)"""
+    present = {(doc.metadata.get("protocol"), doc.metadata.get("section") or "") for doc in docs}
+    for item in LABELED_QUERIES:
+        missing = [pair for pair in item["relevant"] if tuple(pair) not in present]
+        if missing:
+            print(f"⚠️ Labels for '{item['query']}' not in the corpus: {missing}")
+
+
+def run_index_config(name: str, docs: List[Any], embeddings: Embeddings, workdir: Path,
+               ks: List[int], passes: int) -> Dict[str, Any]:
+    """Build, open and query one index configuration over the parsed chunks"""
+    path = str(workdir / f"index-{name}-{len(docs)}")
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    gc.collect()
+    rss_before = rss_mb()
+    backend = make_backend(CONFIGS[name], path, embeddings)
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            backend.build(docs)
+        index_s = time.perf_counter() - start
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            backend.open()
+        open_s = time.perf_counter() - start
+
+        top_k = max(ks)
+        start = time.perf_counter()
+        backend.search(LABELED_QUERIES[0]["query"], top_k)  # Lazy structures (postings, HNSW load)
+        first_query_s = time.perf_counter() - start
+
+        latencies, ranks = [], []
+        for repeat in range(passes):
+            for item in LABELED_QUERIES:
+                start = time.perf_counter()
+                results = backend.search(item["query"], top_k)
+                latencies.append(time.perf_counter() - start)
+                if repeat == 0:
+                    ranks.append(first_relevant_rank(results, item["relevant"]))
+        rss_after = rss_mb()
+    finally:
+        backend.close()
+
+    return {
+        "config": name,
+        "chunks": len(docs),
+        "index_s": index_s,
+        "index_chunks_per_s": len(docs) / index_s if index_s else 0.0,
+        "open_s": open_s,
+        "disk_mb": dir_size_mb(path),
+        "rss_mb": rss_after,
+        "rss_growth_mb": rss_after - rss_before,
+        "first_query_ms": first_query_s * 1000,
+        "query_p50_ms": percentile(latencies, 50) * 1000,
+        "query_p99_ms": percentile(latencies, 99) * 1000,
+        **{f"recall@{k}": sum(1 for rank in ranks if rank is not None and rank < k) / len(ranks) for k in ks},
+        "mrr": sum(1 / (rank + 1) for rank in ranks if rank is not None) / len(ranks),
+    }
+
+
+def run_size(size: int, configs: List[str], embedder: Embeddings, workdir: Path,
+             ks: List[int], passes: int, seed: int) -> Dict[str, Any]:
+    """Generate, parse and embed a corpus of `size` chunks, then run every configuration on it"""
+    docs_dir = generate_corpus(workdir / f"corpus-{size}-{seed}", size, seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        docs = load_documents(docs_dir)
+    parse_s = time.perf_counter() - start
+    check_labels(docs)
+
+    embeddings = PrecomputedEmbeddings(embedder)
+    result = {
+        "size": size,
+        "chunks": len(docs),
+        "parse_s": parse_s,
+        "parse_chunks_per_s": len(docs) / parse_s if parse_s else 0.0,
+        **embed_corpus(embeddings, docs),
+        "configs": [],
+    }
+    print(f"\n📚 {len(docs):,} chunks: parse {parse_s:.1f}s ({result['parse_chunks_per_s']:,.0f}/s), "
+          f"embed {result['embed_s']:.1f}s ({result['embed_chunks_per_s']:,.0f}/s), "
+          f"query encode p50 {result['encode_p50_ms']:.1f}ms")
+    for name in configs:
+        try:
+            result["configs"].append(run_index_config(name, docs, embeddings, workdir, ks, passes))
+        except ImportError as e:
+            print(f"⏭️ Skipping {name}: {e}")
+    return result
+
+
+def print_report(result: Dict[str, Any], ks: List[int]):
+    recall_header = "".join(f"{'R@' + str(k):>7}" for k in ks)
+    print(f"   {'config':<18}{'build s':>9}{'chunks/s':>10}{'disk MB':>9}{'RSS+ MB':>9}"
+          f"{'p50 ms':>8}{'p99 ms':>8}{recall_header}{'MRR':>7}")
+    for row in result["configs"]:
+        recalls = "".join(f"{row[f'recall@{k}']:>7.2f}" for k in ks)
+        print(f"   {row['config']:<18}{row['index_s']:>9.1f}{row['index_chunks_per_s']:>10,.0f}"
+              f"{row['disk_mb']:>9.1f}{row['rss_growth_mb']:>9.0f}{row['query_p50_ms']:>8.1f}"
+              f"{row['query_p99_ms']:>8.1f}{recalls}{row['mrr']:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG latency and recall benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Corpus sizes in chunks")
+    parser.add_argument("--config", action="append", choices=list(CONFIGS),
+                        help="Index configuration (repeatable; default: all)")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="Embedding model from config.yaml, or feature hashing (recall not representative)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="Cut-offs for recall@k")
+    parser.add_argument("--passes", type=int, default=20, help="Times the query set is run for latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep corpora, indexes and vectors here for reuse (default: temp dir)")
+    parser.add_argument("--save", metavar="JSON", help="Write results to a JSON file")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="labbio_rag_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    ks = sorted(set(args.k))
+    embedder = make_embedder(args.embedder, workdir)
+    results = []
+    try:
+        for size in args.sizes:
+            result = run_size(size, args.config or list(CONFIGS), embedder, workdir, ks, args.passes, args.seed)
+            print_report(result, ks)
+            results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"embedder": args.embedder, "results": results}, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
@@ -7,6 +7,34 @@ Loads the global config.yaml from the project root.
 import yaml
 import os
 from pathlib import Path
+from typing import Optional
+
+# Runtime overrides merged over config.yaml (see set_config_overrides)
+_overrides: dict = {}
+_overrides_version = 0
+
+def _merge(base: dict, patch: dict) -> dict:
+    """Recursive dict merge; values in patch win"""
+    merged = dict(base)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def set_config_overrides(patch: Optional[dict] = None):
+    """
+    Override config values in this process (e.g. the offline benchmark
+    turning off remote-only features). Pass None to clear.
+    """
+    global _overrides, _overrides_version
+    _overrides = patch or {}
+    _overrides_version += 1
+
+def overrides_version() -> int:
+    """Bumped on every set_config_overrides (lets callers cache derived settings)"""
+    return _overrides_version
 
 def load_config() -> dict:
     """
@@ -24,8 +52,14 @@ def load_config() -> dict:
         
     with open(config_path, 'r', encoding='utf-8') as f:
         config = yaml.safe_load(f)
-        
+    
+    if _overrides:
+        config = _merge(config, _overrides)
     return config
 
+def conda_env(tool: str) -> str:
+    """Conda env of a tool as listed in `executor.envs` ('obitools', 'qiime2', ...)"""
+    return load_config()['executor']['envs'][tool]
+
 # Global config instance
 config = load_config()
@@ -0,0 +1,134 @@
+"""
+BM25 Lexical Index
+==================
+Small inverted index built at ingest time and persisted next to the
+Chroma store. It complements vector search for exact command names and
+flags (`obi alignpairedend`, `--p-trunc-len-f`) that embeddings blur.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Command-line flags, dotted/hyphenated identifiers, plain words, CJK runs
+TOKEN_PATTERN = re.compile(
+    r"--?[a-z0-9][a-z0-9_.\-]*"
+    r"|[a-z0-9_]+(?:[.\-][a-z0-9_]+)*"
+    r"|[\u4e00-\u9fff]+"
+)
+CJK_PATTERN = re.compile(r"^[\u4e00-\u9fff]+$")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased tokens. Compound tokens are kept whole (so exact flags match
+    strongly) and also split into their parts; CJK runs become bigrams.
+    """
+    tokens = []
+    for raw in TOKEN_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.match(raw):
+            tokens.extend(raw[i:i + 2] for i in range(max(1, len(raw) - 1)))
+            continue
+        tokens.append(raw)
+        parts = [p for p in re.split(r"[\-_.]+", raw) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """Same semantics as the Chroma `where` built by the retriever"""
+    if not filters:
+        return True
+    for key, value in filters.items():
+        if key == "tags":
+            if not all(metadata.get(tag_field(tag)) for tag in value):
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+def tag_field(tag: str) -> str:
+    """Metadata field used to make a tag filterable (`tag_paired_end`)"""
+    return "tag_" + re.sub(r"[^a-z0-9]+", "_", str(tag).lower()).strip("_")
+
+
+class BM25Index:
+    """Okapi BM25 over chunk IDs, with stored content and metadata"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._postings: Optional[Dict[str, List[Tuple[str, int]]]] = None
+
+    def add(self, doc_id: str, content: str, metadata: Dict[str, Any]):
+        tokens = tokenize(content)
+        self.docs[doc_id] = {
+            "content": content,
+            "metadata": metadata,
+            "tf": dict(Counter(tokens)),
+            "length": len(tokens),
+        }
+        self._postings = None
+
+    def remove(self, doc_id: str):
+        if self.docs.pop(doc_id, None) is not None:
+            self._postings = None
+
+    def _build_postings(self):
+        postings = defaultdict(list)
+        for doc_id, doc in self.docs.items():
+            for term, tf in doc["tf"].items():
+                postings[term].append((doc_id, tf))
+        self._postings = dict(postings)
+        lengths = [doc["length"] for doc in self.docs.values()]
+        self._avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def search(self, query: str, k: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, score) pairs; only postings of query terms are visited"""
+        if self._postings is None:
+            self._build_postings()
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+
+        scores: Dict[str, float] = defaultdict(float)
+        allowed: Dict[str, bool] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                if doc_id not in allowed:
+                    allowed[doc_id] = matches_filters(self.docs[doc_id]["metadata"], filters)
+                if not allowed[doc_id]:
+                    continue
+                norm = 1 - self.b + self.b * self.docs[doc_id]["length"] / (self._avgdl or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load a saved index (empty index if the file does not exist)"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.docs = data.get("docs", {})
+        return index
@@ -0,0 +1,234 @@
+"""
+Cached Embeddings
+=================
+Content-addressed embedding cache shared by ingestion and retrieval.
+
+Vectors are keyed by (model name, kind, hash of normalized text) and kept
+in an on-disk SQLite store with an in-memory LRU in front of it, so
+unchanged protocol chunks and repeated worker queries are never sent
+through the MiniLM model twice. The disk store is trimmed by least recent
+use once it grows past `max_disk_mb`.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+from backend.utils.cache import LRUCache
+
+# Defaults used when config.yaml has no `rag.embedding_cache` section
+DEFAULT_CACHE_SETTINGS = {
+    "enabled": True,
+    "path": "./backend/rag/embedding_cache.sqlite3",
+    "memory_items": 4096,
+    "max_disk_mb": 512,
+}
+
+# Check the on-disk size after this many new vectors
+_EVICTION_CHECK_EVERY = 256
+
+
+def normalize_text(text: str) -> str:
+    """Normalization applied before hashing (unicode form + whitespace runs)"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an LRU + SQLite cache in front of the model"""
+
+    def __init__(self, model_name: str, cache_path: Optional[str] = None,
+                 memory_items: int = 4096, max_disk_mb: float = 512,
+                 model_kwargs: Optional[dict] = None):
+        self.model_name = model_name
+        self.model_kwargs = model_kwargs or {'device': 'cpu'}
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._memory = LRUCache(maxsize=memory_items)
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._inserts_since_check = 0
+        self.disk_hits = 0
+        self.computed = 0
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT, vector BLOB, size INTEGER, last_access REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+            self._db.commit()
+
+    @property
+    def model(self):
+        """The underlying HuggingFace model, loaded on the first cache miss"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    print(f"🧠 Loading Embedding Model ({self.model_name})...")
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        model_kwargs=self.model_kwargs
+                    )
+        return self._model
+
+    def _key(self, text: str, kind: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def _disk_get(self, keys: List[str]) -> Dict[str, List[float]]:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        with self._db_lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_access=? WHERE key=?",
+                                     [(now, key) for key in found])
+                self._db.commit()
+        return found
+
+    def _disk_put(self, items: Dict[str, List[float]]):
+        if self._db is None or not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array('f', vector).tobytes()
+            rows.append((key, self.model_name, blob, len(blob), now))
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+            self._inserts_since_check += len(rows)
+            if self._inserts_since_check >= _EVICTION_CHECK_EVERY:
+                self._inserts_since_check = 0
+                self._evict()
+
+    def _evict(self):
+        """Trim the disk store to ~90% of its limit, least recently used first (caller holds the lock)"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        target = int(self.max_disk_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            if total - freed <= target:
+                break
+            victims.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM embeddings WHERE key=?", victims)
+        self._db.commit()
+        print(f"🧹 Embedding cache: evicted {len(victims)} vectors ({freed // 1024} KiB)")
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        # 1. Memory
+        for key in set(keys):
+            vector = self._memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        # 2. Disk
+        on_disk = self._disk_get([key for key in set(keys) if key not in vectors])
+        self.disk_hits += len(on_disk)
+        for key, vector in on_disk.items():
+            self._memory.put(key, vector)
+        vectors.update(on_disk)
+
+        # 3. Model (one batched forward pass for all misses; sentence-transformers
+        #    encode queries and documents identically, so queries batch too)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            if kind == "query" and len(missing) == 1:
+                computed = [self.model.embed_query(text) for text in missing.values()]
+            else:
+                computed = self.model.embed_documents(list(missing.values()))
+            self.computed += len(computed)
+            new_items = dict(zip(missing.keys(), computed))
+            for key, vector in new_items.items():
+                self._memory.put(key, vector)
+            self._disk_put(new_items)
+            vectors.update(new_items)
+
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries with one batched forward pass for the misses"""
+        return self._embed(list(texts), "query")
+
+    def stats(self) -> Dict[str, int]:
+        """Cache effectiveness counters"""
+        return {
+            **{f"memory_{k}": v for k, v in self._memory.stats().items()},
+            "disk_hits": self.disk_hits,
+            "computed": self.computed,
+        }
+
+
+# 全局单例
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Get the shared cached embeddings object (model loads lazily)"""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                config = load_config()
+                settings = {**DEFAULT_CACHE_SETTINGS, **config['rag'].get('embedding_cache', {})}
+                _embeddings = CachedEmbeddings(
+                    model_name=config['rag']['embedding_model'],
+                    cache_path=settings['path'] if settings['enabled'] else None,
+                    memory_items=settings['memory_items'],
+                    max_disk_mb=settings['max_disk_mb']
+                )
+    return _embeddings
+
+
+def set_embeddings(embeddings):
+    """Replace the shared embeddings object (the RAG benchmark injects its own); None resets it"""
+    global _embeddings
+    with _embeddings_lock:
+        _embeddings = embeddings
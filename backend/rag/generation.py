@@ -0,0 +1,34 @@
+"""
+Index Generation Counter
+========================
+A monotonically increasing number stored next to the Chroma persist
+directory. Ingestion bumps it whenever the collection changes; readers
+(e.g. the retriever query cache) compare it to detect a stale index.
+"""
+
+import os
+
+GENERATION_FILENAME = "index_generation"
+
+
+def generation_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, GENERATION_FILENAME)
+
+
+def read_index_generation(persist_dir: str) -> int:
+    """Current generation (0 if the index was never stamped)"""
+    try:
+        with open(generation_path(persist_dir), 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_index_generation(persist_dir: str, generation: int):
+    """Atomically store a new generation"""
+    os.makedirs(persist_dir, exist_ok=True)
+    path = generation_path(persist_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(str(generation))
+    os.replace(tmp_path, path)
@@ -2,14 +2,18 @@
 RAG Ingestion with Structured Markdown Support
 ==============================================
 Ingests structured protocols (.md) with YAML frontmatter.
+Incremental by default: only changed chunks are embedded (use --full to rebuild).
 """
 
 import os
 import re
+import json
+import shutil
+import hashlib
+import argparse
 import yaml
 from typing import List, Dict, Any
 from pathlib import Path
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 import sys
@@ -17,12 +21,44 @@ import sys
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 from backend.config import load_config
+from backend.rag.embeddings import get_embeddings
+from backend.rag.generation import read_index_generation, write_index_generation
+from backend.rag.bm25 import BM25Index, tag_field
 
 # Initialize Configuration
 config = load_config()
 PERSIST_DIRECTORY = config['rag']['persist_directory']
 COLLECTION_NAME = config['rag']['collection_name']
 EMBEDDING_MODEL = config['rag']['embedding_model']
+# Records which chunks of which source files are in the collection
+MANIFEST_PATH = os.path.join(PERSIST_DIRECTORY, "ingest_manifest.json")
+# Lexical index for hybrid retrieval, kept in sync with the collection
+BM25_PATH = os.path.join(PERSIST_DIRECTORY, "bm25_index.json")
+# Bump when chunking or chunk metadata changes, so existing stores are rebuilt
+INDEX_SCHEMA_VERSION = 3
+
+def infer_tool(*hints: str) -> str:
+    """Which tool a protocol belongs to, from its name, tags and file name"""
+    text = " ".join(hints).lower()
+    if "qiime" in text or "dada2" in text:
+        return "qiime2"
+    if "obi" in text:
+        return "obitools"
+    return "general"
+
+def protocol_metadata(file_path: Path, protocol_name: str, tags: List[str]) -> Dict[str, Any]:
+    """
+    Chunk metadata used for scoped retrieval.
+    Chroma metadata cannot hold lists, so each tag is also stored as a
+    boolean `tag_<name>` field that `where` filters can match.
+    """
+    return {
+        "source": file_path.name,
+        "protocol": protocol_name,
+        "tool": infer_tool(protocol_name, file_path.name, *tags),
+        "tags": ", ".join(tags),
+        **{tag_field(tag): True for tag in tags}
+    }
 
 def parse_markdown_protocol(file_path: Path) -> List[Document]:
     """
@@ -49,6 +85,9 @@ def parse_markdown_protocol(file_path: Path) -> List[Document]:
     description = frontmatter.get("description", "")
     tags = frontmatter.get("tags", [])
     
+    # Metadata shared by every chunk; tags become real filterable fields
+    base_metadata = protocol_metadata(file_path, protocol_name, tags)
+    
     # 2. Split by Headers (# )
     # We want to keep the header in the chunk
     chunks = []
@@ -58,10 +97,8 @@ def parse_markdown_protocol(file_path: Path) -> List[Document]:
     chunks.append(Document(
         page_content=summary_text,
         metadata={
-            "source": file_path.name,
-            "type": "protocol_summary",
-            "protocol": protocol_name,
-            "tags": str(tags)
+            **base_metadata,
+            "type": "protocol_summary"
         }
     ))
     
@@ -72,8 +109,10 @@ def parse_markdown_protocol(file_path: Path) -> List[Document]:
     current_header = "Introduction"
     current_text = []
     
-    for section in sections:
-        if section.strip().startswith('#'):
+    # re.split puts the captured headers at odd indexes; checking for a leading '#'
+    # instead would also take a body that opens with a '## Step' subheading
+    for i, section in enumerate(sections):
+        if i % 2 == 1:
             # Save previous section
             if current_text:
                 text = "\n".join(current_text).strip()
@@ -81,11 +120,9 @@ def parse_markdown_protocol(file_path: Path) -> List[Document]:
                     chunks.append(Document(
                         page_content=f"{current_header}\n{text}", # Include header in content for context
                         metadata={
-                            "source": file_path.name,
+                            **base_metadata,
                             "type": "protocol_section",
-                            "protocol": protocol_name,
-                            "section": current_header,
-                            "tags": str(tags)
+                            "section": current_header
                         }
                     ))
             # Start new section
@@ -101,71 +138,181 @@ def parse_markdown_protocol(file_path: Path) -> List[Document]:
             chunks.append(Document(
                 page_content=f"{current_header}\n{text}",
                 metadata={
-                    "source": file_path.name,
+                    **base_metadata,
                     "type": "protocol_section",
-                    "protocol": protocol_name,
-                    "section": current_header,
-                    "tags": str(tags)
+                    "section": current_header
                 }
             ))
             
     return chunks
 
-def load_documents(docs_dir: Path) -> List[Document]:
-    """Load all documents"""
-    documents = []
-    
-    # Load new Structured Protocols
+def load_legacy_text(file_path: Path) -> List[Document]:
+    """Load a legacy plain-text protocol as a single chunk"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [Document(
+            page_content=f.read(),
+            metadata={
+                **protocol_metadata(file_path, file_path.stem, []),
+                "type": "legacy"
+            }
+        )]
+
+def iter_source_files(docs_dir: Path) -> List[Path]:
+    """All knowledge base source files: structured protocols and legacy text"""
+    files = []
     protocol_dir = docs_dir / "protocols"
     if protocol_dir.exists():
-        for file_path in protocol_dir.glob("*.md"):
-            print(f"📄 Processing Structured Protocol: {file_path.name}")
-            docs = parse_markdown_protocol(file_path)
-            documents.extend(docs)
-            
+        files.extend(sorted(protocol_dir.glob("*.md")))
     # Load Legacy Text Protocols (Optional: Keep them for now or deprecate)
-    # For now, let's keep them but maybe prioritize the new ones
-    for file_path in docs_dir.glob("*.txt"):
+    files.extend(sorted(docs_dir.glob("*.txt")))
+    return files
+
+def load_file(file_path: Path, docs_dir: Path) -> List[Document]:
+    """Parse one source file into chunks tagged with stable chunk IDs"""
+    if file_path.suffix == ".md":
+        print(f"📄 Processing Structured Protocol: {file_path.name}")
+        docs = parse_markdown_protocol(file_path)
+    else:
         print(f"📄 Processing Legacy Protocol: {file_path.name}")
-        # Reuse old logic (simplified here)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            documents.append(Document(
-                page_content=f.read(),
-                metadata={"source": file_path.name, "type": "legacy"}
-            ))
-            
+        docs = load_legacy_text(file_path)
+        
+    rel_path = file_path.relative_to(docs_dir).as_posix()
+    unique = {}
+    for doc in docs:
+        doc.metadata["source_path"] = rel_path
+        chunk_id = make_chunk_id(rel_path, doc)
+        doc.metadata["chunk_id"] = chunk_id
+        unique.setdefault(chunk_id, doc)  # identical section + content is indexed once
+    return list(unique.values())
+
+def load_documents(docs_dir: Path) -> List[Document]:
+    """Load all documents"""
+    documents = []
+    for file_path in iter_source_files(docs_dir):
+        documents.extend(load_file(file_path, docs_dir))
     return documents
 
-def ingest_knowledge_base():
-    """Main ingestion function"""
+def make_chunk_id(source_path: str, doc: Document) -> str:
+    """Stable chunk ID: source path + section + content hash"""
+    section = doc.metadata.get("section") or doc.metadata.get("type", "")
+    content_hash = hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+    key = f"{source_path}\x00{section}\x00{content_hash}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def file_sha256(file_path: Path) -> str:
+    """Content hash of a source file"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest() -> Dict[str, Any]:
+    """Manifest of what is currently indexed (empty if missing or unreadable)"""
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Could not read ingest manifest: {e}")
+        return {}
+
+def save_manifest(files: Dict[str, Dict[str, Any]]):
+    """Persist the manifest next to the Chroma database"""
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    manifest = {
+        "embedding_model": EMBEDDING_MODEL,
+        "collection_name": COLLECTION_NAME,
+        "schema_version": INDEX_SCHEMA_VERSION,
+        "files": files
+    }
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+def ingest_knowledge_base(full: bool = False):
+    """
+    Main ingestion function.
+    
+    Only chunks of files that changed since the last run are embedded and
+    upserted; chunks of edited or removed files are deleted. A full rebuild
+    happens with `full=True`, when no manifest exists yet, or when the
+    embedding model / collection changed.
+    """
     docs_dir = Path(__file__).parent.parent.parent / "Documents" / "Lab"
     
-    print(f"📂 Loading documents from {docs_dir}...")
-    documents = load_documents(docs_dir)
-    print(f"🔪 Split into {len(documents)} chunks.")
+    manifest = load_manifest()
+    # Read before a full rebuild wipes the directory, so the counter keeps increasing
+    generation = read_index_generation(PERSIST_DIRECTORY)
+    if not full and (manifest.get("embedding_model") != EMBEDDING_MODEL
+                     or manifest.get("collection_name") != COLLECTION_NAME
+                     or manifest.get("schema_version") != INDEX_SCHEMA_VERSION
+                     or not os.path.exists(BM25_PATH)):
+        if manifest:
+            print("⚠️ Embedding model, collection or index schema changed, rebuilding from scratch.")
+        full = True
+    indexed = {} if full else manifest.get("files", {})
     
-    print(f"🧠 Initializing Embedding Model ({EMBEDDING_MODEL})...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'}
-    )
+    print(f"📂 Scanning documents in {docs_dir}...")
+    current = {}
+    to_add: List[Document] = []
+    to_delete: List[str] = []
     
-    print(f"📦 Creating ChromaDB in {PERSIST_DIRECTORY}...")
-    # Note: This will append to existing DB. To rebuild, delete the folder first.
-    # For this upgrade, we should probably clear the DB to avoid duplicates/legacy mess.
-    import shutil
-    if os.path.exists(PERSIST_DIRECTORY):
+    for file_path in iter_source_files(docs_dir):
+        rel_path = file_path.relative_to(docs_dir).as_posix()
+        digest = file_sha256(file_path)
+        previous = indexed.get(rel_path)
+        if previous and previous.get("sha256") == digest:
+            current[rel_path] = previous
+            continue
+        
+        docs = load_file(file_path, docs_dir)
+        new_ids = [doc.metadata["chunk_id"] for doc in docs]
+        old_ids = set(previous.get("chunk_ids", [])) if previous else set()
+        to_add.extend(doc for doc in docs if doc.metadata["chunk_id"] not in old_ids)
+        to_delete.extend(old_ids - set(new_ids))
+        current[rel_path] = {"sha256": digest, "chunk_ids": new_ids}
+        
+    for rel_path in set(indexed) - set(current):
+        print(f"🗑️ Removed source: {rel_path}")
+        to_delete.extend(indexed[rel_path].get("chunk_ids", []))
+    
+    if not full and not to_add and not to_delete:
+        if current != indexed:
+            save_manifest(current)  # e.g. a file was touched but its chunks are identical
+        print("✅ Knowledge Base is up to date, nothing to embed.")
+        return
+    print(f"🔪 {len(to_add)} chunks to embed, {len(to_delete)} to delete.")
+    
+    if full and os.path.exists(PERSIST_DIRECTORY):
         print("🧹 Clearing old Knowledge Base...")
         shutil.rmtree(PERSIST_DIRECTORY)
-        
-    vectorstore = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
+    
+    # Update the BM25 index with the same delta as the vector store
+    bm25 = BM25Index() if full else BM25Index.load(BM25_PATH)
+    for chunk_id in to_delete:
+        bm25.remove(chunk_id)
+    for doc in to_add:
+        bm25.add(doc.metadata["chunk_id"], doc.page_content, doc.metadata)
+    
+    # Cached wrapper: chunks embedded by earlier runs are served from disk
+    embeddings = get_embeddings()
+    
+    print(f"📦 Opening ChromaDB in {PERSIST_DIRECTORY}...")
+    vectorstore = Chroma(
+        embedding_function=embeddings,
         persist_directory=PERSIST_DIRECTORY,
         collection_name=COLLECTION_NAME
     )
     
-    print("✅ Knowledge Base Rebuilt Successfully!")
+    if to_delete:
+        vectorstore.delete(ids=to_delete)
+    if to_add:
+        # Chroma upserts by ID, so re-adding an existing chunk is harmless
+        vectorstore.add_documents(to_add, ids=[doc.metadata["chunk_id"] for doc in to_add])
+    
+    bm25.save(BM25_PATH)
+    save_manifest(current)
+    # Invalidate retriever query caches
+    write_index_generation(PERSIST_DIRECTORY, generation + 1)
+    print("✅ Knowledge Base Rebuilt Successfully!" if full else "✅ Knowledge Base Updated Successfully!")
     
     # Test Retrieval
     print("\n🔎 Testing Retrieval (Query: 'QIIME2 import manifest format')...")
@@ -173,6 +320,10 @@ def ingest_knowledge_base():
     for doc in results:
         print(f"--- Source: {doc.metadata['source']} ---")
         print(doc.page_content[:200] + "...")
+    print(f"📈 Embedding cache: {embeddings.stats()}")
 
 if __name__ == "__main__":
-    ingest_knowledge_base()
+    parser = argparse.ArgumentParser(description="Ingest lab protocols into the knowledge base")
+    parser.add_argument("--full", action="store_true", help="Force a full rebuild of the vector store")
+    args = parser.parse_args()
+    ingest_knowledge_base(full=args.full)
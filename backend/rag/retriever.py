@@ -4,12 +4,63 @@ RAG Retriever Module
 提供检索接口，用于Agent查询知识库。
 """
 
-import yaml
-from pathlib import Path
-from typing import List
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
+from backend.rag.embeddings import get_embeddings
+from backend.rag.generation import read_index_generation
+from backend.rag.bm25 import BM25Index, tag_field
+from backend.utils.cache import LRUCache
+from backend.utils.tracing import span
+
+# config.yaml 中没有 `rag.query_cache` 时的默认值
+DEFAULT_QUERY_CACHE_SETTINGS = {
+    "enabled": True,
+    "max_entries": 256,
+    "ttl_seconds": 600,
+    "generation_check_interval": 2.0,
+}
+
+# config.yaml 中没有 `rag.hybrid` 时的默认值
+DEFAULT_HYBRID_SETTINGS = {
+    "enabled": True,
+    "alpha": 0.5,      # 向量得分权重, 其余为 BM25 权重
+    "fetch_k": 20,     # 每路召回的候选数
+}
+
+def build_filters(tool: Optional[str] = None, protocol: Optional[str] = None,
+                  tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """将检索范围参数整理为过滤条件字典"""
+    filters = {}
+    if tool:
+        filters["tool"] = tool
+    if protocol:
+        filters["protocol"] = protocol
+    if tags:
+        filters["tags"] = sorted(tags)
+    return filters
+
+def to_chroma_where(filters: Dict[str, Any]) -> Optional[dict]:
+    """过滤条件 -> Chroma `where` 表达式 (标签对应 tag_<name> 布尔字段)"""
+    clauses = []
+    for key, value in filters.items():
+        if key == "tags":
+            clauses.extend({tag_field(tag): {"$eq": True}} for tag in value)
+        else:
+            clauses.append({key: {"$eq": value}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _normalize(scores: Dict[str, float]) -> Dict[str, float]:
+    """Min-max 归一化到 [0, 1]"""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
 
 class LabKnowledgeRetriever:
     """实验室知识库检索器"""
@@ -17,11 +68,26 @@ class LabKnowledgeRetriever:
     def __init__(self):
         """初始化检索器"""
         self.config = self._load_config()
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-            model_kwargs={'device': 'cpu'}
-        )
+        # 与 ingest 共享的带缓存嵌入模型 (重复查询不再重复编码)
+        self.embeddings = get_embeddings()
+        self.persist_dir = self.config['rag']['persist_directory']
+        
+        # 查询结果缓存: (query, k, filters) -> results, ingest 更新索引代数后自动失效
+        cache_cfg = {**DEFAULT_QUERY_CACHE_SETTINGS, **self.config['rag'].get('query_cache', {})}
+        self._cache = LRUCache(maxsize=cache_cfg['max_entries'], ttl=cache_cfg['ttl_seconds'])
+        self._cache_enabled = cache_cfg['enabled']
+        self._generation = read_index_generation(self.persist_dir)
+        self._generation_checked = 0.0
+        self._generation_check_interval = cache_cfg['generation_check_interval']
+        self.invalidations = 0
+        
+        hybrid_cfg = {**DEFAULT_HYBRID_SETTINGS, **self.config['rag'].get('hybrid', {})}
+        self.hybrid_enabled = hybrid_cfg['enabled']
+        self.alpha = float(hybrid_cfg['alpha'])
+        self.fetch_k = int(hybrid_cfg['fetch_k'])
+        
         self.vectorstore = self._load_vectorstore()
+        self.bm25 = self._load_bm25()
     
     def _load_config(self) -> dict:
         """加载配置"""
@@ -30,6 +96,8 @@ class LabKnowledgeRetriever:
     
     def _load_vectorstore(self):
         """加载向量库"""
+        from langchain_community.vectorstores import Chroma  # 延迟导入: chromadb 较重
+        
         persist_dir = self.config['rag']['persist_directory']
         collection_name = self.config['rag']['collection_name']
         
@@ -40,40 +108,204 @@ class LabKnowledgeRetriever:
         )
         return vectorstore
     
-    def retrieve(self, query: str, k: int = 3) -> List[str]:
+    def _load_bm25(self) -> BM25Index:
+        """加载 ingest 时构建的 BM25 倒排索引 (不存在时为空, 退化为纯向量检索)"""
+        return BM25Index.load(os.path.join(self.persist_dir, "bm25_index.json"))
+    
+    def _check_generation(self):
+        """索引代数变化时清空缓存并重新打开向量库 (限频检查, 避免每次读文件)"""
+        now = time.monotonic()
+        if now - self._generation_checked < self._generation_check_interval:
+            return
+        self._generation_checked = now
+        generation = read_index_generation(self.persist_dir)
+        if generation != self._generation:
+            print(f"🔄 Knowledge base changed (generation {self._generation} -> {generation}), clearing query cache")
+            self._generation = generation
+            self._cache.clear()
+            self.invalidations += 1
+            self.vectorstore = self._load_vectorstore()
+            self.bm25 = self._load_bm25()
+    
+    def _cached(self, key: tuple, search: Callable[[], list]) -> list:
+        """从缓存取结果, 未命中则执行检索并写入缓存"""
+        if not self._cache_enabled:
+            return search()
+        self._check_generation()
+        results = self._cache.get(key)
+        if results is None:
+            results = search()
+            self._cache.put(key, results)
+        return list(results)
+    
+    def _vector_hits(self, queries: List[str], n_results: int,
+                     where: Optional[dict]) -> List[List[Tuple[Any, float]]]:
+        """
+        批量向量检索: 所有查询一次批量编码, 一次 Chroma 查询
+        
+        Returns:
+            每个查询的 (Document, score) 列表, score 越大越相关
+        """
+        from langchain_core.documents import Document
+        
+        vectors = self.embeddings.embed_queries(queries)
+        response = self.vectorstore._collection.query(
+            query_embeddings=vectors,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        hits = []
+        for documents, metadatas, distances in zip(response["documents"], response["metadatas"], response["distances"]):
+            hits.append([
+                (Document(page_content=content, metadata=metadata or {}), -distance)
+                for content, metadata, distance in zip(documents, metadatas, distances)
+            ])
+        return hits
+    
+    def _fuse(self, query: str, k: int, filters: Dict[str, Any],
+              vector_hits: List[Tuple[Any, float]]) -> list:
+        """
+        向量召回与 BM25 召回按归一化得分加权融合
+        (alpha * 向量 + (1 - alpha) * BM25)
+        """
+        from langchain_core.documents import Document
+        
+        docs: Dict[str, Any] = {}
+        vector_scores: Dict[str, float] = {}
+        for doc, score in vector_hits:
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            docs[key] = doc
+            vector_scores[key] = score
+        lexical_scores = dict(self.bm25.search(query, k=max(k, self.fetch_k), filters=filters))
+        
+        vector_scores = _normalize(vector_scores)
+        lexical_scores = _normalize(lexical_scores)
+        combined = {
+            key: self.alpha * vector_scores.get(key, 0.0) + (1 - self.alpha) * lexical_scores.get(key, 0.0)
+            for key in set(vector_scores) | set(lexical_scores)
+        }
+        ranked = sorted(combined, key=combined.get, reverse=True)[:k]
+        
+        results = []
+        for key in ranked:
+            if key not in docs:
+                # 仅被 BM25 命中的片段, 直接用索引中保存的内容
+                stored = self.bm25.docs[key]
+                docs[key] = Document(page_content=stored["content"], metadata=stored["metadata"])
+            results.append(docs[key])
+        return results
+    
+    def _search_many(self, queries: List[str], k: int, filters: Dict[str, Any]) -> List[list]:
+        """在过滤范围内检索多个查询 (混合检索时每个查询再与 BM25 融合)"""
+        if not queries:
+            return []
+        # 旧版向量库 (未带 tool/tag_* 元数据且无 BM25 索引): 无法过滤, 请重新运行 ingest
+        legacy = not self.bm25.docs
+        hybrid = self.hybrid_enabled and not legacy
+        where = None if legacy else to_chroma_where(filters)
+        
+        hits = self._vector_hits(queries, max(k, self.fetch_k) if hybrid else k, where)
+        if not hybrid:
+            return [[doc for doc, _ in query_hits[:k]] for query_hits in hits]
+        return [self._fuse(query, k, filters, query_hits) for query, query_hits in zip(queries, hits)]
+    
+    def _search(self, query: str, k: int, filters: Dict[str, Any]) -> list:
+        return self._search_many([query], k, filters)[0]
+    
+    @staticmethod
+    def _cache_key(query: str, k: int, filters: Dict[str, Any]) -> tuple:
+        return (query, k, tuple(sorted((name, str(value)) for name, value in filters.items())))
+    
+    def _search_cached(self, query: str, k: int, filters: Dict[str, Any]) -> list:
+        return self._cached(self._cache_key(query, k, filters), lambda: self._search(query, k, filters))
+    
+    def retrieve(self, query: str, k: int = 3, tool: Optional[str] = None,
+                 protocol: Optional[str] = None, tags: Optional[List[str]] = None) -> List[str]:
         """
         检索相关文档片段
         
         Args:
             query: 查询文本
             k: 返回的结果数量
+            tool: 仅检索该工具的协议 ('obitools', 'qiime2', 'general')
+            protocol: 仅检索该协议 (protocol_name)
+            tags: 仅检索带有全部这些标签的片段
             
         Returns:
             相关文档内容列表
         """
-        results = self.vectorstore.similarity_search(query, k=k)
-        return [doc.page_content for doc in results]
+        with span("retrieval", kind="retrieval", k=k, tool=tool, queries=1) as attrs:
+            docs = self._search_cached(query, k, build_filters(tool, protocol, tags))
+            attrs["hits"] = len(docs)
+        return [doc.page_content for doc in docs]
     
-    def retrieve_with_sources(self, query: str, k: int = 3) -> List[dict]:
+    def retrieve_with_sources(self, query: str, k: int = 3, tool: Optional[str] = None,
+                              protocol: Optional[str] = None, tags: Optional[List[str]] = None) -> List[dict]:
         """
         检索相关文档片段（带来源信息）
         
         Args:
             query: 查询文本
             k: 返回的结果数量
+            tool / protocol / tags: 检索范围, 同 retrieve
             
         Returns:
             包含content和source的字典列表
         """
-        results = self.vectorstore.similarity_search(query, k=k)
+        results = self._search_cached(query, k, build_filters(tool, protocol, tags))
         return [
             {
                 'content': doc.page_content,
                 'source': doc.metadata.get('source', 'unknown'),
-                'type': doc.metadata.get('type', 'unknown')
+                'type': doc.metadata.get('type', 'unknown'),
+                'protocol': doc.metadata.get('protocol', 'unknown'),
+                'section': doc.metadata.get('section', '')
             }
             for doc in results
         ]
+    
+    def retrieve_many(self, queries: List[str], k: int = 3, tool: Optional[str] = None,
+                      protocol: Optional[str] = None, tags: Optional[List[str]] = None) -> List[List[str]]:
+        """
+        批量检索: 未命中缓存的查询一次批量编码并一次批量相似度检索
+        
+        Args:
+            queries: 查询文本列表
+            k / tool / protocol / tags: 同 retrieve
+            
+        Returns:
+            与 queries 顺序一致的文档内容列表
+        """
+        with span("retrieval", kind="retrieval", k=k, tool=tool, queries=len(queries)) as attrs:
+            results = self._retrieve_many(list(queries), k, build_filters(tool, protocol, tags), attrs)
+        return results
+    
+    def _retrieve_many(self, queries: List[str], k: int, filters: Dict[str, Any],
+                       attrs: Dict[str, Any]) -> List[List[str]]:
+        if not self._cache_enabled:
+            return [[doc.page_content for doc in docs] for docs in self._search_many(queries, k, filters)]
+        
+        self._check_generation()
+        results: Dict[str, list] = {}
+        for query in queries:
+            cached = self._cache.get(self._cache_key(query, k, filters))
+            if cached is not None:
+                results[query] = cached
+        missing = list(dict.fromkeys(query for query in queries if query not in results))
+        attrs["cache_misses"] = len(missing)
+        for query, docs in zip(missing, self._search_many(missing, k, filters)):
+            self._cache.put(self._cache_key(query, k, filters), docs)
+            results[query] = docs
+        return [[doc.page_content for doc in results[query]] for query in queries]
+    
+    def cache_stats(self) -> dict:
+        """查询缓存命中统计 (用于监控)"""
+        return {
+            **self._cache.stats(),
+            "generation": self._generation,
+            "invalidations": self.invalidations,
+        }
 
 # 全局单例
 _retriever = None
@@ -85,6 +317,11 @@ def get_retriever() -> LabKnowledgeRetriever:
         _retriever = LabKnowledgeRetriever()
     return _retriever
 
+def set_retriever(retriever):
+    """替换检索器单例 (基准测试注入离线实现; None 则重置)"""
+    global _retriever
+    _retriever = retriever
+
 if __name__ == "__main__":
     # 测试检索器
     print("Testing Retriever...")
@@ -100,3 +337,6 @@ if __name__ == "__main__":
         print(f"[{i+1}] Source: {result['source']}")
         print(f"    Content: {result['content'][:150]}...")
         print()
+    
+    retriever.retrieve_with_sources(query, k=2)
+    print(f"Cache: {retriever.cache_stats()}")
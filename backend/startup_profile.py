@@ -0,0 +1,128 @@
+"""
+Startup Profiler
+================
+Reports what the backend costs at import time and on first use.
+
+Usage:
+    python -m backend.startup_profile            # imports + local first calls
+    python -m backend.startup_profile --remote   # also the first SSH/LLM round trips
+
+Import costs are measured in a fresh interpreter per module, so each number
+is what that module costs on its own in a cold process (e.g. a Streamlit
+start or a test run). First-call costs are measured in this process, in
+dependency order, so each number is the extra cost of that step.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+# Add project root to sys.path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+# Modules whose standalone import cost we care about
+IMPORT_TARGETS = [
+    "backend.config",
+    "backend.utils.executor_client",
+    "backend.utils.llm_client",
+    "backend.rag.retriever",
+    "backend.agents.supervisor",
+    "backend.agents.graph",
+    # Heavy third-party dependencies, for comparison
+    "langgraph.graph",
+    "langchain_openai",
+    "chromadb",
+    "sentence_transformers",
+    "paramiko",
+]
+
+
+def measure_import(module: str) -> Tuple[float, str]:
+    """Import a module in a fresh interpreter; returns (seconds, error)"""
+    code = (
+        "import sys, time; sys.path.insert(0, {root!r}); "
+        "t = time.perf_counter(); import {module}; "
+        "print(time.perf_counter() - t)"
+    ).format(root=str(ROOT_DIR), module=module)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT_DIR)
+    if proc.returncode != 0:
+        last_line = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+        return 0.0, last_line
+    return float(proc.stdout.strip().splitlines()[-1]), ""
+
+
+def measure_call(label: str, func: Callable) -> Tuple[str, float, str]:
+    """Time one first call; failures are reported, not raised"""
+    start = time.perf_counter()
+    try:
+        func()
+        error = ""
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return label, time.perf_counter() - start, error
+
+
+def first_call_steps(remote: bool) -> List[Tuple[str, Callable]]:
+    """First-use steps, in the order a real request would hit them"""
+    from backend.utils.executor_client import get_executor_client
+    from backend.utils.llm_client import get_llm
+    from backend.rag.embeddings import get_embeddings
+    from backend.rag.retriever import get_retriever
+    from backend.agents.graph import create_graph
+
+    steps = [
+        ("create_graph()", create_graph),
+        ("get_executor_client()", get_executor_client),
+        ("get_llm()", get_llm),
+        ("get_retriever() (open Chroma)", get_retriever),
+        ("embedding model load", lambda: get_embeddings().model),
+        ("first retrieve()", lambda: get_retriever().retrieve("OBITools merge paired-end reads", k=3)),
+        ("second retrieve() (warm)", lambda: get_retriever().retrieve("OBITools merge paired-end reads", k=3)),
+    ]
+    if remote:
+        steps += [
+            ("SSH health check (connect)", get_executor_client().check_health),
+            ("SSH health check (pooled)", get_executor_client().check_health),
+            ("first LLM call", lambda: get_llm().invoke("Reply with OK.")),
+        ]
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import and first-call costs")
+    parser.add_argument("--remote", action="store_true",
+                        help="Also time the first SSH connection and LLM request")
+    parser.add_argument("--skip-imports", action="store_true",
+                        help="Only measure first-call costs")
+    args = parser.parse_args()
+
+    if not args.skip_imports:
+        print("⏱️ Import cost (fresh interpreter per module)")
+        print(f"{'module':<36} {'seconds':>8}")
+        for module in IMPORT_TARGETS:
+            seconds, error = measure_import(module)
+            if error:
+                print(f"{module:<36} {'n/a':>8}  ⚠️ {error}")
+            else:
+                print(f"{module:<36} {seconds:>8.3f}")
+        print()
+
+    print("⏱️ First-call cost (this process, cumulative order)")
+    print(f"{'step':<36} {'seconds':>8}")
+    try:
+        steps = first_call_steps(args.remote)
+    except Exception as e:
+        print(f"❌ Could not import the backend: {e}")
+        return
+    for label, func in steps:
+        label, seconds, error = measure_call(label, func)
+        suffix = f"  ⚠️ {error}" if error else ""
+        print(f"{label:<36} {seconds:>8.3f}{suffix}")
+
+
+if __name__ == "__main__":
+    main()
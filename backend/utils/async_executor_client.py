@@ -0,0 +1,145 @@
+"""
+Async Executor Client
+=====================
+asyncio counterpart of ExecutorClient, so independent commands
+(directory scans, per-sample OBITools runs, health checks) can be in
+flight at the same time on the Muscle node from one event loop.
+
+paramiko is blocking, so each command runs on a dedicated thread pool and
+shares the pooled SSH transports of the synchronous client; a semaphore
+bounds how many commands are outstanding at once.
+"""
+
+import asyncio
+import functools
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.utils.executor_client import ExecutorClient, LOCAL_TIMEOUT_GRACE, get_executor_client
+
+# Defaults used when config.yaml has no `executor.async` section
+DEFAULT_ASYNC_SETTINGS = {
+    "max_concurrency": 8,
+    "default_timeout": None,
+}
+
+# A command is either a bare script or a dict of run_command keyword arguments
+CommandSpec = Union[str, Dict[str, Any]]
+
+
+class AsyncExecutorClient:
+    """Concurrent, non-blocking wrapper around ExecutorClient"""
+
+    def __init__(self, client: Optional[ExecutorClient] = None,
+                 max_concurrency: Optional[int] = None,
+                 default_timeout: Optional[float] = None):
+        self.client = client or get_executor_client()
+        settings = {**DEFAULT_ASYNC_SETTINGS, **self.client.config.get('executor', {}).get('async', {})}
+        self.max_concurrency = max(1, int(max_concurrency or settings['max_concurrency']))
+        self.default_timeout = default_timeout if default_timeout is not None else settings['default_timeout']
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                        thread_name_prefix="executor")
+
+    async def run_command(self, script: str, cwd: str = None, env_name: str = "base",
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a shell command on the Ubuntu node without blocking the event loop.
+        Returns the same dict shape as ExecutorClient.run_command.
+        """
+        timeout = timeout if timeout is not None else self.default_timeout
+        call = functools.partial(self.client.run_command, script,
+                                 cwd=cwd, env_name=env_name, timeout=timeout)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, call)
+            if timeout is None:
+                return await future
+            try:
+                # The sync client enforces the limit itself; this is only a backstop
+                return await asyncio.wait_for(future, timeout + 2 * LOCAL_TIMEOUT_GRACE)
+            except asyncio.TimeoutError:
+                return {
+                    "stdout": "",
+                    "stderr": f"Command timed out after {timeout}s",
+                    "return_code": -1
+                }
+
+    async def check_health(self) -> bool:
+        """Check if SSH connection is possible"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.client.check_health)
+
+    async def gather_commands(self, commands: List[CommandSpec],
+                              timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Run several independent commands concurrently.
+
+        Args:
+            commands: Scripts, or dicts with run_command keyword arguments
+                (script, cwd, env_name, timeout).
+            timeout: Default per-command timeout for specs that do not set one.
+
+        Returns:
+            Result dicts in the same order as `commands`.
+        """
+        async def _run(spec: CommandSpec) -> Dict[str, Any]:
+            kwargs = {"script": spec} if isinstance(spec, str) else dict(spec)
+            kwargs.setdefault("timeout", timeout)
+            try:
+                return await self.run_command(**kwargs)
+            except Exception as e:
+                return {
+                    "stdout": "",
+                    "stderr": f"SSH Execution Error: {str(e)}",
+                    "return_code": -1
+                }
+
+        return await asyncio.gather(*(_run(spec) for spec in commands))
+
+    def close(self):
+        """Release the worker threads (pooled SSH transports stay open)"""
+        self._pool.shutdown(wait=False)
+
+
+def run_commands_concurrently(commands: List[CommandSpec],
+                              timeout: Optional[float] = None,
+                              max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Synchronous helper for callers (e.g. graph nodes) that are not async"""
+    async def _main():
+        client = AsyncExecutorClient(max_concurrency=max_concurrency)
+        try:
+            return await client.gather_commands(commands, timeout=timeout)
+        finally:
+            client.close()
+
+    return asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    # Test the client
+    async def _demo():
+        client = AsyncExecutorClient()
+        print("🏥 Checking SSH Connection...")
+        if not await client.check_health():
+            print("❌ SSH is Offline.")
+            return
+        print("✅ SSH is Online!")
+
+        print("\n🚀 Running 3 commands concurrently...")
+        results = await client.gather_commands([
+            "hostname",
+            {"script": "nproc", "timeout": 10},
+            {"script": "ls -la", "cwd": "/media/dell/eDNA3/Lab"},
+        ])
+        for result in results:
+            print(f"Return Code: {result['return_code']} | {result['stdout'][:80]}")
+        client.close()
+
+    asyncio.run(_demo())
@@ -0,0 +1,382 @@
+"""
+Execution Result Cache
+======================
+Skips re-running a script on the Muscle Node when nothing it depends on
+has changed (a retried later step, a replanned request, a resumed run).
+
+An entry is keyed by the normalized script, conda env and working
+directory. It records a fingerprint of every input the script references:
+a sha256 for files and an mtime for directories, so globbing a directory
+picks up added or removed files. Directories are fingerprinted after the
+run, so a script that writes into a directory it reads (e.g. its working
+directory) still matches next time. It also records the result dict and
+the outputs the run produced. A lookup re-stats those paths in one remote
+call, and re-hashes only inputs whose size or mtime moved. It returns the
+recorded result when every input hash matches and every output is still
+in place, untouched. Scripts that reference no paths, or build paths from
+shell variables (`$OUT/table.qza`) that cannot be resolved here, are never
+cached and cost no remote call. Hashes are memoized by (path, size,
+mtime), so a large FASTQ is read once. The index lives in a local SQLite
+file next to the other caches, and outputs stay where the script wrote
+them.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+
+# Defaults used when config.yaml has no `executor.exec_cache` section
+DEFAULT_EXEC_CACHE_SETTINGS = {
+    "enabled": True,
+    "path": "./backend/cache/exec_cache.sqlite3",
+    "min_runtime_s": 5,     # Faster commands are not worth the stat/hash round trips
+    "max_entries": 2000,
+    "max_mb": 256,          # Stored result dicts (stdout/stderr tails), least recently used evicted
+}
+
+# Absolute paths and relative paths that look like files (contain a slash or a data extension)
+ABSOLUTE_PATH_PATTERN = re.compile(r"(?<![\w$}])(/[\w.+@%*?-]+(?:/[\w.+@%*?-]*)*)")
+RELATIVE_PATH_PATTERN = re.compile(
+    r"(?<![\w/$.-])((?:[\w.+-]+/)+[\w.+*?-]+|[\w+-][\w.+*?-]*\."
+    r"(?:fastq|fq|gz|fasta|fa|qza|qzv|tsv|csv|txt|biom|obidms))(?![\w/])"
+)
+# `$VAR/...` or `${VAR}/...`: a path the cache cannot see, so the script is not cacheable
+UNRESOLVED_PATH_PATTERN = re.compile(r"\$(?:\{\w+\}|\w+)[\"']?/")
+# Never fingerprinted: system locations and pseudo files
+IGNORED_PREFIXES = ("/dev/", "/proc/", "/sys/", "/usr/", "/bin/", "/etc/", "/tmp/", "/lib")
+MAX_CANDIDATES = 200
+
+
+def normalize_script(script: str) -> str:
+    """Script text with comments, trailing spaces and blank lines removed"""
+    lines = []
+    for line in script.splitlines():
+        stripped = line.rstrip()
+        if not stripped.strip() or (stripped.lstrip().startswith("#") and not stripped.startswith("#!")):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+def referenced_paths(script: str, cwd: Optional[str] = None) -> List[str]:
+    """
+    Paths a script may read or write. Glob patterns contribute their
+    directory, whose mtime changes when matching files come and go.
+    """
+    found = []
+    for match in ABSOLUTE_PATH_PATTERN.finditer(script):
+        found.append(match.group(1))
+    if cwd:
+        for match in RELATIVE_PATH_PATTERN.finditer(script):
+            found.append(posixpath.join(cwd, match.group(1)))
+
+    paths = []
+    for path in found:
+        if any(ch in path for ch in "*?"):
+            path = posixpath.dirname(path.split("*")[0].split("?")[0]) or "/"
+        path = posixpath.normpath(path)
+        if path == "/" or path.startswith(IGNORED_PREFIXES) or path in paths:
+            continue
+        paths.append(path)
+    return paths[:MAX_CANDIDATES]
+
+
+class ExecutionCache:
+    """Index of successful runs keyed by script/env/cwd, validated against remote files"""
+
+    def __init__(self, path: str, run_command: Optional[Callable[..., Dict[str, Any]]] = None,
+                 min_runtime_s: float = 5, max_entries: int = 2000, max_mb: float = 256):
+        self._run_command = run_command
+        self.min_runtime_s = min_runtime_s
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS exec_cache ("
+            " key TEXT PRIMARY KEY, env TEXT, cwd TEXT, inputs TEXT, outputs TEXT, result TEXT,"
+            " size INTEGER, duration REAL, created_at REAL, last_access REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            " path TEXT, size INTEGER, mtime REAL, sha256 TEXT, PRIMARY KEY (path, size, mtime))"
+        )
+        self._db.commit()
+
+    # --- Remote probes -----------------------------------------------------
+
+    def _remote_lines(self, command: str) -> List[str]:
+        from backend.utils.executor_client import get_executor_client
+        from backend.utils.metrics import untracked
+        run_command = self._run_command or get_executor_client().run_command
+        lines: List[str] = []
+        with untracked():
+            run_command(command, env_name=None,
+                        on_output=lambda stream, line: lines.append(line) if stream == "stdout" else None)
+        return lines
+
+    def _stat(self, paths: List[str]) -> Dict[str, Dict[str, Any]]:
+        """{path: {"type": "file"|"dir", "size", "mtime"}} for paths that exist"""
+        if not paths:
+            return {}
+        quoted = " ".join(shlex.quote(path) for path in paths)
+        stats = {}
+        for line in self._remote_lines(f"stat -c '%F\t%s\t%Y\t%n' -- {quoted} 2>/dev/null"):
+            parts = line.split("\t", 3)
+            if len(parts) != 4:
+                continue
+            kind = "dir" if parts[0] == "directory" else "file" if parts[0].startswith("regular") else None
+            if kind:
+                stats[parts[3]] = {"type": kind, "size": int(parts[1]), "mtime": float(parts[2])}
+        return stats
+
+    def _hashes(self, files: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """sha256 of files, computed remotely only for (path, size, mtime) not seen before"""
+        hashes = {}
+        todo = []
+        with self._lock:
+            for path, st in files.items():
+                row = self._db.execute(
+                    "SELECT sha256 FROM file_hashes WHERE path=? AND size=? AND mtime=?",
+                    (path, st['size'], st['mtime'])
+                ).fetchone()
+                if row:
+                    hashes[path] = row[0]
+                else:
+                    todo.append(path)
+        if todo:
+            quoted = " ".join(shlex.quote(path) for path in todo)
+            computed = {}
+            for line in self._remote_lines(f"sha256sum -- {quoted} 2>/dev/null"):
+                digest, _, path = line.partition("  ")
+                if path:
+                    computed[path] = digest
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO file_hashes (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                    [(path, files[path]['size'], files[path]['mtime'], digest) for path, digest in computed.items()]
+                )
+                self._db.commit()
+            hashes.update(computed)
+        return hashes
+
+    def _fingerprint(self, stats: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """Input fingerprints: content hash for files, mtime for directories"""
+        files = {path: st for path, st in stats.items() if st['type'] == "file"}
+        fingerprints = {path: f"sha256:{digest}" for path, digest in self._hashes(files).items()}
+        for path, st in stats.items():
+            if st['type'] == "dir":
+                fingerprints[path] = f"mtime:{st['mtime']:.0f}"
+        return fingerprints
+
+    # --- Public API ----------------------------------------------------------
+
+    @staticmethod
+    def make_key(script: str, env_name: str, cwd: Optional[str]) -> str:
+        raw = f"{normalize_script(script)}\x00{env_name}\x00{cwd or ''}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, script: str, env_name: str, cwd: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Returns (cached result or None, token). Pass the token to store()
+        after running the script so the pre-run input state is recorded.
+        The token is None for scripts that reference no paths (nothing to
+        validate a cached result against) or paths built from shell
+        variables (inputs that cannot be fingerprinted); they are not cached.
+        """
+        candidates = referenced_paths(script, cwd)
+        if not candidates or UNRESOLVED_PATH_PATTERN.search(script):
+            return None, None
+        key = self.make_key(script, env_name, cwd)
+        with self._lock:
+            row = self._db.execute("SELECT inputs, outputs, result FROM exec_cache WHERE key=?", (key,)).fetchone()
+
+        recorded_inputs = json.loads(row[0]) if row else {}
+        recorded_outputs = json.loads(row[1]) if row else {}
+        stats = self._stat(sorted(set(candidates) | set(recorded_inputs) | set(recorded_outputs)))
+        token = {"key": key, "env": env_name, "cwd": cwd, "candidates": candidates,
+                 "before": {path: st for path, st in stats.items() if path in candidates},
+                 "started": time.time()}
+
+        if row is None:
+            self.misses += 1
+            return None, token
+
+        # Outputs must still be exactly what the cached run produced
+        for path, recorded in recorded_outputs.items():
+            st = stats.get(path)
+            if st is None or st['size'] != recorded['size'] or abs(st['mtime'] - recorded['mtime']) > 1:
+                self.misses += 1
+                return None, token
+        # Inputs must have the same content (directories: same listing mtime)
+        inputs_now = {path: stats[path] for path in recorded_inputs if path in stats}
+        if len(inputs_now) != len(recorded_inputs) or self._fingerprint(inputs_now) != recorded_inputs:
+            self.misses += 1
+            return None, token
+
+        with self._lock:
+            self._db.execute("UPDATE exec_cache SET last_access=? WHERE key=?", (time.time(), key))
+            self._db.commit()
+        self.hits += 1
+        result = json.loads(row[2])
+        result['cached'] = True
+        return result, token
+
+    def store(self, token: Dict[str, Any], result: Dict[str, Any], output_paths: Optional[List[str]] = None,
+              runtime_s: Optional[float] = None):
+        """
+        Record a successful, slow enough run. `runtime_s` is the script's own
+        run time; without it, time since lookup() is used (which includes any
+        wait for the scheduler).
+        """
+        duration = runtime_s if runtime_s is not None else time.time() - token['started']
+        if result.get('return_code') != 0 or duration < self.min_runtime_s:
+            return
+        before = token['before']
+        after = self._stat(sorted(set(token['candidates']) | set(output_paths or [])))
+        # Outputs: reported paths plus referenced files that appeared or changed during the run
+        outputs = {}
+        for path, st in after.items():
+            if st['type'] != "file":
+                continue
+            previous = before.get(path)
+            if path in (output_paths or []) or previous is None or previous['mtime'] != st['mtime']:
+                outputs[path] = {"size": st['size'], "mtime": st['mtime']}
+        # Files as read before the run; directories as the run left them, since writing
+        # outputs into a directory (e.g. the cwd) moves its mtime
+        inputs = self._fingerprint({
+            path: after.get(path, st) if st['type'] == "dir" else st
+            for path, st in before.items() if path not in outputs
+        })
+
+        value = json.dumps({k: v for k, v in result.items() if k != 'cached'})
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO exec_cache (key, env, cwd, inputs, outputs, result, size, duration,"
+                " created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (token['key'], token['env'], token['cwd'], json.dumps(inputs), json.dumps(outputs),
+                 value, len(value), duration, now, now)
+            )
+            self._evict()
+            self._db.commit()
+        self.stores += 1
+
+    def _evict(self):
+        """Least recently used entries beyond max_entries or max_mb (caller holds the lock)"""
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM exec_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM exec_cache ORDER BY last_access"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._db.executemany("DELETE FROM exec_cache WHERE key=?", victims)
+        self.evictions += len(victims)
+
+    def invalidate(self, script: Optional[str] = None, env_name: str = "base", cwd: Optional[str] = None,
+                   path: Optional[str] = None) -> int:
+        """
+        Drop entries: one script's entry, every entry that reads or writes
+        under `path`, or everything when called without arguments.
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            if script is not None:
+                cursor = self._db.execute("DELETE FROM exec_cache WHERE key=?", (self.make_key(script, env_name, cwd),))
+            elif path is not None:
+                # Paths are JSON keys: match the path itself or anything under it, not
+                # siblings sharing a prefix (/data/run1 must not drop /data/run10)
+                quoted = json.dumps(posixpath.normpath(path))[1:-1]
+                escaped = quoted.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                exact, below = f'%"{escaped}"%', f'%"{escaped}/%'
+                cursor = self._db.execute(
+                    "DELETE FROM exec_cache WHERE inputs LIKE ? ESCAPE '\\' OR inputs LIKE ? ESCAPE '\\'"
+                    " OR outputs LIKE ? ESCAPE '\\' OR outputs LIKE ? ESCAPE '\\'",
+                    (exact, below, exact, below))
+            else:
+                cursor = self._db.execute("DELETE FROM exec_cache")
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total, saved = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(duration), 0) FROM exec_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_kb": total // 1024,
+            "recorded_runtime_s": round(saved, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局单例
+_exec_cache = None
+_exec_cache_lock = threading.Lock()
+
+
+def get_execution_cache() -> Optional[ExecutionCache]:
+    """Shared execution cache, or None when `executor.exec_cache.enabled` is false"""
+    global _exec_cache
+    config = load_config()
+    settings = {**DEFAULT_EXEC_CACHE_SETTINGS, **config['executor'].get('exec_cache', {})}
+    if not settings['enabled']:
+        return None
+    if _exec_cache is None:
+        with _exec_cache_lock:
+            if _exec_cache is None:
+                _exec_cache = ExecutionCache(
+                    path=settings['path'],
+                    min_runtime_s=settings['min_runtime_s'],
+                    max_entries=settings['max_entries'],
+                    max_mb=settings['max_mb']
+                )
+    return _exec_cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the execution cache")
+    parser.add_argument("--clear", action="store_true", help="Drop every entry")
+    parser.add_argument("--invalidate-path", metavar="PATH", help="Drop entries that read or write under PATH")
+    args = parser.parse_args()
+
+    cache = get_execution_cache()
+    if cache is None:
+        print("❌ Execution cache is disabled (executor.exec_cache.enabled)")
+        sys.exit(1)
+    if args.clear:
+        print(f"🧹 Removed {cache.invalidate()} entries")
+    elif args.invalidate_path:
+        print(f"🧹 Removed {cache.invalidate(path=args.invalidate_path)} entries")
+    print(f"📊 {cache.stats()}")
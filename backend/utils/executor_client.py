@@ -2,34 +2,60 @@
 Executor Client Module (SSH Version)
 ====================================
 Communicates with the Ubuntu Muscle Node via SSH.
+Commands run on channels multiplexed over a shared, long-lived
+connection pool (see ssh_pool.py) instead of one handshake per call.
 Logs all operations to Documents/logs/executor.log.
 """
 
-import paramiko
 import sys
 import time
+import math
+import shlex
+import codecs
+import select
 import logging
+from collections import deque
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterator, List, Optional
 
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 from backend.config import load_config
+from backend.utils.ssh_pool import get_ssh_pool
 
-# Setup Logging
-log_dir = Path(__file__).parent.parent.parent / "Documents" / "logs"
-log_dir.mkdir(parents=True, exist_ok=True)
-logging.basicConfig(
-    filename=log_dir / "executor.log",
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8'
-)
+_logging_configured = False
+
+def setup_logging():
+    """Route executor logs to Documents/logs/executor.log (done once, on first client)"""
+    global _logging_configured
+    if _logging_configured:
+        return
+    log_dir = Path(__file__).parent.parent.parent / "Documents" / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=log_dir / "executor.log",
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        encoding='utf-8'
+    )
+    _logging_configured = True
+
+# Defaults used when config.yaml has no `executor.stream` section
+DEFAULT_STREAM_SETTINGS = {
+    "tail_lines": 2000,
+    "max_line_bytes": 65536,
+    "read_chunk_bytes": 32768,
+    "poll_interval": 0.2,
+}
+
+# Extra seconds granted to the remote `timeout` before the channel is dropped locally
+LOCAL_TIMEOUT_GRACE = 15
 
 class ExecutorClient:
     """SSH Client for the Ubuntu Muscle Node"""
     
     def __init__(self):
+        setup_logging()
         self.config = load_config()
         # Hardcoded for now based on user input/deploy.py, ideally move to config/env
         self.host = "10.24.22.176"
@@ -38,91 +64,181 @@ class ExecutorClient:
         self.password = "gdut2021"
         self.conda_path = "/BioAnalyse/miniconda3"
         
+        # Shared pool: every ExecutorClient talking to this host reuses the same transports
+        self.pool = get_ssh_pool(
+            self.host,
+            self.port,
+            self.username,
+            self.password,
+            settings=self.config.get('executor', {}).get('ssh', {})
+        )
+        
     def check_health(self) -> bool:
         """Check if SSH connection is possible"""
         try:
-            client = self._connect()
-            client.close()
-            return True
+            return self.pool.check_health()
         except Exception as e:
             logging.error(f"Health Check Failed: {e}")
             print(f"⚠️ SSH Connection Failed: {e}")
             return False
-            
-    def _connect(self):
-        """Establish SSH connection"""
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(
-            self.host, 
-            port=self.port, 
-            username=self.username, 
-            password=self.password,
-            timeout=10
-        )
-        return client
 
-    def run_command(self, script: str, cwd: str = None, env_name: str = "base") -> Dict[str, Any]:
+    def _build_command(self, script: str, cwd: str = None, env_name: Optional[str] = "base") -> str:
         """
-        Run a shell command on the Ubuntu node via SSH.
+        Construct command with environment activation
+        1. Source conda
+        2. Activate env (skipped when env_name is None: plain shell for control commands)
+        3. Go to cwd (if provided)
+        4. Run script
+        """
+        parts = []
+        if env_name is not None:
+            parts.append(f"source {self.conda_path}/etc/profile.d/conda.sh && conda activate {env_name}")
+        if cwd:
+            # Ensure cwd exists
+            parts.append(f"mkdir -p {cwd} && cd {cwd}")
+        
+        parts.append(script)
+        return " && ".join(parts)
+
+    def _warm_session(self, env_name: Optional[str]):
+        """(pool, session) for an env served by warm sessions, else (None, None)"""
+        from backend.utils.shell_sessions import get_shell_pool
+        try:
+            session_pool = get_shell_pool(self)
+            if session_pool is None or not session_pool.serves(env_name):
+                return None, None
+            return session_pool, session_pool.acquire(env_name)
+        except Exception as e:
+            logging.warning(f"SESSION: Falling back to a fresh shell for {env_name}: {e}")
+            return None, None
+
+    def stream_command(self, script: str, cwd: str = None, env_name: str = "base",
+                       timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run a shell command and yield its output line by line as it arrives.
+        
+        Args:
+            timeout: Optional wall-clock limit in seconds. The remote side is
+                wrapped in coreutils `timeout` (exit code 124); if the channel is
+                still open shortly after the limit, it is closed locally and the
+                result carries return_code -1.
+        
+        Yields:
+            {"stream": "stdout" | "stderr", "line": str} for every output line,
+            then a final {"stream": "exit", "result": {...}} carrying the same
+            dict run_command returns (stdout/stderr hold only the retained tail).
         """
         logging.info(f"REQUEST: Run command in '{cwd or '.'}' (env: {env_name})")
         logging.info(f"SCRIPT: {script}")
         
-        client = None
+        # Prefer a warm session with the env already activated (see shell_sessions.py)
+        session_pool, session = self._warm_session(env_name)
+        if session is not None:
+            events = self._stream_session(session_pool, session, script, cwd, timeout)
+        else:
+            events = self._stream_exec(script, cwd, env_name, timeout)
+        
+        # Per-command metrics (see metrics.py)
+        from backend.utils.metrics import get_metrics, tracking
+        metrics = get_metrics() if tracking() else None
+        start_time = time.time()
+        out_bytes = err_bytes = 0
+        for event in events:
+            if event["stream"] == "stdout":
+                out_bytes += len(event["line"].encode('utf-8')) + 1
+            elif event["stream"] == "stderr":
+                err_bytes += len(event["line"].encode('utf-8')) + 1
+            elif metrics is not None:
+                metrics.record_command(env_name, "session" if session is not None else "exec",
+                                       time.time() - start_time, out_bytes, err_bytes,
+                                       event["result"]["return_code"], cwd)
+            yield event
+    
+    def _stream_session(self, session_pool: Any, session: Any, script: str, cwd: Optional[str],
+                        timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+        """
+        stream_command on a warm session. A session that dies mid-command
+        (dropped link, shell exited) ends with the same return_code -1
+        "SSH Execution Error" result as a failed exec channel, so callers
+        (and the job runner's reconnect logic) see a connection error.
+        """
+        stream_cfg = {**DEFAULT_STREAM_SETTINGS, **self.config.get('executor', {}).get('stream', {})}
+        stdout_tail = deque(maxlen=int(stream_cfg['tail_lines']))
         try:
-            client = self._connect()
-            
-            # Construct command with environment activation
-            # 1. Source conda
-            # 2. Activate env
-            # 3. Go to cwd (if provided)
-            # 4. Run script
-            
-            full_cmd = f"source {self.conda_path}/etc/profile.d/conda.sh && conda activate {env_name}"
-            if cwd:
-                # Ensure cwd exists
-                full_cmd += f" && mkdir -p {cwd} && cd {cwd}"
-            
-            full_cmd += f" && {script}"
-            
+            for event in session_pool.stream(session, script, cwd=cwd, timeout=timeout):
+                if event["stream"] == "stdout":
+                    stdout_tail.append(event["line"])
+                yield event
+        except Exception as e:
+            error_msg = f"SSH Execution Error: {str(e)}"
+            logging.error(error_msg)
+            yield {"stream": "exit", "result": {"stdout": "\n".join(stdout_tail), "stderr": error_msg,
+                                                "return_code": -1}}
+    
+    def _stream_exec(self, script: str, cwd: str, env_name: Optional[str],
+                     timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+        """stream_command on a fresh exec channel (conda activated per call)"""
+        stream_cfg = {**DEFAULT_STREAM_SETTINGS, **self.config.get('executor', {}).get('stream', {})}
+        out_buf = _LineBuffer(stream_cfg['tail_lines'], stream_cfg['max_line_bytes'])
+        err_buf = _LineBuffer(stream_cfg['tail_lines'], stream_cfg['max_line_bytes'])
+        chunk_size = int(stream_cfg['read_chunk_bytes'])
+        poll_interval = float(stream_cfg['poll_interval'])
+        
+        try:
+            full_cmd = self._build_command(script, cwd, env_name)
+            if timeout is not None:
+                full_cmd = f"timeout -k 10 {int(math.ceil(timeout))} bash -c {shlex.quote(full_cmd)}"
             logging.info(f"FULL_CMD: {full_cmd}")
             
-            # Execute
-            stdin, stdout, stderr = client.exec_command(full_cmd, timeout=None)
-            
-            # Read output with timeout mechanism for long-running commands
-            # Instead of blocking indefinitely, we poll for completion
-            out_str = ""
-            err_str = ""
-            exit_status = None
-            
-            # Wait for channel to complete, but with periodic checks
-            channel = stdout.channel
-            start_time = time.time()
-            last_log_time = start_time
-            
-            while not channel.exit_status_ready():
-                # Sleep briefly to avoid busy waiting
-                time.sleep(1)
+            # Execute on a channel borrowed from the shared pool
+            with self.pool.channel() as channel:
+                channel.exec_command(full_cmd)
+                start_time = time.time()
+                last_log_time = start_time
+                timed_out = False
                 
-                # Log progress every 30 seconds for long-running commands
-                elapsed = time.time() - last_log_time
-                if elapsed > 30:
-                    logging.info(f"Command still running... (elapsed: {int(time.time() - start_time)}s)")
-                    last_log_time = time.time()
+                # Drain both streams as data arrives so a chatty command never
+                # stalls on a full channel window; only a bounded tail is kept.
+                while True:
+                    select.select([channel], [], [], poll_interval)
+                    
+                    while channel.recv_ready():
+                        for line in out_buf.feed(channel.recv(chunk_size)):
+                            yield {"stream": "stdout", "line": line}
+                    while channel.recv_stderr_ready():
+                        for line in err_buf.feed(channel.recv_stderr(chunk_size)):
+                            yield {"stream": "stderr", "line": line}
+                    
+                    if (channel.exit_status_ready() and not channel.recv_ready()
+                            and not channel.recv_stderr_ready()):
+                        break
+                    
+                    if timeout is not None and time.time() - start_time > timeout + LOCAL_TIMEOUT_GRACE:
+                        timed_out = True
+                        break
+                    
+                    # Log progress every 30 seconds for long-running commands
+                    if time.time() - last_log_time > 30:
+                        logging.info(f"Command still running... (elapsed: {int(time.time() - start_time)}s)")
+                        last_log_time = time.time()
+                
+                for line in out_buf.close():
+                    yield {"stream": "stdout", "line": line}
+                for line in err_buf.close():
+                    yield {"stream": "stderr", "line": line}
+                exit_status = -1 if timed_out else channel.recv_exit_status()
             
-            # Command finished, read all output
-            out_str = stdout.read().decode().strip()
-            err_str = stderr.read().decode().strip()
-            exit_status = channel.recv_exit_status()
+            out_str = out_buf.tail_text()
+            err_str = err_buf.tail_text()
+            if timed_out or (timeout is not None and exit_status == 124):
+                err_str = f"{err_str}\nCommand timed out after {timeout}s".strip()
             
             total_time = int(time.time() - start_time)
             logging.info(f"EXIT_CODE: {exit_status} (execution time: {total_time}s)")
             if out_str: logging.info(f"STDOUT: {out_str}")
             if err_str: logging.error(f"STDERR: {err_str}")
             
-            return {
+            result = {
                 "stdout": out_str,
                 "stderr": err_str,
                 "return_code": exit_status
@@ -131,14 +247,96 @@ class ExecutorClient:
         except Exception as e:
             error_msg = f"SSH Execution Error: {str(e)}"
             logging.error(error_msg)
-            return {
-                "stdout": "",
+            result = {
+                "stdout": out_buf.tail_text(),
                 "stderr": error_msg,
                 "return_code": -1
             }
-        finally:
-            if client:
-                client.close()
+        
+        yield {"stream": "exit", "result": result}
+
+    def run_command(self, script: str, cwd: str = None, env_name: str = "base",
+                    on_output: Optional[Callable[[str, str], None]] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a shell command on the Ubuntu node via SSH.
+        
+        Args:
+            on_output: Optional callback(stream, line) invoked for each output
+                line while the command is still running.
+            timeout: Optional wall-clock limit in seconds (see stream_command).
+        """
+        result = None
+        for event in self.stream_command(script, cwd=cwd, env_name=env_name, timeout=timeout):
+            if event["stream"] == "exit":
+                result = event["result"]
+            elif on_output:
+                on_output(event["stream"], event["line"])
+        return result
+
+
+class _LineBuffer:
+    """Splits a byte stream into lines and keeps a bounded tail of them"""
+    
+    def __init__(self, tail_lines: int, max_line_bytes: int):
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial = ""
+        self._max_line_chars = max(1, int(max_line_bytes))
+        self.tail = deque(maxlen=max(1, int(tail_lines)))
+        self.total_lines = 0
+        
+    def _emit(self, line: str) -> str:
+        self.tail.append(line)
+        self.total_lines += 1
+        return line
+        
+    def feed(self, data: bytes) -> List[str]:
+        """Add raw bytes, return the lines they completed"""
+        text = self._partial + self._decoder.decode(data)
+        *complete, self._partial = text.split("\n")
+        lines = [self._emit(line.rstrip("\r")) for line in complete]
+        # Never let a single unterminated line grow without bound
+        while len(self._partial) > self._max_line_chars:
+            lines.append(self._emit(self._partial[:self._max_line_chars]))
+            self._partial = self._partial[self._max_line_chars:]
+        return lines
+        
+    def close(self) -> List[str]:
+        """Flush the final unterminated line, if any"""
+        rest = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        return [self._emit(rest.rstrip("\r"))] if rest.strip() else []
+        
+    def retract(self, keep: str = ""):
+        """Replace the most recent line by `keep` (or drop it), for in-band protocol markers"""
+        if self.tail:
+            self.tail.pop()
+            self.total_lines -= 1
+        if keep:
+            self._emit(keep)
+        
+    def tail_text(self) -> str:
+        """Retained output, with a marker when earlier lines were dropped"""
+        text = "\n".join(self.tail).strip()
+        dropped = self.total_lines - len(self.tail)
+        if dropped > 0:
+            text = f"...({dropped} earlier lines truncated)...\n{text}"
+        return text
+
+# 全局单例
+_executor_client = None
+
+def get_executor_client() -> ExecutorClient:
+    """Get the shared ExecutorClient (created on first use)"""
+    global _executor_client
+    if _executor_client is None:
+        _executor_client = ExecutorClient()
+    return _executor_client
+
+def set_executor_client(client):
+    """Replace the shared client with any object offering run_command (None resets it)"""
+    global _executor_client
+    _executor_client = client
 
 if __name__ == "__main__":
     # Test the client
@@ -149,7 +347,11 @@ if __name__ == "__main__":
         print("✅ SSH is Online!")
         
         print("\n🚀 Running Test Command (ls -la)...")
-        result = client.run_command("ls -la", cwd="/media/dell/eDNA3/Lab")
+        result = client.run_command(
+            "ls -la",
+            cwd="/media/dell/eDNA3/Lab",
+            on_output=lambda stream, line: print(f"  [{stream}] {line}")
+        )
         print(f"Return Code: {result['return_code']}")
         print(f"Output:\n{result['stdout']}")
     else:
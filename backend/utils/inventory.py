@@ -0,0 +1,339 @@
+"""
+Remote File Inventory
+=====================
+Structured listing of a data directory on the Muscle Node.
+
+One `find -printf` call returns every file with its size and mtime, R1/R2
+reads are grouped into samples, and the result is cached per directory,
+keyed by directory and mtime. Within `ttl_seconds` a scan is answered
+without contacting the node. After that, a refresh prints every directory
+but only the files modified since the previous scan, so files rewritten or
+appended in place are picked up. Only the directories whose mtime moved
+(files added, removed or renamed in) are listed again. A refreshed
+inventory is built separately and swapped into the cache under the lock,
+so readers never see a half-updated one.
+"""
+
+import posixpath
+import re
+import shlex
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+from backend.utils.executor_client import get_executor_client
+from backend.utils.metrics import untracked
+
+# Defaults used when config.yaml has no `executor.inventory` section
+DEFAULT_INVENTORY_SETTINGS = {
+    "ttl_seconds": 30,         # Reuse a scan without any remote call for this long
+}
+
+# find -printf line: type, size, mtime, path
+FIND_FORMAT = "'%y\\t%s\\t%T@\\t%p\\n'"
+# Remote clock at scan time, printed before the listing (refreshes ask for files newer than it)
+REMOTE_NOW_COMMAND = "date +'now%t%s'"
+# Beyond this many changed directories a refresh falls back to a full scan
+MAX_RELIST_DIRS = 200
+
+# Paired-end read files: JC1_R1.fastq, JC1_1.fq.gz, JC1_S1_L001_R2_001.fastq.gz ...
+READ_FILE_PATTERN = re.compile(
+    r'^(?P<sample>.+?)(?:_S\d+)?(?:_L\d{3})?[._-]R?(?P<read>[12])(?:_001)?\.(?:fastq|fq)(?:\.gz)?$'
+)
+
+
+class InventoryError(RuntimeError):
+    """The remote directory could not be listed"""
+
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime: float
+
+
+def natural_key(text: str) -> List[Any]:
+    """Sort key that orders JC2 before JC10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', text)]
+
+
+def compress_ids(ids: List[str]) -> str:
+    """Collapse consecutive numbered IDs: JC1, JC2, JC3, S7 -> 'JC1..JC3, S7'"""
+    groups: List[List[Tuple[str, int, str]]] = []
+    for sample_id in sorted(ids, key=natural_key):
+        match = re.fullmatch(r'(.*?)(\d+)', sample_id)
+        item = (match.group(1), int(match.group(2)), sample_id) if match else (sample_id, -1, sample_id)
+        last = groups[-1][-1] if groups else None
+        if last and match and last[0] == item[0] and last[1] >= 0 and item[1] == last[1] + 1:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    parts = []
+    for group in groups:
+        parts.append(group[0][2] if len(group) < 3 else f"{group[0][2]}..{group[-1][2]}")
+        if len(group) == 2:
+            parts.append(group[1][2])
+    return ", ".join(parts)
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+@dataclass
+class Inventory:
+    """Files under one root directory, grouped into samples"""
+    root: str
+    files: Dict[str, FileEntry] = field(default_factory=dict)
+    dir_mtimes: Dict[str, float] = field(default_factory=dict)
+    scanned_at: float = 0.0
+    remote_time: Optional[float] = None
+
+    def samples(self) -> Dict[str, Dict[str, str]]:
+        """
+        R1/R2 reads grouped by sample. Reads are grouped per directory, so
+        a sample name found in several subdirectories is reported once per
+        directory, as "<relative dir>/<name>".
+
+        Returns:
+            {"SampleID": {"raw_r1": "/abs/path_R1.fastq", "raw_r2": "/abs/path_R2.fastq"}}
+        """
+        grouped: Dict[Tuple[str, str], Dict[str, str]] = {}
+        for path in sorted(self.files, key=natural_key):
+            match = READ_FILE_PATTERN.match(posixpath.basename(path))
+            if match:
+                stage = "raw_r1" if match.group("read") == "1" else "raw_r2"
+                key = (self.relative(posixpath.dirname(path)), match.group("sample"))
+                grouped.setdefault(key, {})[stage] = path
+
+        names: Dict[str, int] = {}
+        for _, name in grouped:
+            names[name] = names.get(name, 0) + 1
+        samples: Dict[str, Dict[str, str]] = {}
+        for (directory, name), files in grouped.items():
+            shared = names[name] > 1 and directory != "."
+            samples[f"{directory}/{name}" if shared else name] = files
+        return samples
+
+    def relative(self, path: str) -> str:
+        return posixpath.relpath(path, self.root)
+
+    def other_files(self) -> List[str]:
+        """Files that are not paired-end reads (map files, metadata, ...)"""
+        read_paths = {path for files in self.samples().values() for path in files.values()}
+        return sorted((p for p in self.files if p not in read_paths), key=natural_key)
+
+    def summary(self, max_samples: int = 40, max_other_files: int = 20) -> str:
+        """Compact text description for prompts (real file names, bounded length)"""
+        samples = self.samples()
+        paired = [s for s, files in samples.items() if "raw_r1" in files and "raw_r2" in files]
+        unpaired = [s for s in samples if s not in paired]
+        others = self.other_files()
+        total_size = sum(entry.size for entry in self.files.values())
+
+        lines = [f"Root: {self.root} ({len(self.files)} files, {format_size(total_size)}, "
+                 f"{len(self.dir_mtimes)} directories)"]
+        if samples:
+            lines.append(f"Samples: {len(paired)} paired-end ({compress_ids(paired) or '-'})")
+            for sample_id in list(samples)[:max_samples]:
+                entries = ", ".join(
+                    f"{stage}={self.relative(path)} ({format_size(self.files[path].size)})"
+                    for stage, path in sorted(samples[sample_id].items())
+                )
+                lines.append(f"  {sample_id}: {entries}")
+            if len(samples) > max_samples:
+                lines.append(f"  ...({len(samples) - max_samples} more samples with the same layout)")
+            if unpaired:
+                lines.append(f"Unpaired reads: {compress_ids(unpaired)}")
+        else:
+            lines.append("Samples: none detected (no R1/R2 FASTQ files)")
+        if others:
+            lines.append(f"Other files ({len(others)}):")
+            for path in others[:max_other_files]:
+                lines.append(f"  {self.relative(path)} ({format_size(self.files[path].size)})")
+            if len(others) > max_other_files:
+                lines.append(f"  ...({len(others) - max_other_files} more)")
+        return "\n".join(lines)
+
+
+class RemoteInventory:
+    """Cached, TTL-refreshed inventories of remote directories"""
+
+    def __init__(self, run_command: Optional[Callable[..., Dict[str, Any]]] = None,
+                 ttl_seconds: float = 30):
+        self._run_command = run_command
+        self.ttl_seconds = ttl_seconds
+        self._cache: Dict[str, Inventory] = {}
+        self._lock = threading.Lock()
+        self.full_scans = 0
+        self.refreshes = 0
+        self.relisted_dirs = 0
+        self.cache_hits = 0
+
+    def _run(self, command: str) -> Tuple[List[str], Dict[str, Any]]:
+        """Run a listing command, collecting every stdout line (not just the result tail)"""
+        run_command = self._run_command or get_executor_client().run_command
+        lines: List[str] = []
+        with untracked():
+            result = run_command(
+                command,
+                env_name=None,
+                on_output=lambda stream, line: lines.append(line) if stream == "stdout" else None
+            )
+        return lines, result
+
+    @staticmethod
+    def _parse(lines: List[str], inventory: Inventory):
+        """Add find -printf lines (and the remote clock line) to an inventory"""
+        for line in lines:
+            parts = line.split("\t", 3)
+            if len(parts) == 2 and parts[0] == "now":
+                inventory.remote_time = float(parts[1])
+            if len(parts) != 4:
+                continue
+            kind, size, mtime, path = parts
+            if kind == "d":
+                inventory.dir_mtimes[path] = float(mtime)
+            elif kind == "f":
+                inventory.files[path] = FileEntry(path, int(size), float(mtime))
+
+    def _full_scan(self, root: str) -> Inventory:
+        lines, result = self._run(f"{REMOTE_NOW_COMMAND}; find {shlex.quote(root)} -printf {FIND_FORMAT}")
+        inventory = Inventory(root=root)
+        self._parse(lines, inventory)
+        if root not in inventory.dir_mtimes:
+            raise InventoryError(result['stderr'].strip() or f"Cannot list {root}")
+        return inventory
+
+    def _incremental_scan(self, old: Inventory) -> Inventory:
+        """
+        Every directory, plus files modified since the previous scan. Files in
+        directories whose mtime is unchanged are carried over; directories
+        that changed (or are new) are listed again to catch removed files and
+        files moved in with an old mtime.
+        """
+        if old.remote_time is None:
+            return self._full_scan(old.root)
+        root = shlex.quote(old.root)
+        since = int(old.remote_time) - 1  # -newermt is strict; re-reading a second of overlap is harmless
+        lines, result = self._run(
+            f"{REMOTE_NOW_COMMAND}; find {root} \\( -type d -o -newermt @{since} \\) -printf {FIND_FORMAT}"
+        )
+        scanned = Inventory(root=old.root)
+        self._parse(lines, scanned)
+        if old.root not in scanned.dir_mtimes:
+            raise InventoryError(result['stderr'].strip() or f"Cannot list {old.root}")
+
+        changed_dirs = [path for path, mtime in scanned.dir_mtimes.items() if old.dir_mtimes.get(path) != mtime]
+        if len(changed_dirs) > MAX_RELIST_DIRS:
+            return self._full_scan(old.root)
+        changed = set(changed_dirs)
+        newer = scanned.files
+        scanned.files = {path: entry for path, entry in old.files.items()
+                         if posixpath.dirname(path) in scanned.dir_mtimes
+                         and posixpath.dirname(path) not in changed}
+        scanned.files.update(newer)
+        if changed_dirs:
+            quoted = " ".join(shlex.quote(path) for path in changed_dirs)
+            relisted, _ = self._run(f"find {quoted} -maxdepth 1 -type f -printf {FIND_FORMAT}")
+            self._parse(relisted, scanned)
+            self.relisted_dirs += len(changed_dirs)
+        return scanned
+
+    @staticmethod
+    def _changes(old: Inventory, new: Inventory) -> int:
+        """Files added, removed, or rewritten (size or mtime moved) between two scans"""
+        changed = sum(1 for path, entry in new.files.items()
+                      if path not in old.files
+                      or (old.files[path].size, old.files[path].mtime) != (entry.size, entry.mtime))
+        return changed + sum(1 for path in old.files if path not in new.files)
+
+    def scan(self, root: str, refresh: bool = False) -> Inventory:
+        """
+        Inventory of `root`, reusing the cached scan where possible.
+
+        Args:
+            root: Absolute directory on the Muscle Node
+            refresh: Skip the TTL shortcut and re-list the directory now
+        """
+        root = root.rstrip("/") or "/"
+        now = time.time()
+        with self._lock:
+            inventory = self._cache.get(root)
+            if inventory is not None and not refresh and now - inventory.scanned_at < self.ttl_seconds:
+                self.cache_hits += 1
+                return inventory
+
+        # A fresh Inventory is built and swapped in; cached ones are never mutated
+        scanned = self._incremental_scan(inventory) if inventory is not None else self._full_scan(root)
+        scanned.scanned_at = now
+        changes = self._changes(inventory, scanned) if inventory is not None else None
+        if changes:
+            print(f"📂 Inventory: {changes} files added, removed or rewritten under {root}")
+
+        with self._lock:
+            if inventory is None:
+                self.full_scans += 1
+            else:
+                self.refreshes += 1
+            self._cache[root] = scanned
+        return scanned
+
+    def invalidate(self, root: Optional[str] = None):
+        """Forget one cached directory (or all of them)"""
+        with self._lock:
+            if root is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(root.rstrip("/") or "/", None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "cached_roots": len(self._cache),
+                "full_scans": self.full_scans,
+                "refreshes": self.refreshes,
+                "relisted_dirs": self.relisted_dirs,
+                "cache_hits": self.cache_hits,
+            }
+
+
+# 全局单例
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_inventory() -> RemoteInventory:
+    """Get the shared inventory service"""
+    global _inventory
+    if _inventory is None:
+        with _inventory_lock:
+            if _inventory is None:
+                config = load_config()
+                settings = {**DEFAULT_INVENTORY_SETTINGS, **config['executor'].get('inventory', {})}
+                _inventory = RemoteInventory(ttl_seconds=settings['ttl_seconds'])
+    return _inventory
+
+
+if __name__ == "__main__":
+    # Test the inventory against the lab root
+    root = load_config()['executor']['remote_root']
+    service = get_inventory()
+    print(f"📂 Scanning {root}...")
+    start = time.time()
+    print(service.scan(root).summary())
+    print(f"⏱️ First scan: {time.time() - start:.2f}s")
+    start = time.time()
+    service.scan(root, refresh=True)
+    print(f"⏱️ Rescan: {time.time() - start:.2f}s, stats: {service.stats()}")
@@ -0,0 +1,197 @@
+"""
+LLM Response Cache
+==================
+Opt-in SQLite cache for deterministic agent calls (path extraction,
+planning, code generation). Entries are keyed by provider + LangChain's
+llm_string (model and sampling parameters) + the full rendered prompt, so
+re-running a familiar analysis answers from disk instead of the endpoint.
+
+Plugged into the chat model via LangChain's `cache=` hook (see llm_client).
+Call sites that need a fresh completion wrap the call in `bypass_llm_cache()`.
+A completion that turns out wrong (generated code that fails to run) is
+dropped with `invalidate_llm_cache()`, using the keys collected by
+`record_llm_cache_keys()` around the call, so the next run asks again
+instead of replaying it.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+# Defaults used when config.yaml has no `llm.cache` section
+DEFAULT_LLM_CACHE_SETTINGS = {
+    "enabled": False,
+    "path": "./backend/cache/llm_cache.sqlite3",
+    "ttl_hours": 168,
+    "max_entries": 5000,
+}
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+# List collecting the keys looked up inside record_llm_cache_keys() (mutated, so it
+# is visible after LangChain runs the call in a copied context)
+_recorded = contextvars.ContextVar("llm_cache_recorded", default=None)
+
+
+@contextmanager
+def bypass_llm_cache(active: bool = True):
+    """Skip cache reads and writes for LLM calls made inside this block"""
+    token = _bypass.set(active)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+@contextmanager
+def record_llm_cache_keys():
+    """Yield a list that collects the cache keys of LLM calls made inside this block"""
+    keys: List[str] = []
+    token = _recorded.set(keys)
+    try:
+        yield keys
+    finally:
+        _recorded.reset(token)
+
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain cache backend with TTL, LRU size eviction and hit statistics"""
+
+    def __init__(self, path: str, provider: str = "", ttl_seconds: Optional[float] = None,
+                 max_entries: int = 5000):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, provider TEXT, value TEXT, created_at REAL, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_last_access ON llm_cache(last_access)")
+        self._db.commit()
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        raw = f"{self.provider}\x00{llm_string}\x00{prompt}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        if _bypass.get():
+            self.bypassed += 1
+            return None
+        key = self._key(prompt, llm_string)
+        recorded = _recorded.get()
+        if recorded is not None:
+            recorded.append(key)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET last_access=? WHERE key=?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]):
+        if _bypass.get():
+            return
+        key = self._key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, provider, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, self.provider, value, now, now)
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                # Drop the least recently used entries
+                excess = count - self.max_entries
+                self._db.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self._db.commit()
+
+    def invalidate(self, keys: Iterable[str]):
+        """Drop entries by key (from record_llm_cache_keys)"""
+        keys = list(keys)
+        with self._lock:
+            deleted = self._db.executemany("DELETE FROM llm_cache WHERE key=?", [(key,) for key in keys]).rowcount
+            self._db.commit()
+            self.invalidated += max(0, deleted)
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate statistics"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局单例
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache(config: dict) -> Optional[SQLiteLLMCache]:
+    """Shared cache instance, or None when `llm.cache.enabled` is false"""
+    global _llm_cache
+    settings = {**DEFAULT_LLM_CACHE_SETTINGS, **config['llm'].get('cache', {})}
+    if not settings['enabled']:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                ttl_hours = settings['ttl_hours']
+                _llm_cache = SQLiteLLMCache(
+                    path=settings['path'],
+                    provider=config['llm']['active_provider'],
+                    ttl_seconds=ttl_hours * 3600 if ttl_hours else None,
+                    max_entries=settings['max_entries']
+                )
+    return _llm_cache
+
+
+def invalidate_llm_cache(keys: Optional[Iterable[str]]):
+    """Drop cached completions that turned out wrong (no-op while the cache is off)"""
+    if _llm_cache is not None and keys:
+        _llm_cache.invalidate(keys)
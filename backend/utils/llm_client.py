@@ -6,9 +6,9 @@ Loads configuration from .env and config.yaml.
 """
 
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 import sys
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -18,15 +18,53 @@ from backend.config import load_config
 env_path = Path(__file__).parent.parent.parent / ".env"
 load_dotenv(env_path)
 
+# 全局单例
+_llm = None
+_llm_lock = threading.Lock()
+
 def get_llm():
     """
-    Get the configured LLM client.
+    Get the shared LLM client, created on first use.
     Returns:
         ChatOpenAI: Configured LangChain chat model
     """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm()
+    return _llm
+
+def set_llm(llm):
+    """Replace the shared LLM client (benchmarks plug in fakes); None resets it"""
+    global _llm
+    with _llm_lock:
+        _llm = llm
+
+def active_model_name() -> str:
+    """Model name of the active provider (used to pick a tokenizer)"""
+    config = load_config()
+    if config['llm']['active_provider'] == 'online':
+        return os.getenv("OPENAI_MODEL") or ""
+    return config['llm']['providers']['local']['model']
+
+def create_llm():
+    """
+    Build a new LLM client from the configuration.
+    Returns:
+        ChatOpenAI: Configured LangChain chat model
+    """
+    from langchain_openai import ChatOpenAI  # Deferred: heavy import, only needed on first call
+    
     config = load_config()
     provider_type = config['llm']['active_provider']
     
+    # Opt-in response cache (llm.cache.enabled in config.yaml)
+    from backend.utils.llm_cache import get_llm_cache
+    cache = get_llm_cache(config)
+    if cache is not None:
+        print(f"💾 LLM response cache enabled ({cache.stats()['entries']} entries)")
+    
     if provider_type == 'online':
         # Load from Environment Variables (Standard OpenAI SDK format)
         api_key = os.getenv("OPENAI_API_KEY")
@@ -41,7 +79,9 @@ def get_llm():
             model=model_name,
             openai_api_key=api_key,
             openai_api_base=base_url,
-            temperature=0.1
+            temperature=0.1,
+            streaming=True,  # Token callbacks fire during generation (workers stream to the UI)
+            cache=cache
         )
         
     elif provider_type == 'local':
@@ -52,7 +92,9 @@ def get_llm():
             model=local_config['model'],
             openai_api_key=local_config['api_key'],
             openai_api_base=local_config['api_base'],
-            temperature=0.1
+            temperature=0.1,
+            streaming=True,  # Token callbacks fire during generation (workers stream to the UI)
+            cache=cache
         )
     
     else:
@@ -0,0 +1,397 @@
+"""
+Executor Metrics
+================
+In-process registry of counters and histograms for the executor.
+
+Every remote command records its run time, stdout/stderr bytes, exit code,
+env and execution mode (warm session or fresh exec); the SSH pool records
+connect and channel-open times, warm sessions their conda activation time,
+and the scheduler how long scripts queued for cores. The registry is
+exported as Prometheus text (file, and optionally an HTTP endpoint) and a
+JSON summary with p50/p95/p99, and each command is appended to a JSONL
+history so time on the Muscle node can be compared across days. Internal
+probes and detached-job control commands run `untracked()`; a detached job
+is recorded once, as a whole, with mode "job":
+
+    python -m backend.utils.metrics --days 7
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config, overrides_version
+
+# Defaults used when config.yaml has no `executor.metrics` section
+DEFAULT_METRICS_SETTINGS = {
+    "enabled": True,
+    "prometheus_file": "./Documents/logs/executor_metrics.prom",
+    "json_file": "./Documents/logs/executor_metrics.json",
+    "history_file": "./Documents/logs/executor_commands.jsonl",
+    "export_interval": 30,   # Minimum seconds between file exports
+    "http_port": None,       # Serve /metrics and /summary.json on this port (None = off)
+}
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600, 7200)
+BYTES_BUCKETS = (0, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Exact percentile (0-100) of raw values, None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Optional[Dict[str, Any]] = None, amount: float = 1):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+        return lines
+
+    def summary(self) -> Dict[str, Any]:
+        return {_format_labels(key) or "total": value for key, value in sorted(self.values.items())}
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, with quantiles estimated from the buckets"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Labels, Dict[str, Any]] = {}
+
+    def observe(self, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = _label_key(labels)
+        series = self.series.setdefault(key, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0,
+                                              "count": 0, "max": value})
+        series["counts"][bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+        series["max"] = max(series["max"], value)
+
+    def quantile(self, key: Labels, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th (0-1) observation"""
+        series = self.series.get(key)
+        if not series or not series["count"]:
+            return None
+        target = q * series["count"]
+        seen = 0
+        for i, count in enumerate(series["counts"]):
+            if count and seen + count >= target:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else series["max"]
+                return min(series["max"], low + (high - low) * (target - seen) / count)
+            seen += count
+        return series["max"]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def summary(self) -> Dict[str, Any]:
+        result = {}
+        for key, series in sorted(self.series.items()):
+            result[_format_labels(key) or "total"] = {
+                "count": series["count"],
+                "mean": series["sum"] / series["count"],
+                "p50": self.quantile(key, 0.50),
+                "p95": self.quantile(key, 0.95),
+                "p99": self.quantile(key, 0.99),
+                "max": series["max"],
+                "sum": series["sum"],
+            }
+        return result
+
+
+class MetricsRegistry:
+    """Named counters and histograms with Prometheus/JSON export"""
+
+    def __init__(self, prometheus_file: Optional[str] = None, json_file: Optional[str] = None,
+                 history_file: Optional[str] = None, export_interval: float = 30):
+        self.prometheus_file = prometheus_file
+        self.json_file = json_file
+        self.history_file = history_file
+        self.export_interval = export_interval
+        self.started = time.time()
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+        self._server = None
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None,
+                help_text: str = "", buckets: Sequence[float] = SECONDS_BUCKETS):
+        metric = self.histogram(name, help_text, buckets)
+        with self._lock:
+            metric.observe(value, labels)
+        self.maybe_export()
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, amount: float = 1, help_text: str = ""):
+        metric = self.counter(name, help_text)
+        with self._lock:
+            metric.inc(labels, amount)
+        self.maybe_export()
+
+    def record_command(self, env_name: Optional[str], mode: str, run_s: float, stdout_bytes: int,
+                       stderr_bytes: int, return_code: int, cwd: Optional[str] = None):
+        """One finished remote command (all metrics plus a history line)"""
+        env = env_name or "none"
+        status = "ok" if return_code == 0 else "timeout" if return_code == 124 else "error"
+        self.observe("labbio_executor_command_seconds", run_s, {"env": env, "mode": mode},
+                     "Wall time of remote commands")
+        self.observe("labbio_executor_output_bytes", stdout_bytes, {"env": env, "stream": "stdout"},
+                     "Output bytes per remote command", BYTES_BUCKETS)
+        self.observe("labbio_executor_output_bytes", stderr_bytes, {"env": env, "stream": "stderr"},
+                     "Output bytes per remote command", BYTES_BUCKETS)
+        self.inc("labbio_executor_commands_total", {"env": env, "mode": mode, "status": status},
+                 help_text="Remote commands by outcome")
+        if self.history_file:
+            record = {"ts": time.time(), "env": env, "mode": mode, "run_s": round(run_s, 4),
+                      "stdout_bytes": stdout_bytes, "stderr_bytes": stderr_bytes,
+                      "return_code": return_code, "cwd": cwd}
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.history_file)), exist_ok=True)
+                with self._lock, open(self.history_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError:
+                pass
+
+    # --- Export ---------------------------------------------------------------
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                lines += self._metrics[name].render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"started": self.started, "updated": time.time(),
+                    "metrics": {name: metric.summary() for name, metric in sorted(self._metrics.items())}}
+
+    def export(self):
+        """Write the Prometheus and JSON files (atomically replaced)"""
+        self._last_export = time.time()
+        for path, content in ((self.prometheus_file, self.to_prometheus),
+                              (self.json_file, lambda: json.dumps(self.summary(), indent=2))):
+            if not path:
+                continue
+            try:
+                directory = os.path.dirname(os.path.abspath(path))
+                os.makedirs(directory, exist_ok=True)
+                # Unique temp file per writer, so concurrent exports never share one
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False,
+                                                 prefix=f".{os.path.basename(path)}.", suffix=".tmp") as f:
+                    tmp = f.name
+                    f.write(content())
+                try:
+                    os.replace(tmp, path)
+                except OSError:
+                    os.unlink(tmp)
+                    raise
+            except OSError:
+                pass
+
+    def maybe_export(self):
+        if time.time() - self._last_export >= self.export_interval:
+            self.export()
+
+    def serve(self, port: int):
+        """Serve /metrics (Prometheus text) and /summary.json from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    body, ctype = registry.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path.startswith("/summary.json"):
+                    body, ctype = json.dumps(registry.summary()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics endpoint on http://localhost:{port}/metrics")
+
+
+def history_summary(path: str, days: float = 7) -> Dict[str, Any]:
+    """Exact run-time percentiles per env/mode from the command history of the last `days`"""
+    cutoff = time.time() - days * 86400
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ts", 0) >= cutoff:
+                    groups.setdefault(f"{record['env']} ({record['mode']})", []).append(record)
+    except FileNotFoundError:
+        return {}
+    summary = {}
+    for group, records in sorted(groups.items()):
+        run_times = [r["run_s"] for r in records]
+        summary[group] = {
+            "commands": len(records),
+            "failed": sum(1 for r in records if r["return_code"] != 0),
+            "total_s": sum(run_times),
+            "p50_s": percentile(run_times, 50),
+            "p95_s": percentile(run_times, 95),
+            "p99_s": percentile(run_times, 99),
+            "stdout_mb": sum(r["stdout_bytes"] for r in records) / 1e6,
+        }
+    return summary
+
+
+# 全局单例
+_metrics = None
+_metrics_lock = threading.Lock()
+# Settings read once per set of config overrides (get_metrics runs for every command)
+_settings: Optional[Dict[str, Any]] = None
+_settings_version = -1
+# Per-thread depth of untracked() blocks
+_local = threading.local()
+
+
+@contextmanager
+def untracked():
+    """Commands run in this thread inside the block are not recorded (internal probes, job control)"""
+    _local.depth = getattr(_local, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def tracking() -> bool:
+    """False inside an untracked() block"""
+    return not getattr(_local, "depth", 0)
+
+
+def metrics_settings() -> Dict[str, Any]:
+    """`executor.metrics` merged over the defaults, cached until the config overrides change"""
+    global _settings, _settings_version
+    version = overrides_version()
+    if _settings is None or _settings_version != version:
+        config = load_config()
+        _settings = {**DEFAULT_METRICS_SETTINGS, **config['executor'].get('metrics', {})}
+        _settings_version = version
+    return _settings
+
+
+def get_metrics() -> Optional[MetricsRegistry]:
+    """Shared registry, or None when `executor.metrics.enabled` is false"""
+    global _metrics
+    settings = metrics_settings()
+    if not settings['enabled']:
+        return None
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(
+                    prometheus_file=settings['prometheus_file'],
+                    json_file=settings['json_file'],
+                    history_file=settings['history_file'],
+                    export_interval=settings['export_interval']
+                )
+                if settings['http_port']:
+                    try:
+                        _metrics.serve(settings['http_port'])
+                    except OSError as e:
+                        print(f"⚠️ Metrics endpoint not started: {e}")
+    return _metrics
+
+
+def observe(name: str, value: float, labels: Optional[Dict[str, Any]] = None, help_text: str = "",
+            buckets: Sequence[float] = SECONDS_BUCKETS):
+    """Record into the shared registry if metrics are enabled"""
+    registry = get_metrics()
+    if registry is not None:
+        registry.observe(name, value, labels, help_text, buckets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize executor metrics")
+    parser.add_argument("--days", type=float, default=7, help="History window in days")
+    parser.add_argument("--prometheus", action="store_true", help="Print this process's registry as Prometheus text")
+    args = parser.parse_args()
+
+    settings = metrics_settings()
+    if args.prometheus:
+        print(get_metrics().to_prometheus())
+    else:
+        summary = history_summary(settings['history_file'], args.days)
+        if not summary:
+            print(f"No commands recorded in the last {args.days:g} days")
+        for group, stats in summary.items():
+            print(f"{group:<40} n={stats['commands']:<5} failed={stats['failed']:<4} "
+                  f"p50={stats['p50_s']:.2f}s p95={stats['p95_s']:.2f}s p99={stats['p99_s']:.2f}s "
+                  f"total={stats['total_s'] / 60:.1f}min out={stats['stdout_mb']:.1f}MB")
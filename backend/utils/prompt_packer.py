@@ -0,0 +1,247 @@
+"""
+Prompt Packer
+=============
+Token-budgeted assembly of prompt sections.
+
+Replaces fixed character slices (`rag_context[:500]`, `file_structure[:1000]`)
+with a budget counted by the target model's tokenizer. The budget left after
+the fixed template and task is split across sections by share; a section that
+needs less hands its surplus to the others. Sections are filled with whole
+items in priority order (most relevant RAG chunk first, newest error first),
+duplicates are dropped, and an item is never cut in half unless the section
+allows trimming whole lines from one end (long tracebacks, file listings).
+"""
+
+import re
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+
+# Defaults used when config.yaml has no `llm.prompt_budget` section
+DEFAULT_PROMPT_BUDGET = {
+    "tokenizer": None,   # tiktoken model or encoding name (None = derive from the active model)
+    "supervisor": 3000,
+    "obitools": 3000,
+    "qiime": 2000,
+}
+
+CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Fallback count when tiktoken is unavailable: ~4 ASCII chars or 1 CJK char per token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=8)
+def get_token_counter(name: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Token counting function for a model or encoding name.
+    Unknown models (e.g. local Qwen) fall back to cl100k_base, which is close
+    enough for budgeting; without tiktoken a character estimate is used.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+    encoding = None
+    if name:
+        try:
+            encoding = tiktoken.encoding_for_model(name)
+        except KeyError:
+            try:
+                encoding = tiktoken.get_encoding(name)
+            except (KeyError, ValueError):
+                encoding = None
+    if encoding is None:
+        try:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # Encoding files not cached and no network
+            return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def budget_for(role: str) -> int:
+    """Prompt token budget configured for an agent role"""
+    config = load_config()
+    settings = {**DEFAULT_PROMPT_BUDGET, **config['llm'].get('prompt_budget', {})}
+    return int(settings[role])
+
+
+def default_counter() -> Callable[[str], int]:
+    """Counter for the configured tokenizer, or the active model's"""
+    from backend.utils.llm_client import active_model_name
+    config = load_config()
+    settings = {**DEFAULT_PROMPT_BUDGET, **config['llm'].get('prompt_budget', {})}
+    return get_token_counter(settings['tokenizer'] or active_model_name())
+
+
+@dataclass
+class Section:
+    """
+    One variable part of a prompt.
+
+    Args:
+        name: Template variable the packed text is returned under
+        items: Candidate texts in priority order
+        share: Relative weight when splitting the budget
+        render: Alternative to items: callable(max_tokens) -> text that fits
+        trim: "head"/"tail" keeps the first/last lines of an item too large to fit whole
+        separator: Joins the chosen items
+        empty: Text used when nothing is included
+    """
+    name: str
+    items: List[str] = field(default_factory=list)
+    share: float = 1.0
+    render: Optional[Callable[[int], str]] = None
+    trim: Optional[str] = None
+    separator: str = "\n\n"
+    empty: str = "None"
+
+
+class PromptPacker:
+    """Fits sections into a prompt token budget"""
+
+    def __init__(self, max_tokens: int, count_tokens: Optional[Callable[[str], int]] = None):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or default_counter()
+        # {section: {"allocated", "used", "items", "dropped"}} from the last pack()
+        self.report: Dict[str, Dict[str, int]] = {}
+
+    def _candidates(self, section: Section) -> List[str]:
+        seen = set()
+        items = []
+        for item in section.items:
+            key = " ".join((item or "").split())
+            if key and key not in seen:
+                seen.add(key)
+                items.append(item.strip())
+        return items
+
+    def _trim(self, item: str, budget: int, mode: str) -> str:
+        """Whole lines from one end of an item, within budget"""
+        lines = item.splitlines()
+        marker = "...(truncated)..."
+        used = self.count_tokens(marker) + 1
+        kept: List[str] = []
+        for line in (lines if mode == "head" else reversed(lines)):
+            cost = self.count_tokens(line) + 1
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        if not kept:
+            return ""
+        if mode == "head":
+            return "\n".join(kept + [marker])
+        return "\n".join([marker] + list(reversed(kept)))
+
+    def _fill(self, section: Section, budget: int) -> Tuple[str, int, int]:
+        """Packed text, items included, items dropped"""
+        if section.render is not None:
+            text = section.render(budget)
+            return text, 1, 0
+        sep_cost = self.count_tokens(section.separator)
+        chosen: List[str] = []
+        used = 0
+        dropped = 0
+        for item in self._candidates(section):
+            cost = self.count_tokens(item) + (sep_cost if chosen else 0)
+            if used + cost <= budget:
+                chosen.append(item)
+                used += cost
+            elif section.trim and not chosen:
+                trimmed = self._trim(item, budget - used, section.trim)
+                if trimmed:
+                    chosen.append(trimmed)
+                    used += self.count_tokens(trimmed)
+                else:
+                    dropped += 1
+            else:
+                dropped += 1
+        return section.separator.join(chosen), len(chosen), dropped
+
+    def _demand(self, section: Section, available: int) -> int:
+        """Tokens a section would use with the whole budget to itself"""
+        if section.render is not None:
+            return self.count_tokens(section.render(available))
+        items = self._candidates(section)
+        if not items:
+            return 0
+        return sum(self.count_tokens(item) for item in items) + \
+            self.count_tokens(section.separator) * (len(items) - 1)
+
+    def _allocate(self, sections: List[Section], available: int) -> Dict[str, int]:
+        """Water-filling split of `available` tokens by share, capped at each section's demand"""
+        demand = {s.name: self._demand(s, available) for s in sections}
+        allocation = {s.name: 0 for s in sections}
+        remaining = available
+        open_sections = [s for s in sections if demand[s.name] > 0]
+        while remaining > 0 and open_sections:
+            total_share = sum(s.share for s in open_sections) or 1
+            granted = 0
+            for s in open_sections:
+                grant = min(int(remaining * s.share / total_share), demand[s.name] - allocation[s.name])
+                allocation[s.name] += grant
+                granted += grant
+            remaining -= granted
+            still_open = [s for s in open_sections if allocation[s.name] < demand[s.name]]
+            if granted == 0 or len(still_open) == len(open_sections):
+                # Everyone is budget-limited: hand out the rounding remainder and stop
+                if still_open and remaining > 0:
+                    allocation[still_open[0].name] += remaining
+                break
+            open_sections = still_open
+        return allocation
+
+    def pack(self, sections: List[Section], fixed: str = "") -> Dict[str, str]:
+        """
+        Fill every section within the budget left after `fixed`
+        (the prompt template, task text and anything else always sent).
+        Returns {section name: text}.
+        """
+        available = max(0, self.max_tokens - self.count_tokens(fixed))
+        allocation = self._allocate(sections, available)
+        packed = {}
+        self.report = {}
+        for section in sections:
+            text, included, dropped = self._fill(section, allocation[section.name])
+            packed[section.name] = text or section.empty
+            self.report[section.name] = {
+                "allocated": allocation[section.name],
+                "used": self.count_tokens(text) if text else 0,
+                "items": included,
+                "dropped": dropped,
+            }
+        return packed
+
+    def summary(self) -> str:
+        """One-line description of the last pack() for logs"""
+        return ", ".join(f"{name} {r['used']}/{r['allocated']} tok"
+                         + (f" (-{r['dropped']})" if r['dropped'] else "")
+                         for name, r in self.report.items())
+
+
+if __name__ == "__main__":
+    # Test the packer
+    counter = get_token_counter("gpt-4o")
+    packer = PromptPacker(max_tokens=300, count_tokens=counter)
+    chunks = ["obi import --fastq-input JC1_R1.fastq reads/JC1_R1\n" * 5,
+              "obi alignpairedend -R reads/JC1_R2 reads/JC1_R1 aligned/JC1\n" * 5,
+              "obi import --fastq-input JC1_R1.fastq reads/JC1_R1\n" * 5]
+    errors = ["Traceback (most recent call last):\n" + "  File x, line 1\n" * 60 + "ValueError: bad view"]
+    result = packer.pack([
+        Section("context", chunks, share=2),
+        Section("errors", list(reversed(errors)), trim="tail"),
+    ], fixed="You are a generator.\nTask: merge reads")
+    print(result["context"][:200])
+    print(result["errors"][-120:])
+    print(f"📦 {packer.summary()}")
@@ -0,0 +1,459 @@
+"""
+Detached Remote Jobs
+====================
+Runs long scripts on the Muscle Node detached from the SSH channel.
+
+A job is launched under `setsid nohup` in its own process group, with
+stdout/stderr redirected to files in a job directory and the exit code
+written to `exit_code` when it ends. The launching call returns a job ID at
+once. Output is then followed by polling byte offsets of the log files
+(every `min_poll_interval` while output flows, backing off to
+`poll_interval` while the job is quiet), so
+a dropped connection (Wi-Fi blip, Brain node sleep) only pauses the
+follower: it reconnects and continues where it stopped while the job keeps
+running. A job can be reattached by ID, or found again by its script key
+when the same step is executed after a restart.
+
+Only long-running tools are detached (`executor.jobs.detach` patterns); a
+short script such as `mkdir -p` runs as one plain exec instead of paying for
+the launch and poll round trips.
+
+Job directory layout (under `executor.jobs.root`):
+    <job_id>/script.sh   stdout.log   stderr.log   pid   key   started   exit_code
+
+`LocalShell` is a subprocess stand-in for ExecutorClient, so the job logic
+can be exercised on any machine with bash:
+    python -m backend.utils.remote_jobs --local
+"""
+
+import argparse
+import base64
+import hashlib
+import math
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+from backend.utils.executor_client import DEFAULT_STREAM_SETTINGS, _LineBuffer, get_executor_client
+from backend.utils.metrics import get_metrics, untracked
+
+# Defaults used when config.yaml has no `executor.jobs` section
+DEFAULT_JOB_SETTINGS = {
+    "enabled": True,
+    "root": None,                # Job directories (None = <executor.remote_root>/.labbio_jobs)
+    "min_poll_interval": 0.25,   # Seconds between polls right after output arrived
+    "poll_interval": 2.0,        # Longest gap between polls while a job stays quiet
+    "reconnect_timeout": 900,    # Keep retrying a lost connection this long before giving up
+    "max_poll_bytes": 262144,    # Log bytes fetched per stream per poll
+    "keep_days": 14,             # Finished job directories older than this are removed
+    # Scripts matching any of these run detached (None = every script)
+    "detach": [r"qiime\s+dada2\s+denoise", r"qiime\s+feature-classifier\s+classify-sklearn"],
+}
+
+
+class JobConnectionError(ConnectionError):
+    """A job control command did not get through to the node"""
+
+
+def job_key(script: str, cwd: Optional[str], env_name: Optional[str]) -> str:
+    """Identity of a job's work, used to find a still-running launch of the same step"""
+    raw = f"{script.strip()}\x00{cwd or ''}\x00{env_name or ''}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+class LocalShell:
+    """Local subprocess stand-in for ExecutorClient (no conda, no SSH)"""
+
+    def _build_command(self, script: str, cwd: str = None, env_name: Optional[str] = None) -> str:
+        if cwd:
+            return f"mkdir -p {shlex.quote(cwd)} && cd {shlex.quote(cwd)} && {script}"
+        return script
+
+    def run_command(self, script: str, cwd: str = None, env_name: Optional[str] = None,
+                    on_output: Optional[Callable[[str, str], None]] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        proc = subprocess.run(["bash", "-c", self._build_command(script, cwd)],
+                              capture_output=True, text=True, timeout=timeout)
+        if on_output:
+            for line in proc.stdout.splitlines():
+                on_output("stdout", line)
+            for line in proc.stderr.splitlines():
+                on_output("stderr", line)
+        return {"stdout": proc.stdout, "stderr": proc.stderr, "return_code": proc.returncode}
+
+
+class DetachedJobRunner:
+    """Launch, poll, tail, reattach and cancel detached jobs"""
+
+    def __init__(self, client: Any, root: str, poll_interval: float = 2.0,
+                 reconnect_timeout: float = 900, max_poll_bytes: int = 262144, keep_days: int = 14,
+                 min_poll_interval: float = 0.25, detach: Optional[List[str]] = None,
+                 stream_settings: Optional[Dict[str, Any]] = None):
+        self.client = client
+        self.root = root.rstrip("/")
+        self.poll_interval = poll_interval
+        self.min_poll_interval = min(min_poll_interval, poll_interval)
+        self.detach = [re.compile(pattern) for pattern in detach] if detach is not None else None
+        self.stream_settings = {**DEFAULT_STREAM_SETTINGS, **(stream_settings or {})}
+        self.reconnect_timeout = reconnect_timeout
+        self.max_poll_bytes = int(max_poll_bytes)
+        self.keep_days = keep_days
+        self._cleaned = False
+
+    def _dir(self, job_id: str) -> str:
+        return f"{self.root}/{job_id}"
+
+    def should_detach(self, script: str) -> bool:
+        """Whether a script is long-running enough to be worth a detached job"""
+        return self.detach is None or any(pattern.search(script) for pattern in self.detach)
+
+    def _control(self, command: str, env_name: Optional[str] = None) -> List[str]:
+        """Run a control command (in a plain shell by default), returning its stdout lines"""
+        lines: List[str] = []
+        # Not a command of its own in the metrics; run() records the job as a whole
+        with untracked():
+            result = self.client.run_command(
+                command, env_name=env_name,
+                on_output=lambda stream, line: lines.append(line) if stream == "stdout" else None
+            )
+        if result['return_code'] == -1 and "SSH Execution Error" in result['stderr']:
+            raise JobConnectionError(result['stderr'])
+        return lines
+
+    # --- Launch ----------------------------------------------------------------
+
+    def launch(self, script: str, cwd: str = None, env_name: Optional[str] = "base",
+               timeout: Optional[float] = None, key: Optional[str] = None) -> str:
+        """Start a script detached and return its job ID immediately"""
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        job_dir = shlex.quote(self._dir(job_id))
+        # The env is activated by the launching shell (a warm session when available)
+        # and inherited by the detached job
+        body = self.client._build_command(script, cwd, None)
+        if timeout is not None:
+            body = f"timeout -k 10 {int(math.ceil(timeout))} bash -c {shlex.quote(body)}"
+        runner = (f"bash {job_dir}/script.sh > {job_dir}/stdout.log 2> {job_dir}/stderr.log; "
+                  f"echo $? > {job_dir}/exit_code.tmp; mv {job_dir}/exit_code.tmp {job_dir}/exit_code")
+        delimiter = f"LABBIO_JOB_{uuid.uuid4().hex}"
+        command = "\n".join([
+            f"mkdir -p {job_dir} || exit 1",
+            f"cat > {job_dir}/script.sh <<'{delimiter}'",
+            body,
+            delimiter,
+            f"echo {shlex.quote(key or job_key(script, cwd, env_name))} > {job_dir}/key",
+            f"date +%s > {job_dir}/started",
+            "cd /",
+            f"setsid nohup bash -c {shlex.quote(runner)} > /dev/null 2>&1 < /dev/null &",
+            f"echo $! > {job_dir}/pid",
+            "echo \"JOB_PID $!\"",
+        ])
+        lines = self._control(command, env_name=env_name)
+        if not any(line.startswith("JOB_PID ") for line in lines):
+            raise RuntimeError(f"Failed to launch job {job_id}")
+        print(f"🛰️ Launched detached job {job_id}")
+        if not self._cleaned:
+            self._cleaned = True
+            self.cleanup()
+        return job_id
+
+    # --- Inspection --------------------------------------------------------------
+
+    def poll(self, job_id: str, offsets: Tuple[int, int] = (0, 0)) -> Dict[str, Any]:
+        """
+        Job state plus new log bytes since `offsets` (stdout, stderr), in one call.
+
+        Returns:
+            {"state": "running" | "finished" | "lost" | "missing", "return_code",
+             "stdout": bytes, "stderr": bytes, "offsets": (int, int), "drained": bool}
+        """
+        job_dir = shlex.quote(self._dir(job_id))
+        out_off, err_off = offsets
+        m = self.max_poll_bytes
+        command = "\n".join([
+            f"cd {job_dir} 2>/dev/null || {{ echo JOB_MISSING; exit 0; }}",
+            # Exit code is read before the logs: once it exists, the logs are complete
+            "if [ -f exit_code ]; then echo \"JOB_EXIT $(cat exit_code)\"; fi",
+            "if kill -0 \"$(cat pid 2>/dev/null)\" 2>/dev/null; then echo JOB_ALIVE 1; else echo JOB_ALIVE 0; fi",
+            "echo \"JOB_SIZE $(stat -c %s stdout.log 2>/dev/null || echo 0) $(stat -c %s stderr.log 2>/dev/null || echo 0)\"",
+            f"echo JOB_OUT_BEGIN; tail -c +{out_off + 1} stdout.log 2>/dev/null | head -c {m} | base64; echo JOB_OUT_END",
+            f"echo JOB_ERR_BEGIN; tail -c +{err_off + 1} stderr.log 2>/dev/null | head -c {m} | base64; echo JOB_ERR_END",
+        ])
+        lines = self._control(command)
+        if "JOB_MISSING" in lines:
+            return {"state": "missing", "return_code": None, "stdout": b"", "stderr": b"",
+                    "offsets": offsets, "drained": True}
+        if not any(line.startswith("JOB_ALIVE") for line in lines):
+            raise JobConnectionError(f"No status for job {job_id}")
+
+        return_code, alive, sizes = None, False, (0, 0)
+        chunks = {"OUT": [], "ERR": []}
+        section = None
+        for line in lines:
+            if line.startswith("JOB_EXIT "):
+                return_code = int(line.split()[1])
+            elif line.startswith("JOB_ALIVE "):
+                alive = line.split()[1] == "1"
+            elif line.startswith("JOB_SIZE "):
+                sizes = tuple(int(x) for x in line.split()[1:3])
+            elif line in ("JOB_OUT_BEGIN", "JOB_ERR_BEGIN"):
+                section = line[4:7]
+            elif line in ("JOB_OUT_END", "JOB_ERR_END"):
+                section = None
+            elif section:
+                chunks[section].append(line)
+
+        stdout = base64.b64decode("".join(chunks["OUT"]))
+        stderr = base64.b64decode("".join(chunks["ERR"]))
+        new_offsets = (out_off + len(stdout), err_off + len(stderr))
+        drained = new_offsets[0] >= sizes[0] and new_offsets[1] >= sizes[1]
+        if return_code is not None:
+            state = "finished"
+        elif alive:
+            state = "running"
+        else:
+            state = "lost"  # Killed without writing an exit code (OOM killer, reboot)
+        return {"state": state, "return_code": return_code, "stdout": stdout, "stderr": stderr,
+                "offsets": new_offsets, "drained": drained}
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """State and exit code without fetching output"""
+        polled = self.poll(job_id, offsets=(10 ** 15, 10 ** 15))
+        return {"job_id": job_id, "state": polled['state'], "return_code": polled['return_code']}
+
+    def tail(self, job_id: str, lines: int = 50) -> Dict[str, str]:
+        """Last lines of a job's stdout and stderr"""
+        job_dir = shlex.quote(self._dir(job_id))
+        output = self._control(
+            f"tail -n {int(lines)} {job_dir}/stdout.log 2>/dev/null; echo JOB_TAIL_SPLIT; "
+            f"tail -n {int(lines)} {job_dir}/stderr.log 2>/dev/null"
+        )
+        split = output.index("JOB_TAIL_SPLIT") if "JOB_TAIL_SPLIT" in output else len(output)
+        return {"stdout": "\n".join(output[:split]), "stderr": "\n".join(output[split + 1:])}
+
+    def find_running(self, key: str) -> Optional[str]:
+        """ID of a still-running job launched with this key, if any"""
+        root = shlex.quote(self.root)
+        lines = self._control(
+            f"for d in {root}/*/; do [ -f \"$d/exit_code\" ] && continue; "
+            f"grep -qx {key} \"$d/key\" 2>/dev/null && kill -0 \"$(cat \"$d/pid\")\" 2>/dev/null "
+            f"&& basename \"$d\"; done; true"
+        )
+        return lines[-1] if lines else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs with their state"""
+        root = shlex.quote(self.root)
+        lines = self._control(
+            f"ls -1t {root} 2>/dev/null | head -n {int(limit)} | while read id; do "
+            f"code=$(cat {root}/\"$id\"/exit_code 2>/dev/null || echo -); "
+            f"if kill -0 \"$(cat {root}/\"$id\"/pid 2>/dev/null)\" 2>/dev/null; then alive=1; else alive=0; fi; "
+            f"echo \"$id $code $alive $(cat {root}/\"$id\"/started 2>/dev/null || echo 0)\"; done"
+        )
+        jobs = []
+        for line in lines:
+            parts = line.split()
+            if len(parts) != 4:
+                continue
+            job_id, code, alive, started = parts
+            state = "finished" if code != "-" else "running" if alive == "1" else "lost"
+            jobs.append({"job_id": job_id, "state": state,
+                         "return_code": int(code) if code != "-" else None, "started": float(started)})
+        return jobs
+
+    # --- Control -------------------------------------------------------------------
+
+    def cancel(self, job_id: str) -> bool:
+        """Terminate a job's whole process group"""
+        job_dir = shlex.quote(self._dir(job_id))
+        lines = self._control(
+            f"pid=$(cat {job_dir}/pid 2>/dev/null) && kill -TERM -- -\"$pid\" 2>/dev/null && echo JOB_CANCELLED; true"
+        )
+        return "JOB_CANCELLED" in lines
+
+    def cleanup(self):
+        """Remove finished job directories older than keep_days"""
+        root = shlex.quote(self.root)
+        try:
+            self._control(
+                f"find {root} -mindepth 1 -maxdepth 1 -type d -mtime +{int(self.keep_days)} "
+                f"-exec test -f '{{}}/exit_code' ';' -exec rm -rf '{{}}' + 2>/dev/null; true"
+            )
+        except JobConnectionError:
+            pass
+
+    def follow(self, job_id: str, on_output: Optional[Callable[[str, str], None]] = None,
+               offsets: Tuple[int, int] = (0, 0)) -> Dict[str, Any]:
+        """
+        Stream a job's output until it ends (also used to reattach).
+        Connection failures are retried for up to reconnect_timeout seconds.
+
+        Returns:
+            The usual {"stdout", "stderr", "return_code"} dict plus "job_id".
+        """
+        stream_cfg = self.stream_settings
+        out_buf = _LineBuffer(stream_cfg['tail_lines'], stream_cfg['max_line_bytes'])
+        err_buf = _LineBuffer(stream_cfg['tail_lines'], stream_cfg['max_line_bytes'])
+        disconnected_since = None
+        lost_polls = 0
+        # Poll quickly while output flows, back off while the job is quiet
+        interval = self.min_poll_interval
+
+        while True:
+            try:
+                polled = self.poll(job_id, offsets)
+            except JobConnectionError as e:
+                now = time.time()
+                disconnected_since = disconnected_since or now
+                if now - disconnected_since > self.reconnect_timeout:
+                    return {"job_id": job_id, "stdout": out_buf.tail_text(),
+                            "stderr": f"Lost connection to job {job_id} for {int(now - disconnected_since)}s "
+                                      f"(it may still be running; reattach with its job ID): {e}",
+                            "return_code": -1}
+                print(f"🔌 Connection to job {job_id} lost, retrying (the job keeps running remotely)...")
+                time.sleep(min(30, self.poll_interval * 2))
+                continue
+            if disconnected_since is not None:
+                print(f"🔗 Reattached to job {job_id}")
+                disconnected_since = None
+
+            offsets = polled['offsets']
+            for line in out_buf.feed(polled['stdout']):
+                on_output and on_output("stdout", line)
+            for line in err_buf.feed(polled['stderr']):
+                on_output and on_output("stderr", line)
+
+            if polled['state'] == "missing":
+                return {"job_id": job_id, "stdout": "", "stderr": f"Job {job_id} not found", "return_code": -1}
+            if polled['state'] == "lost":
+                # Give the exit code file one more poll to appear
+                lost_polls += 1
+                if lost_polls < 2:
+                    time.sleep(1)
+                    continue
+            if polled['state'] in ("finished", "lost") and polled['drained']:
+                for line in out_buf.close():
+                    on_output and on_output("stdout", line)
+                for line in err_buf.close():
+                    on_output and on_output("stderr", line)
+                stderr = err_buf.tail_text()
+                return_code = polled['return_code'] if polled['state'] == "finished" else -1
+                if polled['state'] == "lost":
+                    stderr = f"{stderr}\nJob {job_id} ended without an exit code (killed?)".strip()
+                elif return_code == 124:
+                    stderr = f"{stderr}\nCommand timed out".strip()
+                return {"job_id": job_id, "stdout": out_buf.tail_text(), "stderr": stderr,
+                        "return_code": return_code}
+
+            # Poll again at once while a backlog is being drained
+            if polled['drained']:
+                if polled['stdout'] or polled['stderr']:
+                    interval = self.min_poll_interval
+                time.sleep(interval)
+                interval = min(self.poll_interval, interval * 2)
+
+    def run(self, script: str, cwd: str = None, env_name: Optional[str] = "base",
+            on_output: Optional[Callable[[str, str], None]] = None,
+            timeout: Optional[float] = None, key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Drop-in for ExecutorClient.run_command: reattach to a running job of
+        the same script if there is one, otherwise launch it, then follow it.
+        `key` identifies the step when the script text varies between launches
+        (e.g. rewritten thread counts); it defaults to the script's own key.
+        """
+        key = key or job_key(script, cwd, env_name)
+        try:
+            job_id = self.find_running(key)
+            if job_id:
+                print(f"🔗 Reattaching to running job {job_id}")
+            else:
+                job_id = self.launch(script, cwd=cwd, env_name=env_name, timeout=timeout, key=key)
+        except Exception as e:
+            return {"stdout": "", "stderr": f"Job launch failed: {e}", "return_code": -1}
+        
+        # One metrics record for the whole job (see metrics.py)
+        metrics = get_metrics()
+        start_time = time.time()
+        out_bytes = {"stdout": 0, "stderr": 0}
+        
+        def counting(stream: str, line: str):
+            out_bytes[stream] += len(line.encode('utf-8')) + 1
+            if on_output:
+                on_output(stream, line)
+        
+        result = self.follow(job_id, on_output=counting)
+        if metrics is not None:
+            metrics.record_command(env_name, "job", time.time() - start_time, out_bytes["stdout"],
+                                   out_bytes["stderr"], result["return_code"], cwd)
+        return result
+
+
+# 全局单例
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> Optional[DetachedJobRunner]:
+    """Shared job runner, or None when `executor.jobs.enabled` is false"""
+    global _job_runner
+    config = load_config()
+    settings = {**DEFAULT_JOB_SETTINGS, **config['executor'].get('jobs', {})}
+    if not settings['enabled']:
+        return None
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                _job_runner = DetachedJobRunner(
+                    client=get_executor_client(),
+                    root=settings['root'] or f"{config['executor']['remote_root']}/.labbio_jobs",
+                    poll_interval=settings['poll_interval'],
+                    reconnect_timeout=settings['reconnect_timeout'],
+                    max_poll_bytes=settings['max_poll_bytes'],
+                    keep_days=settings['keep_days'],
+                    min_poll_interval=settings['min_poll_interval'],
+                    detach=settings['detach'],
+                    stream_settings=config['executor'].get('stream', {})
+                )
+    return _job_runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detached job demo and inspection")
+    parser.add_argument("--local", action="store_true", help="Use the local subprocess stand-in")
+    parser.add_argument("--list", action="store_true", help="List recent jobs")
+    parser.add_argument("--tail", metavar="JOB_ID", help="Show the end of a job's logs")
+    parser.add_argument("--reattach", metavar="JOB_ID", help="Follow a job until it ends")
+    parser.add_argument("--cancel", metavar="JOB_ID", help="Terminate a job")
+    args = parser.parse_args()
+
+    if args.local:
+        runner = DetachedJobRunner(LocalShell(), root=f"{tempfile.gettempdir()}/labbio_jobs", poll_interval=0.5,
+                                   min_poll_interval=0.1)
+    else:
+        runner = get_job_runner()
+    printer = lambda stream, line: print(f"  [{stream}] {line}")
+
+    if args.list:
+        for job in runner.list_jobs():
+            print(job)
+    elif args.tail:
+        print(runner.tail(args.tail))
+    elif args.reattach:
+        print(runner.follow(args.reattach, on_output=printer))
+    elif args.cancel:
+        print("✅ Cancelled" if runner.cancel(args.cancel) else "⚠️ Not running")
+    else:
+        print("🚀 Launching demo job...")
+        job = runner.launch("for i in 1 2 3; do echo step $i; sleep 1; done; echo oops >&2; exit 3",
+                            env_name=None)
+        print(f"Status: {runner.status(job)}")
+        print(f"Result: {runner.follow(job, on_output=printer)}")
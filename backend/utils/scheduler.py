@@ -0,0 +1,332 @@
+"""
+Resource Scheduler
+==================
+Admission control and thread allocation for the Muscle Node.
+
+Each script is matched against per-tool resource profiles (DADA2 denoising,
+classify-sklearn, obi alignpairedend, ...) to get the threads and memory it
+needs. A script is admitted when the node has that much left, counting both
+what this process has already handed out and what the node reports
+(`/proc/loadavg` for other users' CPU use, `MemAvailable` for memory).
+Otherwise it waits in a FIFO queue until earlier jobs release their share.
+The 1-minute load average lags behind, so the threads of recently finished
+jobs are discounted from it as they decay rather than counted as other users.
+
+For profiled tools the granted thread count is written into the command:
+existing thread flags (`--p-n-threads`, `--p-n-jobs`, `--threads`) are
+rewritten and the usual thread environment variables (OMP_NUM_THREADS, ...)
+plus LABBIO_THREADS are exported in front of the script. Scripts that only
+match "default" keep their own thread flags; the threads they ask for are
+what the scheduler accounts for.
+"""
+
+import math
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+from backend.utils.executor_client import get_executor_client
+from backend.utils.metrics import observe, untracked
+
+# Defaults used when config.yaml has no `executor.scheduler` section
+DEFAULT_SCHEDULER_SETTINGS = {
+    "enabled": True,
+    "cores": 18,                # Muscle node CPU cores
+    "memory_gb": 256,
+    "reserve_cores": 1,         # Kept free for the shell, SSH and file serving
+    "reserve_memory_gb": 8,
+    "probe_ttl": 10,            # Seconds a load/memory reading is reused
+    "wait_interval": 5,         # Seconds between admission checks while queued
+    "max_wait": 3600,           # Run anyway after waiting this long (null = wait forever)
+    # First matching profile wins; "default" applies to everything else
+    "profiles": {
+        "dada2": {"match": r"qiime\s+dada2\s+denoise", "min_threads": 4, "max_threads": 12, "memory_gb": 32},
+        "classify-sklearn": {"match": r"qiime\s+feature-classifier\s+classify-sklearn",
+                             "min_threads": 2, "max_threads": 8, "memory_gb": 64},
+        "alignpairedend": {"match": r"obi\s+alignpairedend", "min_threads": 1, "max_threads": 1, "memory_gb": 8},
+        "default": {"min_threads": 1, "max_threads": 1, "memory_gb": 2},
+    },
+}
+
+# Thread flags rewritten to the granted count
+THREAD_FLAG_PATTERN = re.compile(r'(--p-n-threads|--p-n-jobs|--threads|--cpus|--nthreads)(\s+|=)(-?\d+)')
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "LABBIO_THREADS")
+
+# Time constant of the kernel's 1-minute load average, and how long released threads are tracked
+LOADAVG_TAU_S = 60.0
+LINGER_S = 300.0
+
+
+@dataclass
+class Allocation:
+    """Resources granted to one script; release() (or leaving the `with` block) frees them"""
+    job_id: int
+    profile: str
+    threads: int
+    memory_gb: float
+    waited_s: float = 0.0
+    started: float = field(default_factory=time.time)
+    rewrite: bool = True        # False for unprofiled scripts, which keep their own thread flags
+    _scheduler: Any = None
+
+    def apply(self, script: str) -> str:
+        """Script with its thread flags and thread environment set to the granted count"""
+        return apply_threads(script, self.threads) if self.rewrite else script
+
+    def release(self):
+        if self._scheduler is not None:
+            self._scheduler.release(self)
+            self._scheduler = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def apply_threads(script: str, threads: int) -> str:
+    """Rewrite thread flags and export the thread environment variables"""
+    rewritten = THREAD_FLAG_PATTERN.sub(lambda m: f"{m.group(1)}{m.group(2)}{threads}", script)
+    exports = " ".join(f"{name}={threads}" for name in THREAD_ENV_VARS)
+    return f"export {exports}\n{rewritten}"
+
+
+def requested_threads(script: str) -> Optional[int]:
+    """Largest thread count a script asks for in its flags (0 = all cores), None without flags"""
+    counts = [int(m.group(3)) for m in THREAD_FLAG_PATTERN.finditer(script)]
+    return max(counts) if counts else None
+
+
+class ResourceScheduler:
+    """FIFO admission of scripts against the node's free cores and memory"""
+
+    def __init__(self, cores: int, memory_gb: float, profiles: Dict[str, Dict[str, Any]],
+                 reserve_cores: int = 1, reserve_memory_gb: float = 8, probe_ttl: float = 10,
+                 wait_interval: float = 5, max_wait: Optional[float] = 3600,
+                 probe: Optional[Callable[[], Dict[str, float]]] = None):
+        self.cores = cores
+        self.memory_gb = memory_gb
+        self.reserve_cores = reserve_cores
+        self.reserve_memory_gb = reserve_memory_gb
+        self.probe_ttl = probe_ttl
+        self.wait_interval = wait_interval
+        self.max_wait = max_wait
+        self.profiles = [(name, {**spec, "pattern": re.compile(spec['match']) if spec.get('match') else None})
+                         for name, spec in profiles.items()]
+        self._probe_fn = probe or self._remote_probe
+        self._probe_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._queue: List[int] = []
+        self._running: Dict[int, Allocation] = {}
+        self._next_id = 0
+        self._reading: Dict[str, float] = {}
+        self._reading_at = 0.0
+        self._released: List[tuple] = []   # (time, threads) of recently finished jobs
+        self._completed = 0
+        self._total_wait = 0.0
+
+    # --- Node state -------------------------------------------------------------
+
+    def _remote_probe(self) -> Dict[str, float]:
+        """1-minute load average and available memory of the node (one remote call)"""
+        lines: List[str] = []
+        with untracked():
+            get_executor_client().run_command(
+                "cut -d' ' -f1 /proc/loadavg; awk '/^MemAvailable:/ {print $2}' /proc/meminfo",
+                env_name=None,
+                on_output=lambda stream, line: lines.append(line) if stream == "stdout" else None
+            )
+        if len(lines) < 2:
+            raise RuntimeError("Could not read load and memory from the node")
+        return {"load": float(lines[0]), "mem_available_gb": int(lines[1]) / 1024 ** 2}
+
+    def _refresh_reading(self):
+        """
+        Re-probe the node once the reading is older than probe_ttl (called
+        without holding the condition, so queued and releasing jobs never wait
+        on SSH); an unreachable node counts as idle so jobs are not blocked.
+        """
+        if time.time() - self._reading_at <= self.probe_ttl:
+            return
+        with self._probe_lock:
+            if time.time() - self._reading_at <= self.probe_ttl:
+                return  # Another thread probed meanwhile
+            try:
+                reading = self._probe_fn()
+            except Exception as e:
+                print(f"⚠️ Resource probe failed, using local accounting only: {e}")
+                reading = {}
+            with self._cond:
+                self._reading = reading
+                self._reading_at = time.time()
+
+    def _lingering_load(self, now: float) -> float:
+        """Share of the load average still caused by jobs that already finished (caller holds the condition)"""
+        self._released = [(at, threads) for at, threads in self._released if now - at < LINGER_S]
+        return sum(threads * math.exp(-(now - at) / LOADAVG_TAU_S) for at, threads in self._released)
+
+    def _free(self) -> Dict[str, float]:
+        """Cores and memory (GB) still available for new jobs, from the last reading (caller holds the condition)"""
+        reading = self._reading
+        our_threads = sum(a.threads for a in self._running.values())
+        our_memory = sum(a.memory_gb for a in self._running.values())
+        # Load beyond our own threads (running, or finished but still in the average) comes from other users
+        external_load = max(0.0, reading.get("load", 0.0) - our_threads - self._lingering_load(time.time()))
+        cores = self.cores - self.reserve_cores - our_threads - external_load
+        memory = self.memory_gb - self.reserve_memory_gb - our_memory
+        if "mem_available_gb" in reading:
+            memory = min(memory, reading["mem_available_gb"] - self.reserve_memory_gb)
+        return {"cores": cores, "memory_gb": memory}
+
+    # --- Admission --------------------------------------------------------------
+
+    def profile_for(self, script: str) -> Dict[str, Any]:
+        """Resource profile of the first matching tool (or "default")"""
+        fallback = {"name": "default", "min_threads": 1, "max_threads": 1, "memory_gb": 2}
+        for name, spec in self.profiles:
+            if spec['pattern'] is not None and spec['pattern'].search(script):
+                return {**spec, "name": name}
+            if name == "default":
+                fallback = {**spec, "name": name}
+        return fallback
+
+    def acquire(self, script: str) -> Allocation:
+        """Block until the script's profile fits on the node, then grant it"""
+        profile = self.profile_for(script)
+        min_threads = int(profile['min_threads'])
+        max_threads = int(profile['max_threads'])
+        memory = float(profile['memory_gb'])
+        # Unprofiled scripts run with the threads they ask for; only those are accounted
+        rewrite = profile['name'] != "default"
+        requested = None if rewrite else requested_threads(script)
+        # Admit those only once the threads they will actually use are free
+        if requested is not None and requested <= 0:
+            requested = self.cores  # --p-n-threads 0 (or -1): every core
+        needed = min_threads if requested is None else max(min_threads, requested)
+        enqueued = time.time()
+
+        with self._cond:
+            job_id = self._next_id
+            self._next_id += 1
+            self._queue.append(job_id)
+        announced = False
+        while True:
+            self._refresh_reading()
+            with self._cond:
+                free = self._free()
+                at_head = self._queue[0] == job_id
+                waited = time.time() - enqueued
+                fits = free['cores'] >= needed and free['memory_gb'] >= memory
+                # An idle scheduler always admits, so one oversized job cannot block forever
+                if at_head and (fits or not self._running
+                                or (self.max_wait is not None and waited >= self.max_wait)):
+                    self._queue.pop(0)
+                    if requested is None:
+                        threads = max(min_threads, min(max_threads, int(free['cores'])))
+                    else:
+                        threads = requested
+                    allocation = Allocation(job_id=job_id, profile=profile['name'], threads=threads,
+                                            memory_gb=memory, waited_s=time.time() - enqueued,
+                                            rewrite=rewrite, _scheduler=self)
+                    self._running[job_id] = allocation
+                    self._total_wait += allocation.waited_s
+                    self._cond.notify_all()
+                    break
+                if not announced:
+                    print(f"⏳ Queued {profile['name']} job (needs {needed} cores, {memory:g} GB; "
+                          f"free {max(free['cores'], 0):.1f} cores, {max(free['memory_gb'], 0):.0f} GB)")
+                    announced = True
+                self._cond.wait(self.wait_interval)
+        observe("labbio_scheduler_wait_seconds", allocation.waited_s, {"profile": profile['name']},
+                "Time scripts queued for cores and memory")
+        print(f"🎛️ Admitted {profile['name']} job with {threads} threads, {memory:g} GB"
+              + (f" after {allocation.waited_s:.0f}s" if allocation.waited_s >= 1 else ""))
+        return allocation
+
+    def release(self, allocation: Allocation):
+        with self._cond:
+            if self._running.pop(allocation.job_id, None) is not None:
+                self._completed += 1
+                # Its threads stay in the load average for a while; _free discounts them
+                self._released.append((time.time(), allocation.threads))
+            # Freed resources may admit the next queued job on the current reading
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth and utilization for the UI (uses the last reading, no remote call)"""
+        with self._cond:
+            threads = sum(a.threads for a in self._running.values())
+            memory = sum(a.memory_gb for a in self._running.values())
+            return {
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "threads_allocated": threads,
+                "cores": self.cores,
+                "memory_allocated_gb": memory,
+                "memory_gb": self.memory_gb,
+                "node_load": self._reading.get("load"),
+                "node_mem_available_gb": self._reading.get("mem_available_gb"),
+                "completed": self._completed,
+                "avg_wait_s": self._total_wait / max(1, self._completed + len(self._running)),
+                "jobs": [{"profile": a.profile, "threads": a.threads, "memory_gb": a.memory_gb,
+                          "elapsed_s": time.time() - a.started} for a in self._running.values()],
+            }
+
+
+# 全局单例
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[ResourceScheduler]:
+    """Shared scheduler, or None when `executor.scheduler.enabled` is false"""
+    global _scheduler
+    config = load_config()
+    settings = {**DEFAULT_SCHEDULER_SETTINGS, **config['executor'].get('scheduler', {})}
+    if not settings['enabled']:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ResourceScheduler(
+                    cores=settings['cores'],
+                    memory_gb=settings['memory_gb'],
+                    profiles=settings['profiles'],
+                    reserve_cores=settings['reserve_cores'],
+                    reserve_memory_gb=settings['reserve_memory_gb'],
+                    probe_ttl=settings['probe_ttl'],
+                    wait_interval=settings['wait_interval'],
+                    max_wait=settings['max_wait']
+                )
+    return _scheduler
+
+
+if __name__ == "__main__":
+    # Simulate three concurrent DADA2 runs on an otherwise idle node
+    scheduler = ResourceScheduler(
+        cores=18, memory_gb=256, profiles=DEFAULT_SCHEDULER_SETTINGS['profiles'],
+        wait_interval=0.2, probe=lambda: {"load": 0.5, "mem_available_gb": 240}
+    )
+    script = "qiime dada2 denoise-paired --i-demultiplexed-seqs demux.qza --p-n-threads 0 --o-table table.qza"
+
+    def worker(n):
+        with scheduler.acquire(script) as allocation:
+            print(f"  job {n}: {allocation.apply(script).splitlines()[-1]}")
+            time.sleep(1)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.3)
+    print(f"📊 {scheduler.snapshot()}")
+    for t in threads:
+        t.join()
@@ -0,0 +1,348 @@
+"""
+Warm Shell Sessions
+===================
+Long-lived bash sessions on the Muscle Node with a conda env already active.
+
+`conda activate` of a large env (qiime2-amplicon) takes seconds, and every
+run_command used to pay it again. A session is one SSH channel running
+`bash --noprofile --norc` in which the env was activated once; each script
+then runs in a child `bash -c` that inherits the activated environment (so
+`cd`, `exit` or `set -e` in a script cannot damage the session). The end of
+a script is found by a per-run sentinel line carrying its exit code on
+stdout, plus a matching sentinel on stderr so both streams are drained.
+
+Sessions are kept per env listed in `executor.envs`, recycled after
+`max_jobs` scripts, after a failed script, or when idle too long, and cache
+the tool version probes run in them.
+
+Which commands a session serves (ExecutorClient.stream_command with an env
+from `executor.envs`):
+- executor_node scripts that run directly (everything not detached)
+- the launch command of a detached job; the job's script does not activate
+  conda itself but inherits the session's environment
+Job polls, tails and cleanup, scheduler probes and inventory scans run with
+env None on plain exec channels, where there is no activation to save.
+"""
+
+import logging
+import math
+import re
+import select
+import shlex
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+from backend.utils.executor_client import DEFAULT_STREAM_SETTINGS, LOCAL_TIMEOUT_GRACE, _LineBuffer
+from backend.utils.metrics import observe
+
+# Defaults used when config.yaml has no `executor.sessions` section
+DEFAULT_SESSION_SETTINGS = {
+    "enabled": True,
+    "max_sessions_per_env": 2,   # Idle sessions kept per env (busy ones may exceed this)
+    "max_jobs": 50,              # Recycle a session after this many scripts
+    "idle_timeout": 600,         # Close sessions unused for this long (seconds)
+    "recycle_on_error": True,    # Start a fresh session after a script fails
+    "warm_on_start": True,       # Activate one session per env in the background at startup
+}
+
+
+class SessionError(RuntimeError):
+    """A session could not be started or lost its protocol state"""
+
+
+class ShellSession:
+    """One bash process on a pooled SSH channel with a conda env activated"""
+
+    def __init__(self, ssh_pool: Any, conda_path: str, env_name: str, stream_settings: Dict[str, Any]):
+        self.env_name = env_name
+        self.stream_settings = stream_settings
+        self.jobs = 0
+        self.broken = False
+        self.created = time.time()
+        self.last_used = self.created
+        self.versions: Dict[str, str] = {}
+        self._ssh_pool = ssh_pool
+        self.channel, self._pooled = ssh_pool.open_channel()
+        try:
+            self.channel.exec_command("bash --noprofile --norc")
+            start = time.time()
+            result = self._run(
+                f"source {conda_path}/etc/profile.d/conda.sh && conda activate {shlex.quote(env_name)}",
+                timeout=300
+            )
+            self.activation_s = time.time() - start
+        except Exception:
+            self.close()
+            raise
+        if result['return_code'] != 0:
+            self.close()
+            raise SessionError(f"conda activate {env_name} failed: {result['stderr'][-300:]}")
+        logging.info(f"SESSION: Activated {env_name} in {self.activation_s:.1f}s")
+        observe("labbio_env_activation_seconds", self.activation_s, {"env": env_name},
+                "conda activate time of new warm sessions")
+
+    def is_alive(self) -> bool:
+        return not self.broken and not self.channel.closed and not self.channel.exit_status_ready()
+
+    def close(self):
+        self.broken = True
+        try:
+            self._ssh_pool.release(self.channel, self._pooled)
+        except Exception:
+            pass
+
+    def _exchange(self, command: str, timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+        """
+        Send one command and read until both sentinels arrive, yielding output
+        lines and then {"stream": "exit", "result": {...}}.
+        """
+        cfg = self.stream_settings
+        out_buf = _LineBuffer(cfg['tail_lines'], cfg['max_line_bytes'])
+        err_buf = _LineBuffer(cfg['tail_lines'], cfg['max_line_bytes'])
+        chunk_size = int(cfg['read_chunk_bytes'])
+        marker = f"__LABBIO_DONE_{uuid.uuid4().hex}__"
+        done_pattern = re.compile(rf"^(.*){marker} (-?\d+)$")
+
+        self.channel.sendall((
+            f"{command}\n"
+            f"printf '%s %d\\n' '{marker}' \"$?\"\n"
+            f"printf '%s\\n' '{marker}' >&2\n"
+        ).encode('utf-8'))
+
+        exit_code = None
+        err_done = False
+        start = time.time()
+        while exit_code is None or not err_done:
+            select.select([self.channel], [], [], float(cfg['poll_interval']))
+            while self.channel.recv_ready():
+                for line in out_buf.feed(self.channel.recv(chunk_size)):
+                    match = done_pattern.match(line)
+                    if match:
+                        exit_code = int(match.group(2))
+                        line = match.group(1)
+                        out_buf.retract(keep=line)
+                    if line:
+                        yield {"stream": "stdout", "line": line}
+            while self.channel.recv_stderr_ready():
+                for line in err_buf.feed(self.channel.recv_stderr(chunk_size)):
+                    if line.endswith(marker):
+                        err_done = True
+                        line = line[:-len(marker)]
+                        err_buf.retract(keep=line)
+                    if line:
+                        yield {"stream": "stderr", "line": line}
+            if exit_code is not None and err_done:
+                break
+            if self.channel.exit_status_ready() and not self.channel.recv_ready():
+                self.broken = True
+                raise SessionError(f"Shell for {self.env_name} exited unexpectedly")
+            if timeout is not None and time.time() - start > timeout + LOCAL_TIMEOUT_GRACE:
+                # The session is mid-command and cannot be reused
+                self.broken = True
+                yield {"stream": "exit", "result": {
+                    "stdout": out_buf.tail_text(),
+                    "stderr": f"{err_buf.tail_text()}\nCommand timed out after {timeout}s".strip(),
+                    "return_code": -1}}
+                return
+
+        yield {"stream": "exit", "result": {
+            "stdout": out_buf.tail_text(), "stderr": err_buf.tail_text(), "return_code": exit_code}}
+
+    def _run(self, command: str, timeout: Optional[float]) -> Dict[str, Any]:
+        for event in self._exchange(command, timeout):
+            if event["stream"] == "exit":
+                return event["result"]
+
+    def stream(self, script: str, cwd: Optional[str] = None,
+               timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run a script in a child shell of this session, yielding the same
+        events as ExecutorClient.stream_command.
+        """
+        inner = script
+        if cwd:
+            inner = f"mkdir -p {cwd} && cd {cwd} && {script}"
+        delimiter = f"LABBIO_SCRIPT_{uuid.uuid4().hex}"
+        runner = f"timeout -k 10 {int(math.ceil(timeout))} bash -c" if timeout is not None else "bash -c"
+        command = f"{runner} \"$(cat <<'{delimiter}'\n{inner}\n{delimiter}\n)\" < /dev/null"
+
+        start = time.time()
+        self.jobs += 1
+        self.last_used = start
+        try:
+            for event in self._exchange(command, timeout):
+                if event["stream"] == "exit":
+                    result = event["result"]
+                    if timeout is not None and result['return_code'] == 124:
+                        result['stderr'] = f"{result['stderr']}\nCommand timed out after {timeout}s".strip()
+                    logging.info(f"SESSION: {self.env_name} job {self.jobs} exit {result['return_code']} "
+                                 f"({time.time() - start:.1f}s)")
+                yield event
+        except Exception:
+            self.broken = True
+            raise
+        finally:
+            self.last_used = time.time()
+
+    def tool_version(self, command: str) -> str:
+        """Output of a version probe (e.g. `qiime --version`), cached for this session"""
+        if command not in self.versions:
+            result = self._run(f"{command} 2>&1 | head -n 5", timeout=60)
+            self.versions[command] = result['stdout'].strip()
+        return self.versions[command]
+
+
+class ShellSessionPool:
+    """Warm sessions per conda env, shared by all ExecutorClients"""
+
+    def __init__(self, ssh_pool: Any, conda_path: str, envs: List[str],
+                 max_sessions_per_env: int = 2, max_jobs: int = 50, idle_timeout: float = 600,
+                 recycle_on_error: bool = True, stream_settings: Optional[Dict[str, Any]] = None):
+        self.ssh_pool = ssh_pool
+        self.conda_path = conda_path
+        self.envs = set(envs)
+        self.max_sessions_per_env = max(1, int(max_sessions_per_env))
+        self.max_jobs = max(1, int(max_jobs))
+        self.idle_timeout = idle_timeout
+        self.recycle_on_error = recycle_on_error
+        self.stream_settings = {**DEFAULT_STREAM_SETTINGS, **(stream_settings or {})}
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[ShellSession]] = {env: [] for env in self.envs}
+        self._counters = {"created": 0, "reused": 0, "recycled": 0, "activation_s": 0.0}
+
+    def serves(self, env_name: Optional[str]) -> bool:
+        return env_name in self.envs
+
+    def _new_session(self, env_name: str) -> ShellSession:
+        session = ShellSession(self.ssh_pool, self.conda_path, env_name, self.stream_settings)
+        with self._lock:
+            self._counters["created"] += 1
+            self._counters["activation_s"] += session.activation_s
+        return session
+
+    def acquire(self, env_name: str) -> ShellSession:
+        """An idle live session for the env, or a newly activated one"""
+        now = time.time()
+        with self._lock:
+            idle = self._idle[env_name]
+            while idle:
+                session = idle.pop()
+                if session.is_alive() and (not self.idle_timeout or now - session.last_used < self.idle_timeout):
+                    self._counters["reused"] += 1
+                    return session
+                session.close()
+        return self._new_session(env_name)
+
+    def release(self, session: ShellSession, failed: bool = False):
+        """Return a session after a script, or retire it"""
+        retire = (session.broken or not session.is_alive() or session.jobs >= self.max_jobs
+                  or (failed and self.recycle_on_error))
+        with self._lock:
+            if not retire and len(self._idle[session.env_name]) < self.max_sessions_per_env:
+                self._idle[session.env_name].append(session)
+                return
+            self._counters["recycled"] += 1
+        session.close()
+
+    def stream(self, session: ShellSession, script: str, cwd: Optional[str] = None,
+               timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Run a script on an acquired session and release it afterwards"""
+        failed = True
+        try:
+            for event in session.stream(script, cwd=cwd, timeout=timeout):
+                if event["stream"] == "exit":
+                    failed = event["result"]["return_code"] != 0
+                yield event
+        finally:
+            self.release(session, failed=failed)
+
+    def tool_version(self, env_name: str, command: str) -> str:
+        """Cached version probe run in a warm session of the env"""
+        session = self.acquire(env_name)
+        try:
+            return session.tool_version(command)
+        finally:
+            self.release(session)
+
+    def warm(self, envs: Optional[List[str]] = None):
+        """Activate one session per env in a background thread"""
+        def run():
+            for env_name in envs or sorted(self.envs):
+                try:
+                    self.release(self.acquire(env_name))
+                except Exception as e:
+                    logging.warning(f"SESSION: Could not warm {env_name}: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "idle": {env: len(s) for env, s in self._idle.items()}}
+
+    def close_all(self):
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle = {env: [] for env in self.envs}
+        for session in sessions:
+            session.close()
+
+
+# 全局单例
+_shell_pool = None
+_shell_pool_lock = threading.Lock()
+
+
+def get_shell_pool(client: Any = None) -> Optional[ShellSessionPool]:
+    """Shared session pool, or None when `executor.sessions.enabled` is false"""
+    global _shell_pool
+    config = load_config()
+    settings = {**DEFAULT_SESSION_SETTINGS, **config['executor'].get('sessions', {})}
+    if not settings['enabled']:
+        return None
+    if _shell_pool is None:
+        with _shell_pool_lock:
+            if _shell_pool is None:
+                if client is None:
+                    from backend.utils.executor_client import get_executor_client
+                    client = get_executor_client()
+                _shell_pool = ShellSessionPool(
+                    ssh_pool=client.pool,
+                    conda_path=client.conda_path,
+                    envs=list(config['executor'].get('envs', {}).values()),
+                    max_sessions_per_env=settings['max_sessions_per_env'],
+                    max_jobs=settings['max_jobs'],
+                    idle_timeout=settings['idle_timeout'],
+                    recycle_on_error=settings['recycle_on_error'],
+                    stream_settings=config['executor'].get('stream', {})
+                )
+                if settings['warm_on_start']:
+                    _shell_pool.warm()
+    return _shell_pool
+
+
+if __name__ == "__main__":
+    # Compare cold (exec + activate) and warm (session) runs
+    from backend.utils.executor_client import ExecutorClient
+
+    config = load_config()
+    env_name = config['executor']['envs']['obitools']
+    client = ExecutorClient()
+    pool = get_shell_pool(client)
+
+    start = time.time()
+    session = pool.acquire(env_name)
+    print(f"🔥 Activated {env_name} in {session.activation_s:.1f}s")
+    pool.release(session)
+    for n in range(3):
+        start = time.time()
+        session = pool.acquire(env_name)
+        result = [e for e in pool.stream(session, "obi --version; echo cwd=$(pwd)", cwd="/tmp")][-1]["result"]
+        print(f"  run {n}: {time.time() - start:.2f}s -> {result}")
+    print(f"🔖 {pool.tool_version(env_name, 'obi --version')}")
+    print(f"📊 {pool.stats()}")
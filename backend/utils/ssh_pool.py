@@ -0,0 +1,253 @@
+"""
+SSH Connection Pool
+===================
+Keeps authenticated paramiko Transports to the Ubuntu Muscle Node open
+and multiplexes many command channels over them, so short steps
+(mkdir, ls, obi count) no longer pay a TCP + key exchange + auth round trip.
+"""
+
+import socket
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import paramiko
+
+# Defaults used when config.yaml has no `executor.ssh` section
+DEFAULT_POOL_SETTINGS = {
+    "pool_size": 2,
+    "max_channels_per_transport": 8,
+    "idle_timeout": 300,
+    "keepalive_interval": 30,
+    "connect_timeout": 10,
+}
+
+
+def _observe(name: str, value: float, help_text: str):
+    """Record a timing in the executor metrics registry, if available"""
+    try:
+        from backend.utils.metrics import observe
+        observe(name, value, help_text=help_text)
+    except Exception:
+        pass
+
+
+class PooledTransport:
+    """An authenticated Transport plus its bookkeeping"""
+
+    def __init__(self, transport: "paramiko.Transport"):
+        self.transport = transport
+        self.active_channels = 0
+        self.last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        return self.transport.is_active() and self.transport.is_authenticated()
+
+    def close(self):
+        try:
+            self.transport.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """Thread-safe pool of authenticated SSH transports"""
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 pool_size: int = 2, max_channels_per_transport: int = 8,
+                 idle_timeout: float = 300, keepalive_interval: int = 30,
+                 connect_timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.pool_size = max(1, int(pool_size))
+        self.max_channels_per_transport = max(1, int(max_channels_per_transport))
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+
+        self._lock = threading.Lock()
+        self._transports: List[PooledTransport] = []
+        self._opening = 0  # Slots reserved by transports being connected outside the lock
+        self._slot_ready = threading.Condition(self._lock)
+
+    def _open_transport(self) -> PooledTransport:
+        """Establish and authenticate a new Transport"""
+        import paramiko  # Deferred: pulls in cryptography, only needed once we connect
+        start = time.monotonic()
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.start_client(timeout=self.connect_timeout)
+            transport.auth_password(self.username, self.password)
+        except Exception:
+            transport.close()
+            raise
+        if self.keepalive_interval:
+            transport.set_keepalive(int(self.keepalive_interval))
+        elapsed = time.monotonic() - start
+        logging.info(
+            f"SSH_POOL: Connected to {self.host}:{self.port} "
+            f"({elapsed:.2f}s, pool size {len(self._transports) + 1})"
+        )
+        _observe("labbio_ssh_connect_seconds", elapsed, "TCP connect, key exchange and auth")
+        return PooledTransport(transport)
+
+    def _prune(self):
+        """Drop dead transports and close idle ones (caller holds the lock)"""
+        now = time.monotonic()
+        alive = []
+        for pooled in self._transports:
+            if not pooled.is_alive():
+                logging.warning(f"SSH_POOL: Dropping dead transport to {self.host}")
+                pooled.close()
+            elif (pooled.active_channels == 0 and self.idle_timeout
+                  and now - pooled.last_used > self.idle_timeout):
+                logging.info(f"SSH_POOL: Closing idle transport to {self.host}")
+                pooled.close()
+            else:
+                alive.append(pooled)
+        self._transports = alive
+
+    def _acquire(self, avoid: Optional[PooledTransport] = None) -> PooledTransport:
+        """Pick the least loaded live transport (other than `avoid`), opening a new one if allowed"""
+        with self._lock:
+            while True:
+                self._prune()
+                candidates = [p for p in self._transports
+                              if p.active_channels < self.max_channels_per_transport and p is not avoid]
+                if candidates:
+                    pooled = min(candidates, key=lambda p: p.active_channels)
+                    break
+                if len(self._transports) + self._opening < self.pool_size:
+                    # Reserve the slot; the handshake happens outside the lock so other
+                    # threads keep using the live transports meanwhile
+                    pooled = None
+                    self._opening += 1
+                    break
+                if self._transports:
+                    # Pool is saturated: share the least loaded transport anyway
+                    pooled = min(self._transports, key=lambda p: p.active_channels)
+                    break
+                # Every slot is still connecting: wait for one of them
+                self._slot_ready.wait()
+            if pooled is not None:
+                pooled.active_channels += 1
+                pooled.last_used = time.monotonic()
+                return pooled
+
+        try:
+            pooled = self._open_transport()
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._slot_ready.notify_all()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._transports.append(pooled)
+            pooled.active_channels += 1
+            pooled.last_used = time.monotonic()
+            self._slot_ready.notify_all()
+        return pooled
+
+    def _release(self, pooled: PooledTransport, discard: bool = False):
+        with self._lock:
+            pooled.active_channels = max(0, pooled.active_channels - 1)
+            pooled.last_used = time.monotonic()
+            if discard and pooled in self._transports:
+                self._transports.remove(pooled)
+                pooled.close()
+
+    def open_channel(self) -> Tuple["paramiko.Channel", PooledTransport]:
+        """
+        Open a session channel, reconnecting once if the transport went stale.
+        The caller must hand the returned PooledTransport back via release().
+        """
+        last_error: Optional[Exception] = None
+        refused = None
+        for _ in range(2):
+            start = time.monotonic()
+            pooled = self._acquire(avoid=refused)
+            try:
+                channel = pooled.transport.open_session(timeout=self.connect_timeout)
+                _observe("labbio_ssh_channel_open_seconds", time.monotonic() - start,
+                         "Channel open including any reconnect")
+                return channel, pooled
+            except Exception as e:
+                last_error = e
+                # Only a dead transport is dropped: a live one (e.g. at sshd's MaxSessions)
+                # still carries other exec channels and warm shell sessions
+                alive = pooled.is_alive()
+                logging.warning(f"SSH_POOL: Channel open failed ({e}), "
+                                f"{'retrying' if alive else 'reconnecting'}...")
+                self._release(pooled, discard=not alive)
+                refused = pooled if alive else None
+        raise last_error
+
+    def release(self, channel: "paramiko.Channel", pooled: PooledTransport):
+        """Close a channel and return its transport slot to the pool"""
+        try:
+            channel.close()
+        finally:
+            self._release(pooled, discard=not pooled.is_alive())
+
+    @contextmanager
+    def channel(self):
+        """Context manager yielding a fresh session channel"""
+        channel, pooled = self.open_channel()
+        try:
+            yield channel
+        finally:
+            self.release(channel, pooled)
+
+    def check_health(self) -> bool:
+        """Verify that a live, authenticated transport is available"""
+        with self.channel() as channel:
+            return channel.get_transport().is_active()
+
+    def stats(self) -> Dict[str, int]:
+        """Current pool occupancy"""
+        with self._lock:
+            return {
+                "transports": len(self._transports),
+                "active_channels": sum(p.active_channels for p in self._transports),
+            }
+
+    def close_all(self):
+        """Close every pooled transport"""
+        with self._lock:
+            for pooled in self._transports:
+                pooled.close()
+            self._transports = []
+
+
+# 全局连接池 (按 host/port/user 共享)
+_pools: Dict[Tuple[str, int, str], SSHConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(host: str, port: int, username: str, password: str,
+                 settings: Optional[dict] = None) -> SSHConnectionPool:
+    """Get the shared pool for a host, creating it on first use"""
+    key = (host, port, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = dict(DEFAULT_POOL_SETTINGS)
+            options.update({k: v for k, v in (settings or {}).items() if k in options})
+            pool = SSHConnectionPool(host, port, username, password, **options)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    """Close every shared pool (e.g. on application shutdown)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
@@ -0,0 +1,295 @@
+"""
+Run Tracing
+===========
+Timed spans for graph runs, written to one JSONL trace file per run.
+
+Every graph node is wrapped by `traced_node` (see graph.py), which binds the
+run's trace to the current context and opens a node span carrying the step,
+sample and retry number. Work inside a node opens child spans with `span()`
+(retrieval, remote execution) or passes `llm_callbacks()` to LangChain calls
+to record completion time and prompt/completion token counts. Spans are
+appended to `<tracing.dir>/<run_id>.jsonl` as they finish, so a trace of an
+interrupted run is still readable; the Terminal Monitor tab renders them as
+a waterfall. In memory, a run's trace is dropped by `end_trace()` when the
+run ends, and at most MAX_LIVE_TRACES are kept in any case.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.config import load_config
+
+# Defaults used when config.yaml has no `workflow.tracing` section
+DEFAULT_TRACING_SETTINGS = {
+    "enabled": True,
+    "dir": "./Documents/logs/traces",
+}
+
+_active_trace: ContextVar[Optional["RunTrace"]] = ContextVar("labbio_trace", default=None)
+_parent_span: ContextVar[Optional[str]] = ContextVar("labbio_parent_span", default=None)
+
+
+def _tracing_settings() -> Dict[str, Any]:
+    config = load_config()
+    return {**DEFAULT_TRACING_SETTINGS, **config.get('workflow', {}).get('tracing', {})}
+
+
+class RunTrace:
+    """Spans of one run, appended to its trace file as they finish"""
+
+    def __init__(self, run_id: str, path: Optional[str]):
+        self.run_id = run_id
+        self.path = path
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def add(self, name: str, kind: str, start: float, end: float,
+            parent_id: Optional[str] = None, span_id: Optional[str] = None,
+            attrs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        record = {
+            "run_id": self.run_id,
+            "span_id": span_id or uuid.uuid4().hex[:12],
+            "parent_id": parent_id,
+            "name": name,
+            "kind": kind,
+            "start": start,
+            "end": end,
+            "duration_s": round(end - start, 4),
+            "thread": threading.current_thread().name,
+            "attrs": {k: v for k, v in (attrs or {}).items() if v is not None},
+        }
+        with self._lock:
+            self.spans.append(record)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+        return record
+
+
+# 全局单例 (按 run_id, least recently used first)
+_traces: "OrderedDict[str, RunTrace]" = OrderedDict()
+_traces_lock = threading.Lock()
+
+# Runs whose spans are held in memory; older ones are dropped (their files stay)
+MAX_LIVE_TRACES = 32
+
+
+def get_trace(run_id: str) -> Optional[RunTrace]:
+    """Trace for a run, or None when `workflow.tracing.enabled` is false"""
+    settings = _tracing_settings()
+    if not settings['enabled']:
+        return None
+    with _traces_lock:
+        trace = _traces.get(run_id)
+        if trace is None:
+            trace = RunTrace(run_id, os.path.join(settings['dir'], f"{run_id}.jsonl"))
+            _traces[run_id] = trace
+            while len(_traces) > MAX_LIVE_TRACES:
+                _traces.popitem(last=False)
+        else:
+            _traces.move_to_end(run_id)
+        return trace
+
+
+def end_trace(run_id: str) -> Optional[RunTrace]:
+    """Drop a finished run's trace from memory and return it (the trace file is kept)"""
+    with _traces_lock:
+        return _traces.pop(run_id, None)
+
+
+def current_trace() -> Optional[RunTrace]:
+    return _active_trace.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "step", **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block as a child of the current span. Yields the span's attribute
+    dict so results (hit counts, exit codes) can be added before it closes.
+    Outside a traced run this is a no-op.
+    """
+    trace = _active_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    span_id = uuid.uuid4().hex[:12]
+    parent_id = _parent_span.get()
+    token = _parent_span.set(span_id)
+    start = time.time()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        _parent_span.reset(token)
+        trace.add(name, kind, start, time.time(), parent_id=parent_id, span_id=span_id, attrs=attrs)
+
+
+def traced_node(name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """
+    Wrap a graph node so it runs inside a span of its run's trace.
+    The run is the graph config's thread_id (the run ID, see runs.py).
+    """
+    def node(state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        run_id = ((config or {}).get("configurable") or {}).get("thread_id") or "adhoc"
+        trace = get_trace(run_id)
+        if trace is None:
+            return fn(state)
+        token = _active_trace.set(trace)
+        try:
+            with span(name, kind="node",
+                      step=(state.get('current_step') or "")[:120] or None,
+                      sample=state.get('sample_id'),
+                      retry=state.get('retry_count') or 0):
+                return fn(state)
+        finally:
+            _active_trace.reset(token)
+
+    node.__name__ = getattr(fn, "__name__", name)
+    node.__doc__ = fn.__doc__
+    return node
+
+
+class TraceCallback(BaseCallbackHandler):
+    """Records each LLM completion as an 'llm' span with token counts"""
+
+    run_inline = True
+
+    def __init__(self, label: str):
+        self.label = label
+        # Captured now: callbacks may fire outside the node's context
+        self._trace = _active_trace.get()
+        self._parent = _parent_span.get()
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+
+    def _start(self, run_id: Any, prompt_text: str, serialized: Optional[Dict[str, Any]]):
+        model = ((serialized or {}).get("kwargs") or {}).get("model_name")
+        self._pending[run_id] = {"start": time.time(), "prompt": prompt_text, "model": model}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any):
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._start(run_id, text, serialized)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any):
+        self._start(run_id, "\n".join(prompts), serialized)
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any):
+        pending = self._pending.pop(run_id, None)
+        if pending is None or self._trace is None:
+            return
+        from backend.utils.prompt_packer import estimate_tokens
+
+        completion = "".join(g.text for gens in response.generations for g in gens)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            # Streaming responses usually carry usage on the message instead
+            for gens in response.generations:
+                for g in gens:
+                    meta = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens = meta.get("input_tokens", prompt_tokens)
+                    completion_tokens = meta.get("output_tokens", completion_tokens)
+        estimated = prompt_tokens is None
+        if estimated:
+            prompt_tokens = estimate_tokens(pending["prompt"])
+            completion_tokens = estimate_tokens(completion)
+        self._trace.add("llm", "llm", pending["start"], time.time(), parent_id=self._parent, attrs={
+            "label": self.label,
+            "model": pending["model"],
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": estimated or None,
+        })
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any):
+        pending = self._pending.pop(run_id, None)
+        if pending is not None and self._trace is not None:
+            self._trace.add("llm", "llm", pending["start"], time.time(), parent_id=self._parent,
+                            attrs={"label": self.label, "error": str(error)[:300]})
+
+
+def llm_callbacks(label: str) -> List[BaseCallbackHandler]:
+    """Callbacks to pass to chain.invoke so the completion is traced (empty outside a run)"""
+    return [TraceCallback(label)] if _active_trace.get() is not None else []
+
+
+def load_trace(run_id: str) -> List[Dict[str, Any]]:
+    """Spans of a run from its trace file, in start order"""
+    path = os.path.join(_tracing_settings()['dir'], f"{run_id}.jsonl")
+    spans = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return []
+    return sorted(spans, key=lambda s: s["start"])
+
+
+def list_traces(limit: int = 20) -> List[str]:
+    """Run IDs with a trace file, most recent first"""
+    trace_dir = Path(_tracing_settings()['dir'])
+    if not trace_dir.exists():
+        return []
+    files = sorted(trace_dir.glob("*.jsonl"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [p.stem for p in files[:limit]]
+
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Total time, calls and tokens per span name (nodes by node name, plus llm/retrieval/exec)"""
+    summary: Dict[str, Dict[str, float]] = {}
+    for s in spans:
+        entry = summary.setdefault(s["name"], {"calls": 0, "total_s": 0.0, "max_s": 0.0, "tokens": 0})
+        entry["calls"] += 1
+        entry["total_s"] += s["duration_s"]
+        entry["max_s"] = max(entry["max_s"], s["duration_s"])
+        entry["tokens"] += s["attrs"].get("prompt_tokens", 0) + s["attrs"].get("completion_tokens", 0)
+    return summary
+
+
+if __name__ == "__main__":
+    # Print the span tree and per-name totals of a run
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show a run's trace")
+    parser.add_argument("run_id", nargs="?", help="Run ID (default: most recent trace)")
+    args = parser.parse_args()
+
+    run_id = args.run_id or next(iter(list_traces(1)), None)
+    spans = load_trace(run_id) if run_id else []
+    if not spans:
+        print("No traces found")
+        sys.exit(0)
+    t0 = spans[0]["start"]
+    depth = {}
+    for s in spans:
+        depth[s["span_id"]] = depth.get(s["parent_id"], -1) + 1
+        attrs = " ".join(f"{k}={v}" for k, v in s["attrs"].items() if k != "step")
+        print(f"{s['start'] - t0:8.2f}s {'  ' * depth[s['span_id']]}{s['name']:<14} {s['duration_s']:8.2f}s  {attrs}")
+    print()
+    for name, entry in sorted(summarize(spans).items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"{name:<16} calls={entry['calls']:<4} total={entry['total_s']:.2f}s max={entry['max_s']:.2f}s"
+              + (f" tokens={entry['tokens']}" if entry['tokens'] else ""))
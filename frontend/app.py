@@ -1,6 +1,7 @@
 import streamlit as st
 import sys
 import time
+from collections import deque
 from pathlib import Path
 
 # Add project root to sys.path
@@ -9,7 +10,9 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from frontend.components.sidebar import render_sidebar
 from frontend.components.chat import render_chat_message, render_agent_step
+from frontend.components.trace_view import render_trace_view
 from backend.agents.graph import create_graph
+from backend.agents.runs import get_run_store, new_run_id, prepare_resume, stream_run
 from langchain_core.messages import HumanMessage
 
 # Page Config
@@ -47,6 +50,140 @@ if "messages" not in st.session_state:
 # Render Sidebar (Simplified)
 render_sidebar()
 
+def render_run(events):
+    """Render a graph run's (mode, output) stream into the chat tab"""
+    # Create progress containers
+    status_container = st.empty()
+    progress_container = st.container()
+    
+    # Stream events
+    current_step_display = ""
+    step_count = 0
+    total_steps = 0
+    
+    # Live tail of remote command output (fed by executor progress events)
+    live_output = st.empty()
+    live_lines = deque(maxlen=30)
+    last_render = 0.0
+    
+    # Code being written by a worker, rendered as tokens arrive
+    live_code = st.empty()
+    code_buffers = {}
+    last_code_render = 0.0
+    
+    for mode, output in events:
+        if mode == "custom":
+            if output.get("type") == "executor_output":
+                prefix = f"[{output['node'].split(':', 1)[1]}] " if ":" in output["node"] else ""
+                live_lines.extend(
+                    f"{prefix}[stderr] {item['line']}" if item["stream"] == "stderr" else f"{prefix}{item['line']}"
+                    for item in output["lines"]
+                )
+                # Throttle redraws; Streamlit re-renders the whole element
+                if time.time() - last_render > 0.25:
+                    live_output.code("\n".join(live_lines), language="text")
+                    last_render = time.time()
+            elif output.get("type") in ("llm_token", "llm_done"):
+                node = output["node"]
+                if output["type"] == "llm_token":
+                    code_buffers[node] = code_buffers.get(node, "") + output["text"]
+                # Markdown renders the open ```bash fence as a growing code block
+                if output["type"] == "llm_done" or time.time() - last_code_render > 0.1:
+                    agent, _, sample = node.partition(":")
+                    label = f"{agent.upper()}" + (f" · {sample}" if sample else "")
+                    live_code.markdown(f"✍️ **{label} is writing code...**\n\n{code_buffers[node]}")
+                    last_code_render = time.time()
+            continue
+        
+        for node_name, node_state in output.items():
+            if not node_state:
+                continue
+            step_count += 1
+            
+            # Update current status with emoji
+            if node_name == "supervisor":
+                current_step_display = "🧠 **Supervisor**: Analyzing and Planning"
+                if "plan" in node_state:
+                    total_steps = len(node_state["plan"])
+            elif node_name == "obitools":
+                current_step_display = "🦠 **OBITools Agent**: Generating Code"
+            elif node_name == "qiime":
+                current_step_display = "📊 **QIIME2 Agent**: Generating Code"
+            elif node_name == "executor":
+                current_step_display = "🚀 **Executor**: Running on Ubuntu Server"
+            elif node_name == "sample_branch":
+                current_step_display = "🔀 **Per-Sample Batch**: Running samples in parallel"
+            elif node_name == "sample_reduce":
+                current_step_display = "🔁 **Per-Sample Batch**: Collecting results"
+            
+            # Display status
+            status_html = f'<div class="status-box">{current_step_display}</div>'
+            if total_steps > 0:
+                status_html += f'<div class="step-indicator">Progress: Step {step_count}/{total_steps*2}</div>'
+            status_container.markdown(status_html, unsafe_allow_html=True)
+            
+            # Handle Supervisor Output
+            if node_name == "supervisor":
+                if "plan" in node_state:
+                    plan = node_state["plan"]
+                    with progress_container:
+                        st.success(f"📋 **Plan Generated**: {len(plan)} steps")
+                        with st.expander("View Full Plan"):
+                            for i, step in enumerate(plan, 1):
+                                st.write(f"{i}. {step}")
+                    st.session_state.messages.append({"type": "step", "step_type": "Plan", "content": plan})
+            
+            # Handle Workers Output (Obitools/Qiime)
+            elif node_name in ["obitools", "qiime"]:
+                # The streamed draft is replaced by the cleaned code that will run
+                live_code.empty()
+                code_buffers.pop(node_name, None)
+                if "generated_code" in node_state:
+                    code = node_state["generated_code"]
+                    with progress_container:
+                        st.info(f"💻 **Code Generated by {node_name.upper()}**")
+                        st.code(code, language="bash")
+                    st.session_state.messages.append({"type": "step", "step_type": "Code", "content": code})
+            
+            # Handle Per-Sample Branch Output
+            elif node_name == "sample_branch":
+                for sample_result in node_state.get("sample_results", []):
+                    for agent in ("obitools", "qiime"):
+                        code_buffers.pop(f"{agent}:{sample_result['sample']}", None)
+                    with progress_container:
+                        icon = "✅" if sample_result["return_code"] == 0 else "❌"
+                        st.caption(f"{icon} Sample **{sample_result['sample']}** "
+                                   f"finished in {sample_result['duration']:.1f}s")
+            
+            # Handle Executor Output (single run or reduced per-sample batch)
+            elif node_name in ["executor", "sample_reduce"]:
+                live_code.empty()
+                live_output.empty()
+                live_lines.clear()
+                if "last_execution_result" in node_state:
+                    result = node_state["last_execution_result"]
+                    with progress_container:
+                        if result["return_code"] == 0:
+                            st.success("✅ **Execution Successful**")
+                            if result["stdout"]:
+                                with st.expander("View Output"):
+                                    st.text(result["stdout"])
+                        else:
+                            st.error("❌ **Execution Failed**")
+                            st.code(result["stderr"], language="text")
+                    st.session_state.messages.append({"type": "step", "step_type": "Execution", "content": result})
+    
+    # Clear status
+    status_container.empty()
+    
+    # Final Success Message
+    final_msg = "✅ Task Completed Successfully!"
+    st.session_state.messages.append({"type": "assistant", "content": final_msg})
+    with progress_container:
+        st.balloons()
+        st.success(final_msg)
+
+
 # Main Layout
 st.title("🧬 Local-IA Intelligent Assistant")
 
@@ -66,6 +203,26 @@ with tab_chat:
         elif msg["type"] == "step":
             render_agent_step(msg["step_type"], msg["content"])
 
+    # Resume a checkpointed run that did not complete
+    store = get_run_store()
+    unfinished = [run for run in store.list_runs() if run["status"] != "completed"] if store else []
+    if unfinished:
+        with st.expander(f"⏯️ Resume a previous run ({len(unfinished)} unfinished)"):
+            labels = {f"{run['run_id']} · {run['status']} · {run['request'][:60]}": run["run_id"] for run in unfinished}
+            choice = st.selectbox("Run", list(labels))
+            if st.button("Resume Run"):
+                with st.spinner("Resuming..."):
+                    try:
+                        app = create_graph(checkpointer=store.checkpointer)
+                        prepare_resume(app, labels[choice])
+                        render_run(stream_run(app, labels[choice], None))
+                    except ValueError as e:
+                        st.warning(str(e))
+                    except Exception as e:
+                        st.error(f"An error occurred: {e}")
+                        import traceback
+                        st.code(traceback.format_exc())
+
     # User Input
     if prompt := st.chat_input("How can I help you with your analysis?"):
         # Add user message to state
@@ -75,7 +232,8 @@ with tab_chat:
         # Run Agent
         with st.spinner("Thinking..."):
             try:
-                app = create_graph()
+                store = get_run_store()
+                app = create_graph(checkpointer=store.checkpointer if store else None)
                 initial_state = {
                     "messages": [HumanMessage(content=prompt)],
                     "plan": [],
@@ -85,81 +243,11 @@ with tab_chat:
                     "errors": []
                 }
                 
-                # Create progress containers
-                status_container = st.empty()
-                progress_container = st.container()
-                
-                # Stream events
-                current_step_display = ""
-                step_count = 0
-                total_steps = 0
-                
-                for output in app.stream(initial_state, {"recursion_limit": 50}):
-                    for node_name, node_state in output.items():
-                        step_count += 1
-                        
-                        # Update current status with emoji
-                        if node_name == "supervisor":
-                            current_step_display = "🧠 **Supervisor**: Analyzing and Planning"
-                            if "plan" in node_state:
-                                total_steps = len(node_state["plan"])
-                        elif node_name == "obitools":
-                            current_step_display = "🦠 **OBITools Agent**: Generating Code"
-                        elif node_name == "qiime":
-                            current_step_display = "📊 **QIIME2 Agent**: Generating Code"
-                        elif node_name == "executor":
-                            current_step_display = "🚀 **Executor**: Running on Ubuntu Server"
-                        
-                        # Display status
-                        status_html = f'<div class="status-box">{current_step_display}</div>'
-                        if total_steps > 0:
-                            status_html += f'<div class="step-indicator">Progress: Step {step_count}/{total_steps*2}</div>'
-                        status_container.markdown(status_html, unsafe_allow_html=True)
-                        
-                        # Handle Supervisor Output
-                        if node_name == "supervisor":
-                            if "plan" in node_state:
-                                plan = node_state["plan"]
-                                with progress_container:
-                                    st.success(f"📋 **Plan Generated**: {len(plan)} steps")
-                                    with st.expander("View Full Plan"):
-                                        for i, step in enumerate(plan, 1):
-                                            st.write(f"{i}. {step}")
-                                st.session_state.messages.append({"type": "step", "step_type": "Plan", "content": plan})
-                        
-                        # Handle Workers Output (Obitools/Qiime)
-                        elif node_name in ["obitools", "qiime"]:
-                            if "generated_code" in node_state:
-                                code = node_state["generated_code"]
-                                with progress_container:
-                                    st.info(f"💻 **Code Generated by {node_name.upper()}**")
-                                    st.code(code, language="bash")
-                                st.session_state.messages.append({"type": "step", "step_type": "Code", "content": code})
-                        
-                        # Handle Executor Output
-                        elif node_name == "executor":
-                            if "last_execution_result" in node_state:
-                                result = node_state["last_execution_result"]
-                                with progress_container:
-                                    if result["return_code"] == 0:
-                                        st.success("✅ **Execution Successful**")
-                                        if result["stdout"]:
-                                            with st.expander("View Output"):
-                                                st.text(result["stdout"])
-                                    else:
-                                        st.error("❌ **Execution Failed**")
-                                        st.code(result["stderr"], language="text")
-                                st.session_state.messages.append({"type": "step", "step_type": "Execution", "content": result})
-                
-                # Clear status
-                status_container.empty()
-                
-                # Final Success Message
-                final_msg = "✅ Task Completed Successfully!"
-                st.session_state.messages.append({"type": "assistant", "content": final_msg})
-                with progress_container:
-                    st.balloons()
-                    st.success(final_msg)
+                # Without checkpointing the run ID still names the trace file
+                run_id = new_run_id()
+                if store is not None:
+                    st.caption(f"🆔 Run ID: `{run_id}` (resume it from 'Resume a previous run' if the session is interrupted)")
+                render_run(stream_run(app, run_id, initial_state))
                 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
@@ -185,3 +273,6 @@ with tab_terminal:
         
     if st.button("Refresh Terminal"):
         st.rerun()
+    
+    st.markdown("### 🕒 Run Timeline")
+    render_trace_view()
@@ -35,6 +35,32 @@ def render_sidebar():
         st.info(f"Model: {model_name}")
         st.caption(f"Provider: {provider}")
         
+        if config['llm'].get('cache', {}).get('enabled'):
+            from backend.utils.llm_cache import get_llm_cache
+            cache_stats = get_llm_cache(config).stats()
+            st.caption(
+                f"💾 Response cache: {cache_stats['entries']} entries | "
+                f"hit rate {cache_stats['hit_rate']:.0%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})"
+            )
+        
+        if config['executor'].get('exec_cache', {}).get('enabled', True):
+            from backend.utils.exec_cache import get_execution_cache
+            exec_stats = get_execution_cache().stats()
+            st.caption(
+                f"♻️ Execution cache: {exec_stats['entries']} runs recorded | "
+                f"hits {exec_stats['hits']}/{exec_stats['hits'] + exec_stats['misses']}"
+            )
+        
+        if config['executor'].get('scheduler', {}).get('enabled', True):
+            from backend.utils.scheduler import get_scheduler
+            sched = get_scheduler().snapshot()
+            st.caption(
+                f"🎛️ Muscle node: {sched['threads_allocated']}/{sched['cores']} cores, "
+                f"{sched['memory_allocated_gb']:.0f}/{sched['memory_gb']} GB allocated | "
+                f"{sched['running']} running, {sched['queued']} queued"
+                + (f" | load {sched['node_load']:.1f}" if sched['node_load'] is not None else "")
+            )
+        
         # RAG Status
         st.subheader("📚 Knowledge Base")
         st.info(f"Collection: {config['rag']['collection_name']}")
@@ -0,0 +1,73 @@
+import streamlit as st
+import sys
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from backend.utils.tracing import list_traces, load_trace, summarize
+
+# Bar colors per span kind
+KIND_COLORS = {"node": "#667eea", "llm": "#f39c12", "retrieval": "#27ae60", "exec": "#e74c3c", "step": "#95a5a6"}
+
+def render_trace_view():
+    """Renders a run's trace as a waterfall plus per-span totals."""
+    run_ids = list_traces()
+    if not run_ids:
+        st.info("No run traces yet.")
+        return
+
+    run_id = st.selectbox("Run trace", run_ids)
+    spans = load_trace(run_id)
+    if not spans:
+        st.info("Trace is empty.")
+        return
+
+    # Indent child spans under their parents, in start order
+    t0 = spans[0]["start"]
+    depth = {}
+    rows = []
+    for i, span in enumerate(spans):
+        depth[span["span_id"]] = depth.get(span["parent_id"], -1) + 1
+        attrs = span["attrs"]
+        label = attrs.get("label") or attrs.get("sample") or attrs.get("tool") or attrs.get("env") or ""
+        rows.append({
+            "order": i,
+            "span": f"{'· ' * depth[span['span_id']]}{span['name']}" + (f" [{label}]" if label else ""),
+            "kind": span["kind"],
+            "start_s": round(span["start"] - t0, 3),
+            "end_s": round(span["end"] - t0, 3),
+            "duration_s": span["duration_s"],
+            "tokens": attrs.get("prompt_tokens", 0) + attrs.get("completion_tokens", 0),
+            "retry": attrs.get("retry", ""),
+            "details": ", ".join(f"{k}={v}" for k, v in attrs.items()
+                                 if k not in ("label", "step", "retry", "prompt_tokens", "completion_tokens")),
+        })
+
+    total = max(row["end_s"] for row in rows)
+    st.caption(f"{len(spans)} spans · {total:.1f}s wall time")
+
+    try:
+        import altair as alt
+        import pandas as pd
+
+        data = pd.DataFrame(rows)
+        chart = alt.Chart(data).mark_bar().encode(
+            x=alt.X("start_s:Q", title="Seconds since run start"),
+            x2="end_s:Q",
+            y=alt.Y("span:N", sort=alt.EncodingSortField(field="order"), title=None),
+            color=alt.Color("kind:N", scale=alt.Scale(domain=list(KIND_COLORS), range=list(KIND_COLORS.values()))),
+            tooltip=["span", "kind", "duration_s", "tokens", "retry", "details"],
+        ).properties(height=max(200, 22 * len(rows)))
+        st.altair_chart(chart, use_container_width=True)
+    except ImportError:
+        st.dataframe(rows, use_container_width=True)
+
+    # Where the time went
+    summary = summarize(spans)
+    st.markdown("**⏱️ Time by span**")
+    st.dataframe(
+        [{"span": name, "calls": entry["calls"], "total_s": round(entry["total_s"], 2),
+          "max_s": round(entry["max_s"], 2), "tokens": entry["tokens"]}
+         for name, entry in sorted(summary.items(), key=lambda kv: -kv[1]["total_s"])],
+        use_container_width=True
+    )
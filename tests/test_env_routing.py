@@ -0,0 +1,115 @@
+"""
+Which conda env each remote command runs in, and so which ones the warm
+shell sessions (shell_sessions.py) actually serve.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.config import load_config, set_config_overrides
+from backend.utils import shell_sessions
+from backend.utils.executor_client import ExecutorClient
+from backend.utils.remote_jobs import DetachedJobRunner, LocalShell
+
+
+class RecordingShell(LocalShell):
+    """LocalShell that remembers the env of every command"""
+
+    def __init__(self):
+        self.envs = []
+
+    def run_command(self, script, cwd=None, env_name=None, on_output=None, timeout=None):
+        self.envs.append(env_name)
+        return super().run_command(script, cwd=cwd, env_name=env_name, on_output=on_output, timeout=timeout)
+
+
+class FakeSessionPool:
+    def __init__(self, envs):
+        self.envs = set(envs)
+        self.streamed = []
+
+    def serves(self, env_name):
+        return env_name in self.envs
+
+    def acquire(self, env_name):
+        return env_name
+
+    def stream(self, session, script, cwd=None, timeout=None):
+        self.streamed.append(session)
+        yield {"stream": "exit", "result": {"stdout": "", "stderr": "", "return_code": 0}}
+
+
+@pytest.fixture
+def no_metrics():
+    set_config_overrides({"executor": {"metrics": {"enabled": False}}})
+    yield
+    set_config_overrides(None)
+
+
+def test_executor_node_envs_are_served_by_sessions():
+    pytest.importorskip("langchain_core")
+    from backend.agents.nodes import pick_env
+
+    envs = set(load_config()['executor']['envs'].values())
+    assert pick_env("qiime dada2 denoise-paired --i-demultiplexed-seqs demux.qza") in envs
+    assert pick_env("obi uniq -m sample reads/merged uniq") in envs
+
+
+def test_job_launch_uses_step_env_and_control_commands_plain_shell(tmp_path, no_metrics):
+    shell = RecordingShell()
+    runner = DetachedJobRunner(shell, root=str(tmp_path / "jobs"), poll_interval=0.2, min_poll_interval=0.05)
+
+    result = runner.run("echo hello", env_name="obi3")
+
+    assert result["return_code"] == 0
+    assert result["stdout"] == "hello"
+    # find_running, then the launch in the step's env, then polls/cleanup without one
+    assert shell.envs[1] == "obi3"
+    assert set(shell.envs[:1] + shell.envs[2:]) == {None}
+
+
+def test_stream_command_uses_sessions_only_for_configured_envs(monkeypatch, no_metrics):
+    pool = FakeSessionPool(load_config()['executor']['envs'].values())
+    monkeypatch.setattr(shell_sessions, "get_shell_pool", lambda client=None: pool)
+    client = ExecutorClient.__new__(ExecutorClient)
+    client.config = load_config()
+    execs = []
+
+    def fake_exec(script, cwd, env_name, timeout):
+        execs.append(env_name)
+        yield {"stream": "exit", "result": {"stdout": "", "stderr": "", "return_code": 0}}
+
+    client._stream_exec = fake_exec
+    qiime_env = load_config()['executor']['envs']['qiime2']
+    for env_name in (qiime_env, None, "base"):
+        list(client.stream_command("true", env_name=env_name))
+
+    assert pool.streamed == [qiime_env]
+    assert execs == [None, "base"]
+
+
+class DroppingSessionPool(FakeSessionPool):
+    """Session whose link drops after the first line of output"""
+
+    def stream(self, session, script, cwd=None, timeout=None):
+        yield {"stream": "stdout", "line": "partial"}
+        raise shell_sessions.SessionError("Shell obi3 exited unexpectedly")
+
+
+def test_dropped_session_returns_ssh_error(monkeypatch, no_metrics):
+    pool = DroppingSessionPool(load_config()['executor']['envs'].values())
+    monkeypatch.setattr(shell_sessions, "get_shell_pool", lambda client=None: pool)
+    client = ExecutorClient.__new__(ExecutorClient)
+    client.config = load_config()
+    lines = []
+
+    result = client.run_command("obi count reads", env_name=load_config()['executor']['envs']['obitools'],
+                                on_output=lambda stream, line: lines.append(line))
+
+    assert result["return_code"] == -1
+    assert result["stderr"].startswith("SSH Execution Error: Shell obi3 exited")
+    assert result["stdout"] == "partial"
+    assert lines == ["partial"]
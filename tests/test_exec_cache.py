@@ -0,0 +1,103 @@
+"""
+When the execution cache looks up and stores runs (local files stand in for the node).
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.utils import exec_cache
+from backend.utils.exec_cache import ExecutionCache
+from backend.utils.remote_jobs import LocalShell
+
+
+class CountingShell(LocalShell):
+    def __init__(self):
+        self.commands = []
+
+    def run_command(self, script, cwd=None, env_name=None, on_output=None, timeout=None):
+        self.commands.append(script)
+        return super().run_command(script, cwd=cwd, env_name=env_name, on_output=on_output, timeout=timeout)
+
+
+def make_cache(tmp_path, shell):
+    return ExecutionCache(str(tmp_path / "exec.sqlite3"), run_command=shell.run_command, min_runtime_s=5)
+
+
+def test_script_without_paths_costs_no_remote_call(tmp_path):
+    shell = CountingShell()
+    cache = make_cache(tmp_path, shell)
+
+    assert cache.lookup("echo done", "base") == (None, None)
+    assert shell.commands == []
+
+
+def test_min_runtime_counts_the_run_not_the_queue(tmp_path, monkeypatch):
+    # pytest's tmp_path lives under /tmp, which is never fingerprinted on the node
+    monkeypatch.setattr(exec_cache, "IGNORED_PREFIXES", ("/dev/", "/proc/"))
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    script = f"wc -l {reads}"
+    cache = make_cache(tmp_path, CountingShell())
+    result = {"stdout": "4", "stderr": "", "return_code": 0}
+
+    # Long wait for cores, quick run: not worth caching
+    _, token = cache.lookup(script, "base")
+    token["started"] -= 60
+    cache.store(token, result, runtime_s=0.5)
+    assert cache.stats()["stores"] == 0
+
+    _, token = cache.lookup(script, "base")
+    cache.store(token, result, runtime_s=30)
+    cached, _ = cache.lookup(script, "base")
+    assert cached["stdout"] == "4" and cached["cached"]
+
+
+def test_script_writing_into_its_input_directory_is_a_hit(tmp_path, monkeypatch):
+    monkeypatch.setattr(exec_cache, "IGNORED_PREFIXES", ("/dev/", "/proc/"))
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "reads.fastq").write_text("@r1\nACGT\n+\nIIII\n")
+    script = "ls work/*.fastq > work/listing.txt"
+    cache = make_cache(tmp_path, CountingShell())
+    result = {"stdout": "", "stderr": "", "return_code": 0}
+
+    _, token = cache.lookup(script, "base", cwd=str(tmp_path))
+    LocalShell().run_command(script, cwd=str(tmp_path))
+    # Make the directory's mtime move even on filesystems with coarse timestamps
+    os.utime(workdir, (time.time() + 5, time.time() + 5))
+    cache.store(token, result, runtime_s=30)
+
+    cached, _ = cache.lookup(script, "base", cwd=str(tmp_path))
+    assert cached is not None and cached["cached"]
+
+
+def test_paths_from_shell_variables_are_not_cached(tmp_path):
+    shell = CountingShell()
+    cache = make_cache(tmp_path, shell)
+
+    for script in ("qiime tools export --input-path /data/table.qza --output-path $OUT/exported",
+                   'cat /data/reads.fastq > "${WORK}"/copy.fastq'):
+        assert cache.lookup(script, "base") == (None, None)
+    assert shell.commands == []
+
+
+def test_invalidate_path_spares_siblings_with_the_same_prefix(tmp_path):
+    cache = make_cache(tmp_path, CountingShell())
+    for name in ("run1", "run10", "run_1"):
+        cache._db.execute(
+            "INSERT INTO exec_cache (key, inputs, outputs, result, size, duration, created_at, last_access)"
+            " VALUES (?, ?, '{}', '{}', 2, 10, 0, 0)",
+            (name, json.dumps({f"/data/{name}/reads.fastq": "sha256:0"}))
+        )
+    cache._db.execute(
+        "INSERT INTO exec_cache (key, inputs, outputs, result, size, duration, created_at, last_access)"
+        " VALUES ('dir', ?, '{}', '{}', 2, 10, 0, 0)", (json.dumps({"/data/run1": "mtime:0"}),)
+    )
+
+    assert cache.invalidate(path="/data/run1/") == 2
+    assert cache.invalidate(path="/data/run%") == 0
+    assert cache.stats()["entries"] == 2
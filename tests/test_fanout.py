@@ -0,0 +1,28 @@
+"""
+The per-sample branch limit follows config overrides set after import.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+pytest.importorskip("langchain_core")
+pytest.importorskip("langgraph")
+from backend.agents import fanout
+from backend.config import set_config_overrides
+
+
+def test_branch_limit_follows_overrides():
+    set_config_overrides({"workflow": {"max_parallel_samples": 2}})
+    try:
+        slots = fanout.branch_slots()
+        assert fanout.max_parallel_samples() == 2
+        assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+        assert not slots.acquire(blocking=False)
+        slots.release()
+        slots.release()
+    finally:
+        set_config_overrides(None)
+    assert fanout.max_parallel_samples() == 4
@@ -0,0 +1,67 @@
+"""
+Inventory refreshes (local directories stand in for the node).
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.utils.inventory import RemoteInventory
+from backend.utils.remote_jobs import LocalShell
+
+
+def test_refresh_sees_files_rewritten_in_place(tmp_path):
+    reads = tmp_path / "JC1_R1.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    service = RemoteInventory(run_command=LocalShell().run_command, ttl_seconds=0)
+    first = service.scan(str(tmp_path))
+
+    # Appending keeps the directory mtime; only the file's own size and mtime move
+    dir_mtime = os.stat(tmp_path).st_mtime
+    with open(reads, "a") as f:
+        f.write("@r2\nACGT\n+\nIIII\n")
+    os.utime(tmp_path, (dir_mtime, dir_mtime))
+    second = service.scan(str(tmp_path))
+
+    assert second.files[str(reads)].size == reads.stat().st_size
+    # The cached inventory handed out earlier is never modified
+    assert first.files[str(reads)].size == len("@r1\nACGT\n+\nIIII\n")
+    assert service.stats()["refreshes"] == 1
+    assert service.stats()["relisted_dirs"] == 0
+
+
+def test_scan_within_ttl_makes_no_remote_call(tmp_path):
+    calls = []
+
+    def run_command(*args, **kwargs):
+        calls.append(args)
+        return LocalShell().run_command(*args, **kwargs)
+
+    service = RemoteInventory(run_command=run_command, ttl_seconds=60)
+    assert service.scan(str(tmp_path)) is service.scan(str(tmp_path))
+    assert len(calls) == 1
+
+
+def test_refresh_relists_only_changed_directories(tmp_path):
+    for run in ("run1", "run2"):
+        (tmp_path / run).mkdir()
+        for read in ("R1", "R2"):
+            (tmp_path / run / f"JC1_{read}.fastq").write_text("@r1\nACGT\n+\nIIII\n")
+    service = RemoteInventory(run_command=LocalShell().run_command, ttl_seconds=0)
+    first = service.scan(str(tmp_path))
+    assert sorted(first.samples()) == ["run1/JC1", "run2/JC1"]
+
+    # A file moved in keeps its old mtime; only its directory's mtime tells
+    old = tmp_path / "JC2_R1.fastq"
+    old.write_text("@r1\nACGT\n+\nIIII\n")
+    os.utime(old, (0, 0))
+    os.replace(old, tmp_path / "run2" / "JC2_R1.fastq")
+    os.remove(tmp_path / "run2" / "JC1_R2.fastq")
+    os.utime(tmp_path / "run2", (time.time() + 5, time.time() + 5))
+    second = service.scan(str(tmp_path))
+
+    assert sorted(second.samples()) == ["JC2", "run1/JC1", "run2/JC1"]
+    assert second.samples()["run2/JC1"] == {"raw_r1": str(tmp_path / "run2" / "JC1_R1.fastq")}
+    assert service.stats()["relisted_dirs"] == 2  # run2 and the root (run moved out of it)
@@ -0,0 +1,41 @@
+"""
+Recording and invalidating LLM cache entries.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+pytest.importorskip("langchain_core")
+from langchain_core.outputs import Generation
+from backend.utils import llm_cache
+from backend.utils.llm_cache import SQLiteLLMCache, bypass_llm_cache, invalidate_llm_cache, record_llm_cache_keys
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SQLiteLLMCache(str(tmp_path / "llm.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_llm_cache", cache)
+    return cache
+
+
+def test_failed_completion_is_not_replayed(cache):
+    with record_llm_cache_keys() as keys:
+        assert cache.lookup("clean prompt", "model") is None
+        cache.update("clean prompt", "model", [Generation(text="bad code")])
+    assert len(keys) == 1
+
+    invalidate_llm_cache(keys)
+
+    assert cache.lookup("clean prompt", "model") is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_bypassed_calls_record_nothing(cache):
+    with bypass_llm_cache(), record_llm_cache_keys() as keys:
+        cache.lookup("retry prompt", "model")
+        cache.update("retry prompt", "model", [Generation(text="fixed code")])
+    assert keys == []
+    assert cache.stats()["entries"] == 0
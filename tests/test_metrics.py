@@ -0,0 +1,71 @@
+"""
+What the executor metrics record, and how they are exported.
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.config import set_config_overrides
+from backend.utils import metrics, remote_jobs
+from backend.utils.metrics import MetricsRegistry, metrics_settings, tracking, untracked
+from backend.utils.remote_jobs import DetachedJobRunner, LocalShell
+
+
+def test_detached_job_is_one_record(tmp_path, monkeypatch):
+    registry = MetricsRegistry(history_file=str(tmp_path / "commands.jsonl"), export_interval=3600)
+    monkeypatch.setattr(remote_jobs, "get_metrics", lambda: registry)
+    runner = DetachedJobRunner(LocalShell(), root=str(tmp_path / "jobs"), poll_interval=0.2, min_poll_interval=0.05)
+
+    result = runner.run("echo hello; sleep 0.5", env_name="obi3", cwd=str(tmp_path))
+
+    assert result["return_code"] == 0
+    records = [json.loads(line) for line in (tmp_path / "commands.jsonl").read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["mode"] == "job"
+    assert records[0]["env"] == "obi3"
+    assert records[0]["stdout_bytes"] == len("hello\n")
+    assert records[0]["run_s"] >= 0.5
+
+
+def test_untracked_is_per_thread_and_nests():
+    seen = []
+    with untracked():
+        with untracked():
+            assert not tracking()
+        assert not tracking()
+        worker = threading.Thread(target=lambda: seen.append(tracking()))
+        worker.start()
+        worker.join()
+    assert tracking()
+    assert seen == [True]
+
+
+def test_settings_cached_until_overrides_change():
+    try:
+        first = metrics_settings()
+        assert metrics_settings() is first
+        set_config_overrides({"executor": {"metrics": {"enabled": False}}})
+        assert metrics_settings()["enabled"] is False
+        assert metrics.get_metrics() is None
+    finally:
+        set_config_overrides(None)
+    assert metrics_settings()["enabled"] == first["enabled"]
+
+
+def test_concurrent_exports_leave_complete_files(tmp_path):
+    registry = MetricsRegistry(prometheus_file=str(tmp_path / "m.prom"), json_file=str(tmp_path / "m.json"))
+    for i in range(200):
+        registry.inc("labbio_test_total", {"n": i})
+
+    threads = [threading.Thread(target=registry.export) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert json.loads((tmp_path / "m.json").read_text())["metrics"]["labbio_test_total"]
+    assert (tmp_path / "m.prom").read_text().endswith("\n")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["m.json", "m.prom"]
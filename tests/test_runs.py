@@ -0,0 +1,102 @@
+"""
+Resuming checkpointed runs (runs.prepare_resume).
+"""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.agents.runs import prepare_resume, run_status
+
+
+class FakeApp:
+    """The get_state/update_state part of a compiled graph"""
+
+    def __init__(self, values, next_nodes=()):
+        self.values = dict(values)
+        self.next = tuple(next_nodes)
+        self.updates = []
+
+    def get_state(self, config):
+        return types.SimpleNamespace(values=self.values, next=self.next)
+
+    def update_state(self, config, values, as_node=None):
+        self.updates.append((values, as_node))
+        self.values.update(values)
+
+
+@pytest.fixture(autouse=True)
+def fake_supervisor(monkeypatch):
+    # choose_agent is all prepare_resume needs from the supervisor (which pulls in the LLM stack)
+    module = types.ModuleType("backend.agents.supervisor")
+    module.choose_agent = lambda step: "qiime" if "qiime" in step.lower() else "obitools"
+    monkeypatch.setitem(sys.modules, "backend.agents.supervisor", module)
+
+
+def test_resume_clears_node_error():
+    app = FakeApp({
+        "plan": ["1. Denoise with qiime dada2"],
+        "current_step": "1. Denoise with qiime dada2",
+        "error": "No code generated.",
+    })
+    assert run_status(app.values) == "failed"
+
+    prepare_resume(app, "run-test")
+
+    values, as_node = app.updates[-1]
+    assert as_node == "supervisor"
+    assert values["error"] is None
+    assert values["next_agent"] == "qiime"
+    assert run_status(app.values) == "interrupted"
+
+
+def test_resume_clears_retry_failure():
+    app = FakeApp({
+        "plan": ["1. Merge reads with obi alignpairedend"],
+        "current_step": "1. Merge reads with obi alignpairedend",
+        "final_answer": "Task Failed after 3 retries. Last Error: boom",
+        "errors": ["boom"],
+        "retry_count": 3,
+    })
+
+    prepare_resume(app, "run-test")
+
+    assert app.values["final_answer"] is None
+    assert app.values["errors"] == []
+    assert app.values["retry_count"] == 0
+
+
+def test_resume_failed_per_sample_step_reruns_only_failed_samples():
+    step = "2. [per-sample] Merge reads with obi alignpairedend"
+    app = FakeApp({
+        "plan": ["1. Create workspace", step],
+        "current_step": step,
+        "final_answer": "Task Failed after 3 retries. Last Error: JC2: boom",
+        "errors": ["JC2: boom"],
+        "retry_count": 3,
+        "sample_results": [{"sample": "JC2", "step": step, "return_code": 1, "stderr": "boom"}],
+        "failed_samples": {"JC2": "boom"},
+    })
+
+    prepare_resume(app, "run-test")
+
+    values, _ = app.updates[-1]
+    # None resets the merged branch results, so JC2's old failure is not reduced again
+    assert values["sample_results"] is None
+    assert "failed_samples" not in values
+    assert app.values["failed_samples"] == {"JC2": "boom"}
+
+
+def test_interrupted_run_continues_without_update():
+    app = FakeApp({"plan": ["1. x"], "current_step": "1. x"}, next_nodes=("executor",))
+    prepare_resume(app, "run-test")
+    assert app.updates == []
+
+
+def test_completed_run_is_not_resumed():
+    app = FakeApp({"plan": ["1. x"], "current_step": "1. x", "final_answer": "All steps completed successfully."})
+    with pytest.raises(ValueError):
+        prepare_resume(app, "run-test")
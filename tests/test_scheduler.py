@@ -0,0 +1,101 @@
+"""
+Thread rewriting, probing and load accounting of the resource scheduler.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.config import set_config_overrides
+from backend.utils.scheduler import DEFAULT_SCHEDULER_SETTINGS, ResourceScheduler
+
+DADA2 = "qiime dada2 denoise-paired --i-demultiplexed-seqs demux.qza --p-n-threads 0 --o-table table.qza"
+
+
+@pytest.fixture(autouse=True)
+def no_metrics():
+    set_config_overrides({"executor": {"metrics": {"enabled": False}}})
+    yield
+    set_config_overrides(None)
+
+
+def make_scheduler(probe, **kwargs):
+    return ResourceScheduler(cores=18, memory_gb=256, profiles=DEFAULT_SCHEDULER_SETTINGS['profiles'],
+                             wait_interval=0.05, probe=probe, **kwargs)
+
+
+def test_unprofiled_script_keeps_its_thread_flags():
+    scheduler = make_scheduler(lambda: {"load": 0.0, "mem_available_gb": 240})
+    script = "qiime phylogeny align-to-tree-mafft-fasttree --i-sequences rep-seqs.qza --p-n-threads 8"
+
+    with scheduler.acquire(script) as allocation:
+        assert allocation.apply(script) == script
+        assert allocation.threads == 8
+    with scheduler.acquire("ls -la") as allocation:
+        assert allocation.apply("ls -la") == "ls -la"
+        assert allocation.threads == 1
+
+
+def test_profiled_script_is_rewritten():
+    scheduler = make_scheduler(lambda: {"load": 0.0, "mem_available_gb": 240})
+
+    with scheduler.acquire(DADA2) as allocation:
+        applied = allocation.apply(DADA2)
+    assert "--p-n-threads 12" in applied
+    assert applied.startswith("export OMP_NUM_THREADS=12")
+
+
+def test_probe_runs_outside_the_condition():
+    holder = {}
+    locked_out = []
+
+    def probe():
+        # Another thread must be able to take the condition while the probe runs
+        grabbed = threading.Event()
+
+        def grab():
+            with holder["scheduler"]._cond:
+                grabbed.set()
+
+        threading.Thread(target=grab).start()
+        locked_out.append(not grabbed.wait(1))
+        return {"load": 0.0, "mem_available_gb": 240}
+
+    holder["scheduler"] = make_scheduler(probe)
+    holder["scheduler"].acquire(DADA2).release()
+    assert locked_out == [False]
+
+
+def test_released_threads_are_not_counted_as_external_load():
+    reading = {"load": 0.0, "mem_available_gb": 240}
+    scheduler = make_scheduler(lambda: dict(reading), probe_ttl=0)
+
+    allocation = scheduler.acquire(DADA2)
+    # The node keeps reporting the finished job's load, as the 1-minute average does
+    reading["load"] = 12.0
+    allocation.release()
+    with scheduler.acquire(DADA2) as allocation:
+        assert allocation.threads == 12
+        assert allocation.waited_s < 1
+
+
+def test_unprofiled_script_waits_for_the_threads_it_asks_for():
+    scheduler = make_scheduler(lambda: {"load": 0.0, "mem_available_gb": 240})
+    dada2 = scheduler.acquire(DADA2)  # 12 of the 17 usable cores
+    script = "vsearch --cluster_size seqs.fasta --threads 8 --centroids otus.fasta"
+    admitted = []
+
+    waiter = threading.Thread(target=lambda: admitted.append(scheduler.acquire(script)))
+    waiter.start()
+    time.sleep(0.2)
+    assert admitted == []
+    assert scheduler.snapshot()["queued"] == 1
+
+    dada2.release()
+    waiter.join(2)
+    assert admitted and admitted[0].threads == 8
+    admitted[0].release()
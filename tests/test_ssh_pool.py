@@ -0,0 +1,110 @@
+"""
+Opening transports in the SSH pool (no network: _open_transport is replaced).
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from backend.config import set_config_overrides
+from backend.utils.ssh_pool import PooledTransport, SSHConnectionPool
+
+
+@pytest.fixture(autouse=True)
+def no_metrics():
+    set_config_overrides({"executor": {"metrics": {"enabled": False}}})
+    yield
+    set_config_overrides(None)
+
+
+class FakeChannel:
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def is_active(self):
+        return True
+
+    def is_authenticated(self):
+        return True
+
+    def open_session(self, timeout=None):
+        return FakeChannel()
+
+    def close(self):
+        pass
+
+
+def make_pool(pool_size=2, max_channels=1, connect_s=0.0):
+    pool = SSHConnectionPool("node", 22, "user", "secret", pool_size=pool_size,
+                             max_channels_per_transport=max_channels)
+    opened = []
+
+    def open_transport():
+        time.sleep(connect_s)
+        opened.append(1)
+        return PooledTransport(FakeTransport())
+
+    pool._open_transport = open_transport
+    return pool, opened
+
+
+def test_slow_connect_does_not_block_live_transports():
+    pool, _ = make_pool(pool_size=2, max_channels=1, connect_s=0.5)
+    first = pool._acquire()
+    pool._release(first)
+
+    # Occupy the live transport, then let a second thread start a slow connect
+    busy = pool._acquire()
+    connecting = threading.Thread(target=pool._acquire)
+    connecting.start()
+    time.sleep(0.1)
+    pool._release(busy)
+
+    start = time.monotonic()
+    pooled = pool._acquire()
+    assert pooled is busy
+    assert time.monotonic() - start < 0.2
+    connecting.join()
+
+
+def test_concurrent_opens_respect_pool_size():
+    pool, opened = make_pool(pool_size=2, max_channels=1, connect_s=0.2)
+    threads = [threading.Thread(target=pool._acquire) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(opened) == 2
+    assert pool.stats() == {"transports": 2, "active_channels": 6}
+
+
+def test_channel_refused_on_live_transport_keeps_it():
+    pool, _ = make_pool(pool_size=2, max_channels=4)
+
+    class FullTransport(FakeTransport):
+        """Live transport at its per-connection channel limit"""
+
+        def __init__(self):
+            self.closed = False
+
+        def open_session(self, timeout=None):
+            raise RuntimeError("administratively prohibited: open failed")
+
+        def close(self):
+            self.closed = True
+
+    full = FullTransport()
+    pool._transports.append(PooledTransport(full))
+
+    # The retry goes to a new transport; the full one stays open for its other channels
+    channel, pooled = pool.open_channel()
+    assert isinstance(channel, FakeChannel) and pooled.transport is not full
+    assert not full.closed
+    assert pool.stats() == {"transports": 2, "active_channels": 1}
@@ -0,0 +1,35 @@
+"""
+Prefetched RAG context is keyed by worker, so a step never gets the other tool's protocols.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+pytest.importorskip("langchain_core")
+pytest.importorskip("langgraph")
+from backend.agents import supervisor
+
+
+class FakeRetriever:
+    def __init__(self):
+        self.calls = []
+
+    def retrieve_many(self, queries, k=3, tool=None):
+        self.calls.append((tool, list(queries)))
+        return [[f"{tool}: {query}"] for query in queries]
+
+
+def test_prefetch_is_keyed_by_worker(monkeypatch):
+    retriever = FakeRetriever()
+    monkeypatch.setattr(supervisor, "get_retriever", lambda: retriever)
+    plan = ["1. Create workspace", "2. Merge reads", "3. Denoise with dada2"]
+
+    # The planner assigned the first step to qiime; choose_agent would say obitools
+    context = supervisor.prefetch_step_context(plan, assigned={plan[0]: "qiime"})
+
+    assert set(context["qiime"]) == {plan[0], plan[2]}
+    assert set(context["obitools"]) == {plan[1]}
+    assert context["qiime"][plan[0]] == [f"{supervisor.WORKER_RAG['qiime'][0]}: {plan[0]}"]
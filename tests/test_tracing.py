@@ -0,0 +1,44 @@
+"""
+In-memory lifetime of run traces.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+pytest.importorskip("langchain_core")
+from backend.config import set_config_overrides
+from backend.utils import tracing
+from backend.utils.tracing import end_trace, get_trace, load_trace
+
+
+@pytest.fixture(autouse=True)
+def trace_dir(tmp_path):
+    set_config_overrides({"workflow": {"tracing": {"enabled": True, "dir": str(tmp_path)}}})
+    yield tmp_path
+    set_config_overrides(None)
+
+
+def test_end_trace_frees_memory_and_keeps_the_file():
+    trace = get_trace("run-1")
+    trace.add("supervisor", "node", 0.0, 1.0)
+
+    ended = end_trace("run-1")
+
+    assert ended is trace and len(ended.spans) == 1
+    assert "run-1" not in tracing._traces
+    assert [s["name"] for s in load_trace("run-1")] == ["supervisor"]
+
+
+def test_live_traces_are_bounded(monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_LIVE_TRACES", 3)
+    for n in range(5):
+        get_trace(f"run-{n}")
+    get_trace("run-2")  # Recently used runs stay
+    get_trace("run-5")
+
+    assert list(tracing._traces) == ["run-4", "run-2", "run-5"]
+    for run_id in list(tracing._traces):
+        end_trace(run_id)